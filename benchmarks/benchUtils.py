@@ -0,0 +1,126 @@
+'''Helpers shared by the benchmarks
+
+The benchmarks never touch the network. Pages are the ones recorded within
+``tests/data`` (optionally enlarged), and are served by a local HTTP server
+when an entry point downloads them. ``noNetwork()`` makes sure of that by
+refusing every connection that is not to the local machine.
+'''
+
+import os
+import re
+import sys
+import time
+import socket
+import threading
+import contextlib
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+testsFolder = os.path.join(os.path.dirname(__file__), '..', 'tests')
+dataFolder  = os.path.join(testsFolder, 'data')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, testsFolder)
+
+from conftest import routes
+
+def enlarge(name, repeats):
+    '''repeat the body rows of every table within a recorded page'''
+
+    with open(os.path.join(dataFolder, name)) as f:
+        html_data = f.read()
+
+    def repeatRows(match):
+        rows = re.findall(r'<tr.*?</tr>', match.group(2), flags=re.S)
+        head, body = (rows[:1], rows[1:]) if '<th' in rows[0] else ([], rows)
+        return match.group(1) + '\n'.join(head + body*repeats) + match.group(3)
+
+    return re.sub(r'(<tbody>)(.*?)(</tbody>)', repeatRows, html_data, flags=re.S)
+
+def measure(function, *args):
+    '''run a function once, and return its result, the time taken and the peak Python memory allocated'''
+
+    tracemalloc.start()
+    start   = time.perf_counter()
+    result  = function(*args)
+    elapsed = time.perf_counter() - start
+    peak    = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return result, elapsed, peak
+
+def bestTime(function, repeat=5, minTime=0.2):
+    '''the shortest time taken by a function over ``repeat`` runs (and at least ``minTime`` seconds)'''
+
+    times = []
+    total = 0
+    while (len(times) < repeat) or (total < minTime and len(times) < 100 * repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+        total += times[-1]
+
+    return min(times)
+
+@contextlib.contextmanager
+def noNetwork():
+    '''refuse every connection to anything other than the local machine'''
+
+    connect = socket.socket.connect
+
+    def localConnect(self, address):
+        if isinstance(address, tuple) and address[0] not in ('127.0.0.1', 'localhost', '::1'):
+            raise ConnectionRefusedError(f'benchmarks must not use the network ({address[0]})')
+        return connect(self, address)
+
+    socket.socket.connect = localConnect
+    try:
+        yield
+    finally:
+        socket.socket.connect = connect
+
+class PageHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        for suffix, name in routes:
+            if path.endswith(suffix) and name in self.server.pages:
+                body = self.server.pages[name]
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+        self.send_response(404)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+@contextlib.contextmanager
+def recordedServer(pages):
+    '''a local HTTP server for pages
+
+    Parameters
+    ----------
+    pages : dict
+        Maps the name of a recorded page (see ``routes`` in ``tests/conftest.py``)
+        to the bytes to serve in its place.
+
+    Yields
+    ------
+    str
+        The base URL of the server
+    '''
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    server.pages = pages
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,58 @@
+'''Micro-benchmark of the conversion of Marketwatch numbers
+
+Compares converting every cell with ``convertNumberMW()`` against converting
+the whole table at once with ``convertNumbersMW()``, for tables of growing
+size, and checks that both give the same numbers.
+
+Run from the root of the repository:
+
+    python benchmarks/bench_convertNumberMW.py
+'''
+
+import os
+import sys
+import time
+import random
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from financeMacroFactors.companies import marketWarchData as mw
+
+def randomCells(n, seed=0):
+    '''strings in the style of the Marketwatch financials pages'''
+
+    rng   = random.Random(seed)
+    cells = []
+    for _ in range(n):
+        cell = f'{rng.uniform(0, 1e4):,.{rng.randint(0, 3)}f}' + rng.choice(['', 'B', 'M', 'K', 'T', '%'])
+        if rng.random() < 0.2:
+            cell = f'({cell})'
+        if rng.random() < 0.05:
+            cell = '-'
+        cells.append(cell)
+
+    return cells
+
+def main():
+
+    print(f'{"cells":>9s} | {"per cell ms":>11s} {"Mcells/s":>8s} | {"bulk ms":>8s} {"Mcells/s":>8s} | {"speedup":>7s}')
+    for n in [1_000, 10_000, 100_000, 1_000_000]:
+        cells = randomCells(n)
+
+        start  = time.perf_counter()
+        scalar = [mw.convertNumberMW(c) for c in cells]
+        scalarTime = time.perf_counter() - start
+
+        start = time.perf_counter()
+        values, failed = mw.convertNumbersMW(cells)
+        bulkTime = time.perf_counter() - start
+
+        assert not failed.any()
+        assert np.array_equal(values, np.array(scalar, dtype=float))
+
+        print(f'{n:9d} | {scalarTime*1e3:11.1f} {n/scalarTime/1e6:8.2f} | '
+              f'{bulkTime*1e3:8.1f} {n/bulkTime/1e6:8.2f} | {scalarTime/bulkTime:6.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+'''Time taken to import the library
+
+Every statement is run in a fresh interpreter with ``-X importtime``, and
+the time that Python reports for the imports of the library (including all
+the modules that they import) is reported, along with the heavy dependencies
+that were loaded and the slowest modules. The modules that the interpreter
+imports at startup (such as ``site``) are left out. The best of a few runs
+is kept, since the first run also pays for reading the files from disk.
+
+Run from the root of the repository:
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --repeat 10 --top 10
+'''
+
+import os
+import sys
+import argparse
+import subprocess
+
+statements = [
+    'import financeMacroFactors',
+    'from financeMacroFactors import instrumentation',
+    'from financeMacroFactors.valuation import discountedFutureEarnings',
+    'from financeMacroFactors.valuation import discountedFutureEarningsBatch',
+    'from financeMacroFactors.companies import getSNP500CompanyList',
+    'from financeMacroFactors.companies import getTickersFundamentalDataMW',
+    'import financeMacroFactors.pipeline',
+]
+
+heavy = ['requests', 'lxml', 'numpy', 'scipy', 'aiohttp']
+
+def importTimes(statement):
+    '''the cumulative import time in seconds of every module imported by ``statement``'''
+
+    check = f'{statement}; import sys; print(",".join(m for m in {heavy!r} if m in sys.modules))'
+    root  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env   = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    run   = subprocess.run([sys.executable, '-X', 'importtime', '-c', check],
+                capture_output=True, text=True, env=env, check=True)
+
+    # Lines look like "import time:   self [us] | cumulative | name", with the
+    # nesting of the imports shown by the indentation of the name
+    times = {}
+    for line in run.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.rstrip()
+        times[name.strip()] = (int(cumulative)/1e6, len(name) - len(name.lstrip()))
+
+    return times, run.stdout.strip()
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Time taken to import the library')
+    parser.add_argument('--repeat', type=int, default=5, help='the number of runs of every statement')
+    parser.add_argument('--top', type=int, default=3, help='the number of slowest modules shown')
+    args = parser.parse_args()
+
+    startup = set(importTimes('pass')[0])
+
+    print(f'{"statement":<72s} | {"ms":>8s} | loaded')
+    for statement in statements:
+        best = None
+        for _ in range(args.repeat):
+            times, loaded = importTimes(statement)
+            times = {name: v for name, v in times.items() if name not in startup}
+            # The top level imports of the statement are the least indented ones
+            depth = min(d for _, d in times.values())
+            total = sum(t for t, d in times.values() if d == depth)
+            if (best is None) or (total < best[0]):
+                best = (total, times, loaded)
+
+        total, times, loaded = best
+        depth = min(d for _, d in times.values())
+        print(f'{statement:<72s} | {total*1e3:8.1f} | {loaded or "-"}')
+
+        slowest = sorted(((t, name) for name, (t, d) in times.items() if d == depth), reverse=True)
+        for t, name in slowest[:args.top]:
+            print(f'    {name:<68s} | {t*1e3:8.1f} |')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+'''Scaling of parsing with the number of processes
+
+A batch of recorded pages (enlarged to realistic sizes) is parsed within
+the calling process, and then by a ``ParserPool`` with a growing number of
+processes. The throughput in pages per second, and the speedup over parsing
+within the calling process, are reported for each. The results of the pool
+are checked to be the same as those of the plain parsers.
+
+The speedup can only grow with the number of processes up to the number of
+cores of the machine, which is printed first.
+
+Run from the root of the repository:
+
+    python benchmarks/bench_parsePool.py
+    python benchmarks/bench_parsePool.py --pages 2000 --processes 1 2 4 8 16 32
+'''
+
+import os
+import time
+import argparse
+
+from benchUtils import enlarge
+
+from financeMacroFactors.companies import marketWarchData as mw
+from financeMacroFactors.companies import yahooData
+from financeMacroFactors.companies.parsePool import ParserPool
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Scaling of parsing with the number of processes')
+    parser.add_argument('--pages', type=int, default=400, help='the number of pages to parse')
+    parser.add_argument('--processes', type=int, nargs='*', help='the pool sizes to try')
+    args = parser.parse_args()
+
+    cores     = os.cpu_count() or 1
+    processes = args.processes or sorted({1, 2, 4, 8, 16, 32, cores} & set(range(1, 2*cores + 1)))
+
+    # A mix of statements (with about as many rows as the real pages) and
+    # a year of daily prices
+    kinds = [
+        ('marketwatch', enlarge('mw_IncomeStatement.html', 2)),
+        ('marketwatch', enlarge('mw_BalanceSheetQuarter.html', 6)),
+        ('marketwatch', enlarge('mw_CashFlow.html', 4)),
+        ('yahoo',       enlarge('yahoo_history.html', 20)),
+    ]
+    pages = [(kind, page.encode('utf-8')) for kind, page in (kinds * args.pages)[:args.pages]]
+    plain = {
+        'marketwatch' : lambda page: mw.parseMWPage(page),
+        'yahoo'       : lambda page: yahooData.parseStockDataYahoo(page, True, mw.miniMonthMaps),
+    }
+
+    print(f'{cores} cores, {len(pages)} pages of {sum(len(p) for _, p in pages)/len(pages)/1e3:.0f} kB on average')
+    print(f'{"processes":>9s} | {"seconds":>8s} {"pages/s":>8s} | {"speedup":>7s}')
+
+    start    = time.perf_counter()
+    expected = [plain[kind](page) for kind, page in pages]
+    baseline = time.perf_counter() - start
+    print(f'{"none":>9s} | {baseline:8.2f} {len(pages)/baseline:8.1f} | {1:6.2f}x')
+
+    for n in processes:
+        with ParserPool(n) as pool:
+            # The workers are started before the clock does
+            pool.map('marketwatch', [b''] * (4*n))
+
+            start   = time.perf_counter()
+            futures = [pool.submit(kind, page) for kind, page in pages]
+            results = [future.result() for future in futures]
+            elapsed = time.perf_counter() - start
+
+        assert results == expected
+        print(f'{n:9d} | {elapsed:8.2f} {len(pages)/elapsed:8.1f} | {baseline/elapsed:6.2f}x')
+
+if __name__ == '__main__':
+    main()
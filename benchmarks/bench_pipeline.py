@@ -0,0 +1,76 @@
+'''Benchmark of the memory used by the valuation pipeline
+
+The whole pipeline of ``financeMacroFactors.pipeline`` (download, parse and
+value) is run on universes of synthetic tickers, and the time taken and the
+peak Python memory allocated (as measured by ``tracemalloc``) are reported for
+every size. The pages of every ticker are the ones recorded within
+``tests/data``, served by a local HTTP server, and the tickers are handed to
+the pipeline by a generator, as they would be for a universe read from a file.
+
+The results are counted and dropped as they are yielded, so that the peak
+only shows what the pipeline itself holds on to. It should not grow with the
+number of tickers, since the queues between the stages are bounded.
+
+Nothing is ever requested from the network: the response cache is disabled,
+the base URLs are pointed at the local server, and every other connection is
+refused.
+
+Run from the root of the repository:
+
+    python benchmarks/bench_pipeline.py                    # 500 and 5,000 tickers
+    python benchmarks/bench_pipeline.py --sizes 100 1000   # other sizes
+    python benchmarks/bench_pipeline.py --parseProcesses 4
+'''
+
+import os
+import argparse
+
+from benchUtils import routes, dataFolder, measure, noNetwork, recordedServer
+
+from financeMacroFactors import pipeline
+from financeMacroFactors.companies import responseCache
+from financeMacroFactors.companies import marketWarchData as mw
+from financeMacroFactors.companies import yahooData
+
+def syntheticTickers(n):
+    '''``n`` distinct tickers, generated one at a time'''
+    for i in range(n):
+        yield f'T{i:05d}'
+
+def consume(n, **kwargs):
+    '''run the pipeline, and return the number of tickers valued and the number that failed'''
+
+    done, failed = 0, 0
+    for record in pipeline.iterUniverse(syntheticTickers(n), **kwargs):
+        done   += 1
+        failed += record['error'] is not None
+    return done, failed
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Memory of the valuation pipeline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 5000], help='numbers of tickers')
+    parser.add_argument('--fetchWorkers', type=int, default=8)
+    parser.add_argument('--parseWorkers', type=int, default=2)
+    parser.add_argument('--parseProcesses', type=int, default=None)
+    args = parser.parse_args()
+
+    pages = {}
+    for _, name in routes:
+        with open(os.path.join(dataFolder, name), 'rb') as f:
+            pages[name] = f.read()
+
+    responseCache.disableCache()
+    with noNetwork(), recordedServer(pages) as baseURL:
+        mw.mwBaseURL           = baseURL
+        yahooData.yahooBaseURL = baseURL
+
+        print(f'{"tickers":>8} {"failed":>7} {"seconds":>9} {"tickers/s":>10} {"peak MB":>9}')
+        for n in args.sizes:
+            (done, failed), elapsed, peak = measure(lambda: consume(n, fetchWorkers=args.fetchWorkers,
+                                                                    parseWorkers=args.parseWorkers,
+                                                                    parseProcesses=args.parseProcesses))
+            print(f'{done:>8} {failed:>7} {elapsed:>9.2f} {done/elapsed:>10.1f} {peak/2**20:>9.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+'''Benchmark suite for the public entry points
+
+Every public entry point is run on inputs of growing size, and its
+throughput and peak Python memory are reported:
+
+- ``getDataFromMWURL``, ``getStockDataYahoo`` and ``getSNP500CompanyList``
+  download the pages recorded within ``tests/data``, enlarged by repeating
+  their table rows, from a local HTTP server
+- ``extractYearlyData`` and ``extractQuarterlyData`` extract every line item
+  of the recorded statements, over and over, and ``extractFields`` extracts
+  four line items of many companies at once
+- the four valuation methods value synthetic companies one at a time, and
+  their batch versions value all of them at once
+
+Nothing is ever requested from the network: the response cache is disabled,
+the base URLs are pointed at the local server, and every other connection is
+refused.
+
+Run from the root of the repository:
+
+    python benchmarks/bench_suite.py                  # everything
+    python benchmarks/bench_suite.py --quick          # the smallest sizes only
+    python benchmarks/bench_suite.py --only valuation # cases whose name contains 'valuation'
+    python benchmarks/bench_suite.py --json after.json --compare before.json
+
+With ``--compare``, the ratio of the time taken to that of an earlier run
+(saved with ``--json``) is shown for every case.
+'''
+
+import json
+import argparse
+import numpy as np
+
+from benchUtils import routes, enlarge, measure, bestTime, noNetwork, recordedServer
+
+from financeMacroFactors import companies
+from financeMacroFactors import valuation
+from financeMacroFactors.companies import marketWarchData as mw
+from financeMacroFactors.companies import yahooData
+from financeMacroFactors.companies import companyLists
+from financeMacroFactors.companies import responseCache
+
+def scraperCases(baseURL):
+    '''(name, page, repeats, function) for the entry points that download pages'''
+
+    url = baseURL + '/investing/stock/aapl/financials'
+
+    return [
+        ('getDataFromMWURL',     'mw_IncomeStatement.html', [1, 10, 100],
+            lambda: mw.getDataFromMWURL(url)),
+        ('getStockDataYahoo',    'yahoo_history.html',      [1, 20, 200],
+            lambda: companies.getStockDataYahoo('AAPL', frequency='1d')),
+        ('getSNP500CompanyList', 'wikipedia_snp500.html',   [1, 10, 63],
+            companies.getSNP500CompanyList),
+    ]
+
+def extractionCases(sizes):
+    '''(name, size, function) for the extraction of line items'''
+
+    cases = []
+    for name, page, extract in [
+            ('extractYearlyData',    'mw_IncomeStatement.html',        mw.extractYearlyData),
+            ('extractQuarterlyData', 'mw_IncomeStatementQuarter.html', mw.extractQuarterlyData)]:
+        info   = mw.parseMWPage(enlarge(page, 1))
+        labels = [row[0] for row in info[1:]]
+        for n in sizes:
+            calls = [labels[i % len(labels)] for i in range(n)]
+            cases.append((name, n, lambda info=info, calls=calls, extract=extract:
+                            [extract(info, label) for label in calls]))
+
+    # The size is the number of line items, four for every company
+    data   = {statement: mw.parseMWPage(enlarge(f'mw_{statement}.html', 1), convert=False)
+              for statement in ['IncomeStatement', 'CashFlow']}
+    fields = ['Sales/Revenue', 'EPS (Diluted)', 'Diluted Shares Outstanding', 'Free Cash Flow']
+    for n in sizes:
+        fundamentals = {f'T{i}': data for i in range(n // len(fields))}
+        cases.append(('extractFields', n, lambda fundamentals=fundamentals:
+                        companies.extractFields(fundamentals, fields)))
+
+    return cases
+
+def valuationCases(sizes, nYears=10, seed=0):
+    '''(name, size, function) for the valuation methods, one at a time and batched'''
+
+    rng = np.random.default_rng(seed)
+
+    cases = []
+    for n in sizes:
+        eps     = rng.normal(2, 1, (n, nYears))
+        fcf     = rng.normal(1e9, 3e8, (n, nYears))
+        shares  = rng.uniform(1e8, 1e9, (n, nYears))
+        revenue = rng.uniform(1e9, 1e10, (n, nYears))
+        price   = rng.uniform(5, 500, (n, nYears))
+
+        cases += [
+            ('discountedFutureEarnings', n, lambda eps=eps:
+                [valuation.discountedFutureEarnings(e) for e in eps]),
+            ('discountedCashFlow', n, lambda fcf=fcf, shares=shares:
+                [valuation.discountedCashFlow(f, s) for f, s in zip(fcf, shares)]),
+            ('priceToSalesRatio', n, lambda revenue=revenue, shares=shares, price=price:
+                [valuation.priceToSalesRatio(r, s, p) for r, s, p in zip(revenue, shares, price)]),
+            ('priceToEarningsRatio', n, lambda eps=eps, price=price:
+                [valuation.priceToEarningsRatio(e, p) for e, p in zip(eps, price)]),
+            ('discountedFutureEarningsBatch', n, lambda eps=eps:
+                valuation.discountedFutureEarningsBatch(eps)),
+            ('discountedCashFlowBatch', n, lambda fcf=fcf, shares=shares:
+                valuation.discountedCashFlowBatch(fcf, shares)),
+            ('priceToSalesRatioBatch', n, lambda revenue=revenue, shares=shares, price=price:
+                valuation.priceToSalesRatioBatch(revenue, shares, price)),
+            ('priceToEarningsRatioBatch', n, lambda eps=eps, price=price:
+                valuation.priceToEarningsRatioBatch(eps, price)),
+        ]
+
+        # A new year for every company, on top of the history already seen
+        pe = valuation.PriceToEarningsValuator(n)
+        for year in range(nYears):
+            pe.update(eps[:, year], price[:, year])
+        cases.append(('PriceToEarningsValuator', n, lambda pe=pe, eps=eps, price=price:
+            (pe.update(eps[:, -1], price[:, -1]), pe.values())))
+
+    return cases
+
+def run(name, size, function, repeat):
+    '''time a case and measure its peak memory (in a separate run, as tracing slows it down)'''
+
+    elapsed = bestTime(function, repeat=repeat)
+    _, _, peak = measure(function)
+
+    return {'name': name, 'size': size, 'seconds': elapsed, 'perSecond': size / elapsed, 'peakBytes': peak}
+
+def report(result, baseline):
+
+    line = (f'{result["name"]:30s} {result["size"]:8d} | {result["seconds"]*1e3:10.2f} '
+            f'{result["perSecond"]:12.0f} | {result["peakBytes"]/1e6:8.2f}')
+
+    previous = baseline.get((result['name'], result['size']))
+    if previous is not None:
+        line += f' | {result["seconds"]/previous["seconds"]:6.2f}x'
+
+    print(line, flush=True)
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the public entry points')
+    parser.add_argument('--quick', action='store_true', help='only run the smallest size of every case')
+    parser.add_argument('--only', default='', help='only run cases whose name contains this text')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timed runs of every case')
+    parser.add_argument('--json', help='save the results into this file')
+    parser.add_argument('--compare', help='compare against results saved earlier with --json')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {(r['name'], r['size']): r for r in json.load(f)}
+
+    pick    = (lambda sizes: sizes[:1]) if args.quick else (lambda sizes: sizes)
+    wanted  = lambda name: args.only.lower() in name.lower()
+    results = []
+
+    print(f'{"case":30s} {"size":>8s} | {"best ms":>10s} {"items/s":>12s} | {"peak MB":>8s}' +
+          (' | vs base' if baseline else ''))
+
+    responseCache.disableCache()
+    with noNetwork():
+
+        # The pages served are replaced as they are enlarged, and the size
+        # of a case is the number of rows that the entry point returns
+        pages = {name: b'' for _, name in routes}
+        with recordedServer(pages) as baseURL:
+            yahooData.yahooBaseURL = baseURL
+            companyLists.snp500URL = baseURL + '/wiki/List_of_S%26P_500_companies'
+
+            for name, page, repeats, function in scraperCases(baseURL):
+                if not wanted(name):
+                    continue
+                for r in pick(repeats):
+                    pages[page] = enlarge(page, r).encode('utf-8')
+                    size = len(function())
+                    results.append(run(name, size, function, args.repeat))
+                    report(results[-1], baseline)
+
+        for name, size, function in extractionCases(pick([100, 1_000, 10_000])) + \
+                                    valuationCases(pick([100, 1_000, 10_000])):
+            if not wanted(name):
+                continue
+            results.append(run(name, size, function, args.repeat))
+            report(results[-1], baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+
+if __name__ == '__main__':
+    main()
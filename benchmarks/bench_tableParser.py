@@ -0,0 +1,99 @@
+'''Benchmark of the streaming table parser against BeautifulSoup
+
+The pages recorded within ``tests/data`` are enlarged by repeating their
+table rows (to the size of ten years of daily Yahoo! prices and the full
+list of S&P 500 constituents), and are then parsed both with the
+BeautifulSoup based code that the downloaders used previously, and with
+the streaming parser that they use now. The results of the two are
+checked to be identical. The time taken and the peak Python memory
+allocated by each are reported.
+
+Run from the root of the repository:
+
+    python benchmarks/bench_tableParser.py
+
+This requires ``beautifulsoup4``, which is not otherwise needed.
+'''
+
+from datetime import datetime as dt
+
+from bs4 import BeautifulSoup
+
+from benchUtils import enlarge, measure
+
+from financeMacroFactors.companies import marketWarchData as mw
+from financeMacroFactors.companies import yahooData
+from financeMacroFactors.companies import companyLists
+
+miniMonthMaps = {m: i+1 for i, m in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])}
+
+def legacyMW(html_data, convert=True):
+
+    page_content = BeautifulSoup(html_data, 'lxml')
+    allData = []
+    for tNo, table in enumerate(page_content.find_all('table')):
+        for i, row in enumerate(table.find_all('tr')):
+            if (i == 0) and (tNo == 0):
+                header = [d.get_text().strip() for d in row.find_all('th')][:-1]
+                allData.append(header)
+            data = [d.get_text().strip() for d in row.find_all('td')][:-1]
+            if len(data) == 0:
+                continue
+            if data[0].endswith('Growth') or data[0].endswith('Margin'):
+                continue
+            if convert:
+                data = data[:1] + [mw.convertNumberMW(d) for d in data[1:]]
+            allData.append(data)
+    return allData
+
+def legacyYahoo(html_data, convert=True):
+
+    page_content = BeautifulSoup(html_data, 'lxml')
+    allData = []
+    for tNo, table in enumerate(page_content.find_all('table')):
+        for i, row in enumerate(table.find_all('tr')):
+            if (i == 0) and (tNo == 0):
+                header = [d.get_text().strip() for d in row.find_all('th')]
+                allData.append(header)
+            data = [d.get_text() for d in row.find_all('td')]
+            if len(data) < len(header):
+                continue
+            if '-' in data:
+                continue
+            if convert:
+                d, m, y = data[0].split()
+                data[0] = dt(int(y), miniMonthMaps[m], int(d))
+            data = data[:1] + [float(d.replace(',','')) for d in data[1:]]
+            allData.append(data)
+    return allData
+
+def legacySNP500(website):
+
+    soup = BeautifulSoup(website, features="html.parser")
+    rows = soup.find('table', {'id':'constituents'}).find_all('tr')
+    header = [h.getText().strip() for h in rows[0].find_all('th')]
+    return [{h:v.getText().strip() for h, v in zip(header, values.find_all('td'))} for values in rows[1:]]
+
+def main():
+
+    pages = [
+        ('MarketWatch income statement', enlarge('mw_IncomeStatement.html', 20),
+            legacyMW, mw.parseMWPage),
+        ('Yahoo! daily history (10 years)', enlarge('yahoo_history.html', 210),
+            legacyYahoo, lambda h: yahooData.parseStockDataYahoo(h, True, miniMonthMaps)),
+        ('Wikipedia S&P 500 constituents', enlarge('wikipedia_snp500.html', 63),
+            legacySNP500, companyLists.parseSNP500CompanyList),
+    ]
+
+    print(f'{"page":35s} {"size":>8s} {"rows":>6s} | {"bs4 ms":>8s} {"bs4 MB":>7s} | {"stream ms":>9s} {"stream MB":>9s}')
+    for name, html_data, legacy, streaming in pages:
+        old, oldTime, oldPeak = measure(legacy, html_data)
+        new, newTime, newPeak = measure(streaming, html_data)
+        assert old == new, f'results differ for {name}'
+
+        print(f'{name:35s} {len(html_data)/1e6:6.2f}MB {len(new):6d} | '
+              f'{oldTime*1e3:8.1f} {oldPeak/1e6:7.2f} | {newTime*1e3:9.1f} {newPeak/1e6:9.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -18,8 +18,14 @@ Currently the following items are supported:
     2.2. The P/E Valuation method
     2.3. The DFE Valuation method
     2.4. The DCF Valuation method
+3. Timing and counting the stages of the above (``financeMacroFactors.instrumentation``)
+4. Valuing a whole universe of companies as a streaming job (``financeMacroFactors.pipeline``)
 '''
 
 from financeMacroFactors.financeMacroFactors import sayHello
-from financeMacroFactors import companies
-from financeMacroFactors import valuation
+from financeMacroFactors.lazyImports import lazyAttributes
+
+# The subpackages are only imported when they are first used, so that
+# importing this package is quick
+__getattr__, __dir__ = lazyAttributes(__name__, {},
+    submodules=['companies', 'valuation', 'instrumentation', 'pipeline'])
@@ -8,11 +8,60 @@ open sources.
 
 '''
 
-from financeMacroFactors.companies.companyLists import getSNP500CompanyList
+from financeMacroFactors.lazyImports import lazyAttributes
 
-from financeMacroFactors.companies.marketWarchData import getTickerFundamentalDataMW
-from financeMacroFactors.companies.marketWarchData import extractYearlyData
-from financeMacroFactors.companies.marketWarchData import extractQuarterlyData
+# The modules are only imported when something within them is first used
+__getattr__, __dir__ = lazyAttributes(__name__, {
+    'getSNP500CompanyList'             : 'companyLists',
 
+    'getTickerFundamentalDataMW'       : 'marketWarchData',
+    'getTickersFundamentalDataMW'      : 'marketWarchData',
+    'extractYearlyData'                : 'marketWarchData',
+    'extractQuarterlyData'             : 'marketWarchData',
 
-from financeMacroFactors.companies.yahooData import getStockDataYahoo
+    'getStockDataYahoo'                : 'yahooData',
+
+    'FetchError'                       : 'scheduler',
+    'FetchResult'                      : 'scheduler',
+
+    'PriceStore'                       : 'priceStore',
+
+    'PriceArchive'                     : 'priceArchive',
+    'writePriceArchive'                : 'priceArchive',
+
+    'FundamentalFrame'                 : 'fundamentalFrame',
+    'toFundamentalFrames'              : 'fundamentalFrame',
+    'extractFields'                    : 'fundamentalFrame',
+
+    'ScreeningIndex'                   : 'screeningIndex',
+
+    'FundamentalStore'                 : 'fundamentalStore',
+
+    'PageArchive'                      : 'pageArchive',
+
+    'alignAsOf'                        : 'dateAlignment',
+    'alignTickers'                     : 'dateAlignment',
+    'alignPrices'                      : 'dateAlignment',
+    'seriesFromPairs'                  : 'dateAlignment',
+    'seriesFromYahoo'                  : 'dateAlignment',
+
+    'getSNP500CompanyListAsync'        : 'asyncData',
+    'getTickerFundamentalDataMWAsync'  : 'asyncData',
+    'getTickersFundamentalDataMWAsync' : 'asyncData',
+    'getStockDataYahooAsync'           : 'asyncData',
+}, submodules=[
+    'asyncData', 'companyLists', 'dateAlignment', 'dateParsing', 'fundamentalFrame', 'fundamentalStore', 'httpFetcher',
+    'marketWarchData', 'pageArchive', 'parsePool', 'priceArchive', 'priceStore',
+    'responseCache', 'scheduler', 'screeningIndex', 'tableParser',
+    'yahooData',
+])
+
+__all__ = [
+    'getSNP500CompanyList', 'getTickerFundamentalDataMW', 'getTickersFundamentalDataMW',
+    'extractYearlyData', 'extractQuarterlyData', 'getStockDataYahoo', 'FetchError', 'FetchResult',
+    'PriceStore', 'PriceArchive', 'writePriceArchive',
+    'FundamentalFrame', 'toFundamentalFrames', 'extractFields', 'ScreeningIndex',
+    'FundamentalStore', 'PageArchive', 'alignAsOf', 'alignTickers', 'alignPrices', 'seriesFromPairs', 'seriesFromYahoo',
+    'getSNP500CompanyListAsync', 'getTickerFundamentalDataMWAsync', 'getTickersFundamentalDataMWAsync',
+    'getStockDataYahooAsync',
+]
@@ -0,0 +1,356 @@
+'''Asynchronous versions of the data downloaders
+
+The functions within this module are coroutines that return exactly what
+their blocking counterparts return:
+
+=======================================  =======================================
+blocking                                 asynchronous
+=======================================  =======================================
+``getSNP500CompanyList()``               ``getSNP500CompanyListAsync()``
+``getDataFromMWURL()``                   ``getDataFromMWURLAsync()``
+``getTickerFundamentalDataMW()``         ``getTickerFundamentalDataMWAsync()``
+``getTickersFundamentalDataMW()``        ``getTickersFundamentalDataMWAsync()``
+``getStockDataYahoo()``                  ``getStockDataYahooAsync()``
+=======================================  =======================================
+
+They use the same URLs, the same response cache and the same parsers, but
+download the pages with ``aiohttp``, so that an ``asyncio`` application can
+call them without blocking its event loop. Every event loop gets a single
+``aiohttp.ClientSession`` (and with it a single pool of connections), and
+the concurrency of every host is the adaptive limit of the shared
+``RequestScheduler``, shared with the blocking downloaders. Cancelling a
+coroutine cancels its downloads.
+
+Only the requests themselves are made on the event loop. The response
+cache, the page archive and the parsers block (on SQLite, on files, or on
+the CPU), so they run in the default executor of the loop. The attempts,
+retries and backoff of a download are those of ``FetchAttempts``, which the
+blocking downloaders use as well, so that both behave in the same way.
+
+``aiohttp`` is not installed with this package. Install it with:
+
+    pip install financeMacroFactors[async]
+'''
+
+import time
+import asyncio
+import logging
+import weakref
+import functools
+from datetime import datetime as dt
+from datetime import timedelta as tDel
+
+from financeMacroFactors import instrumentation
+from financeMacroFactors.companies import responseCache
+from financeMacroFactors.companies import marketWarchData as mw
+from financeMacroFactors.companies import yahooData
+from financeMacroFactors.companies import companyLists
+from financeMacroFactors.companies import scheduler
+from financeMacroFactors.companies import pageArchive
+from financeMacroFactors.companies.scheduler import FetchAttempts, FetchError
+
+logBase = 'financeMacroFactors.companies.asyncData.'
+
+sessions = weakref.WeakKeyDictionary()
+
+def importAiohttp():
+    'Internal function - do not use'
+
+    try:
+        import aiohttp
+        import yarl
+    except ImportError:
+        raise ImportError('The asynchronous API requires aiohttp. '
+                          'Install it with "pip install financeMacroFactors[async]".')
+    return aiohttp, yarl
+
+async def getAsyncSession(poolSize=32):
+    '''get the session shared by all the downloads of the running event loop
+
+    Parameters
+    ----------
+    poolSize : int, optional
+        The maximum number of open connections, by default 32. This is only used
+        when the session is first created.
+
+    Returns
+    -------
+    aiohttp.ClientSession
+        The session of the running event loop
+    '''
+
+    aiohttp, _ = importAiohttp()
+    loop    = asyncio.get_running_loop()
+    session = sessions.get(loop)
+    if (session is None) or session.closed:
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=poolSize))
+        sessions[loop] = session
+
+    return session
+
+async def closeAsyncSession():
+    '''close the session of the running event loop
+
+    Call this before the event loop is closed, to release its connections.
+    '''
+
+    loop    = asyncio.get_running_loop()
+    session = sessions.pop(loop, None)
+    if session is not None:
+        await session.close()
+
+async def inThread(function, *args, **kwargs):
+    'Internal function - do not use'
+
+    # The response cache, the page archive and the parsers block, and run in
+    # the default executor of the loop so that other coroutines keep running
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(function, *args, **kwargs))
+
+async def fetchURLAsync(url, session=None, timeout=30, retries=3, backoff=0.5, maxConcurrency=None):
+    '''download the text of a single page
+
+    This is the asynchronous counterpart of ``fetchURL()``. The requests go through
+    the same ``RequestScheduler``, and are retried in the same way.
+
+    Parameters
+    ----------
+    url : str
+        The URL to download
+    session : aiohttp.ClientSession or ``None``, optional
+        The session to use, by default ``None`` for the shared session
+    timeout : float, optional
+        Timeout in seconds for each attempt, by default 30
+    retries : int, optional
+        The number of times a failed attempt is retried, by default 3
+    backoff : float, optional
+        The base delay in seconds between successive attempts, by default 0.5
+    maxConcurrency : int or ``None``, optional
+        An upper bound on the adaptive concurrency limit of the host, by default
+        ``None`` for none
+
+    Returns
+    -------
+    str
+        The text of the page
+
+    Raises
+    ------
+    FetchError
+        If the page could not be downloaded (or, when replaying, is not within the
+        page archive). Its ``transient`` attribute tells whether trying again later
+        may succeed.
+    '''
+
+    if pageArchive.replaying():
+        return await inThread(pageArchive.replayPage, url)
+
+    aiohttp, yarl = importAiohttp()
+
+    if session is None:
+        session = await getAsyncSession()
+
+    attempts = FetchAttempts(scheduler.getScheduler(), url, retries, backoff)
+    state    = attempts.state
+
+    # The URL is sent as it is, without quoting it again, as ``fetchURL()`` does
+    target = yarl.URL(url, encoded=True)
+    while True:
+        await asyncio.sleep(attempts.wait())
+        await state.enterAsync(maxConcurrency)
+        try:
+            sent = time.perf_counter()
+            with instrumentation.stage('http', attempts.host):
+                async with session.get(target, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    body = await response.read()
+                    text = await response.text(errors='replace')
+            if attempts.responded(response.status, response.headers, time.perf_counter() - sent):
+                attempts.succeeded(text, len(body))
+            else:
+                attempts.rejected(aiohttp.ClientResponseError(response.request_info, response.history,
+                                      status=response.status, message=f'status {response.status} for {url}'))
+        except asyncio.TimeoutError as e:
+            attempts.raised(e, 'throttled')
+        except aiohttp.ClientError as e:
+            # Connections that fail or close early, and bodies cut short
+            attempts.raised(e, 'transient')
+        finally:
+            state.leave()
+
+        delay = attempts.next()
+        if delay is None:
+            break
+        await asyncio.sleep(delay)
+
+    if not attempts.result.ok:
+        raise FetchError(attempts.result)
+
+    await inThread(pageArchive.archivePage, url, attempts.result.text)
+    return attempts.result.text
+
+async def cachedCallAsync(source, url, params, compute):
+    'Internal function - do not use'
+
+    # The cache is an SQLite file, which is only read and written off the loop
+    if responseCache.getCache() is None:
+        return await compute()
+
+    found, value = await inThread(responseCache.lookup, source, url, params)
+    if found:
+        return value
+
+    value = await compute()
+    await inThread(responseCache.store, source, url, value, params)
+    return value
+
+async def getDataFromMWURLAsync(url, convert=True, raiseErrors=False):
+    '''the asynchronous version of ``getDataFromMWURL()``'''
+
+    logger = logging.getLogger(logBase + 'getDataFromMWURLAsync')
+
+    async def compute():
+        return await inThread(mw.parseMWPage, await fetchURLAsync(url), convert=convert)
+
+    try:
+        return await cachedCallAsync('marketwatch', url, {'convert': convert}, compute)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        if raiseErrors and isinstance(e, FetchError):
+            raise
+        logger.error(f'Unable to obtain the data from the URL [{url}]: {e}')
+        return []
+
+async def getTickerFundamentalDataMWAsync(ticker, convert=True, raiseErrors=False):
+    '''the asynchronous version of ``getTickerFundamentalDataMW()``
+
+    All the statements are downloaded at the same time.
+    '''
+
+    urls    = {key: mw.mwBaseURL + path.format(ticker) for key, path in mw.mwStatementPaths.items()}
+    results = await asyncio.gather(*[getDataFromMWURLAsync(url, convert=convert, raiseErrors=raiseErrors)
+                                     for url in urls.values()])
+
+    return dict(zip(urls, results))
+
+async def getTickersFundamentalDataMWAsync(tickers, convert=True, perHostLimit=None, retries=3, backoff=0.5, progress=None, baseURL=None,
+                                           returnErrors=False):
+    '''the asynchronous version of ``getTickersFundamentalDataMW()``
+
+    Parameters
+    ----------
+    tickers : list of str
+        Valid tickers for downloading company data.
+    convert : bool, optional
+        Convert the numbers within the pages, by default ``True``
+    perHostLimit : int or ``None``, optional
+        An upper bound on the concurrent requests to the Marketwatch host, by default
+        ``None`` for the adaptive limit of the request scheduler alone
+    retries : int, optional
+        The number of times a failed download is retried, by default 3
+    backoff : float, optional
+        The base delay in seconds between successive attempts, by default 0.5
+    progress : callable or ``None``, optional
+        A function called as ``progress(ticker, done, total)`` every time all the
+        statements of a ticker have been obtained, by default ``None``
+    baseURL : str or ``None``, optional
+        The scheme and host from which the pages are obtained, by default ``None``,
+        in which case ``mwBaseURL`` is used.
+    returnErrors : bool, optional
+        Also return the statements that failed, by default ``False``
+
+    Returns
+    -------
+    dict or tuple
+        A dictionary mapping every ticker to its financial data. With ``returnErrors``,
+        a tuple ``(data, errors)`` as returned by ``getTickersFundamentalDataMW()``.
+    '''
+
+    logger = logging.getLogger(logBase + 'getTickersFundamentalDataMWAsync')
+
+    if baseURL is None:
+        baseURL = mw.mwBaseURL
+
+    tickers = list(dict.fromkeys(tickers))
+    done    = []
+    errors  = {}
+
+    async def page(t, key):
+        url = baseURL + mw.mwStatementPaths[key].format(t)
+        async def compute():
+            text = await fetchURLAsync(url, retries=retries, backoff=backoff, maxConcurrency=perHostLimit)
+            return await inThread(mw.parseMWPage, text, convert=convert)
+        try:
+            return await cachedCallAsync('marketwatch', url, {'convert': convert}, compute)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f'Unable to obtain the data from the URL [{url}]: {e}')
+            errors.setdefault(t, {})[key] = e
+            return []
+
+    async def ticker(t):
+        keys    = list(mw.mwStatementPaths)
+        results = await asyncio.gather(*[page(t, k) for k in keys])
+        done.append(t)
+        if progress is not None:
+            progress(t, len(done), len(tickers))
+        return dict(zip(keys, results))
+
+    results = dict(zip(tickers, await asyncio.gather(*[ticker(t) for t in tickers])))
+
+    if returnErrors:
+        return results, {t: errors[t] for t in tickers if t in errors}
+    return results
+
+async def getStockDataYahooAsync(ticker, startDate=None, endDate=None, frequency='1mo', convert=True, raiseErrors=False):
+    '''the asynchronous version of ``getStockDataYahoo()``'''
+
+    logger = logging.getLogger(logBase + 'getStockDataYahooAsync')
+
+    possibleFrequencies = ['1d', '1wk', '1mo']
+    if frequency not in possibleFrequencies:
+        logger.error(f'Incorrect frequency supplied {frequency}. Should be one of {possibleFrequencies}')
+        return []
+
+    if startDate is None:
+        startDate = dt.now()-tDel(365)
+    if endDate is None:
+        endDate = dt.now()
+
+    url, params = yahooData.historyCacheKey(ticker, startDate, endDate, frequency, convert)
+
+    async def compute():
+        html_data = await fetchURLAsync(yahooData.historyURL(ticker, startDate, endDate, frequency))
+        return await inThread(yahooData.parseStockDataYahoo, html_data, convert, mw.miniMonthMaps)
+
+    try:
+        return await cachedCallAsync('yahoo', url, params, compute)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        if raiseErrors and isinstance(e, FetchError):
+            raise
+        logger.error(f'Unable to get Stock data from Yahoo: {e}')
+        return []
+
+async def getSNP500CompanyListAsync(raiseErrors=False):
+    '''the asynchronous version of ``getSNP500CompanyList()``'''
+
+    logger = logging.getLogger(logBase + 'getSNP500CompanyListAsync')
+
+    url = companyLists.snp500URL
+
+    async def compute():
+        return await inThread(companyLists.parseSNP500CompanyList, await fetchURLAsync(url))
+
+    try:
+        return await cachedCallAsync('wikipedia', url, None, compute)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        if raiseErrors and isinstance(e, FetchError):
+            raise
+        logger.error('Error while attempting to get S&P 500 company listings')
+        logger.error(f'{e}')
+        return []
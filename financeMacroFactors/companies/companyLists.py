@@ -1,8 +1,13 @@
 import logging
-import requests
-from bs4 import BeautifulSoup
+from financeMacroFactors import instrumentation
+from financeMacroFactors.companies import responseCache
+from financeMacroFactors.companies.httpFetcher import fetchURL
+from financeMacroFactors.companies.scheduler import FetchError
+from financeMacroFactors.companies.tableParser import iterTableRows
 
-def getSNP500CompanyList():
+snp500URL = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
+
+def getSNP500CompanyList(raiseErrors=False):
     '''get the list of SNP 500 companies. 
 
     This function downloads the data from the
@@ -13,6 +18,12 @@ def getSNP500CompanyList():
     an error, an error message will be logged, and in that case
     an empty list will be returned.
 
+    Parameters
+    ----------
+    raiseErrors : bool, optional
+        Raise the ``FetchError`` of a page that could not be downloaded, rather
+        than returning an empty list, by default ``False``
+
     Returns
     -------
     list of dictionaries
@@ -22,34 +33,26 @@ def getSNP500CompanyList():
         data element. In case of an error, an empty list will
         be returned. The logger will be used for exporting errors
         and warnings to the user.
+
+    Raises
+    ------
+    FetchError
+        If ``raiseErrors`` is set and the page could not be downloaded
     '''
 
     logger = logging.getLogger('financeMacroFactors.companies.companyLists.getSNP500CompanyList')
 
     try:
-        
-        logger.debug('Downloading data from the wikipedia page ...')
-        website = requests.get('https://en.wikipedia.org/wiki/List_of_S%26P_500_companies').text
-
-        logger.debug('Parsing the web data...')
-        soup = BeautifulSoup(website, features="html.parser")
-        companyTable = soup.find('table', {'id':'constituents'})
-        rows = companyTable.find_all('tr')
-
-        # Get the header information
-        header = rows[0]
-        header = [h.getText().strip() for h in header.find_all('th')]
-
-        # Get the rest of the informaiton
-        results = []
-        for values in rows[1:]:
-            data = {h:v.getText().strip() for h, v in zip(header, values.find_all('td'))}
-            results.append( data )
-
-        logger.debug(f'{len(results)} rows of data generated ...')
 
-        return results
+        url = snp500URL
+        return responseCache.cachedCall('wikipedia', url, None, lambda : downloadSNP500CompanyList(url))
 
+    except FetchError as e:
+        if raiseErrors:
+            raise
+        logger.error('Error while attempting to get S&P 500 company listings')
+        logger.error(f'{e}')
+        return []
     except Exception as e:
         logger.error('Error while attempting to get S&P 500 company listings')
         logger.error(f'{e}')
@@ -57,4 +60,41 @@ def getSNP500CompanyList():
 
     return []
 
-    
\ No newline at end of file
+def downloadSNP500CompanyList(url):
+    'Internal function - do not use'
+
+    logger = logging.getLogger('financeMacroFactors.companies.companyLists.downloadSNP500CompanyList')
+
+    logger.debug('Downloading data from the wikipedia page ...')
+    website = fetchURL(url)
+
+    logger.debug('Parsing the web data...')
+    return parseSNP500CompanyList(website)
+
+def parseSNP500CompanyList(website):
+    'Internal function - do not use'
+
+    logger = logging.getLogger('financeMacroFactors.companies.companyLists.parseSNP500CompanyList')
+
+    header  = None
+    results = []
+    with instrumentation.stage('parse', 'wikipedia'):
+        for tNo, i, cells in iterTableRows(website, tableId='constituents'):
+
+            # Get the header information
+            if header is None:
+                header = [text.strip() for tag, text in cells if tag == 'th']
+                continue
+
+            # Get the rest of the informaiton
+            data = {h:v.strip() for h, v in zip(header, [text for tag, text in cells if tag == 'td'])}
+            results.append( data )
+
+    instrumentation.count('rows', len(results), source='wikipedia')
+
+    if header is None:
+        raise ValueError('Unable to find the table of constituents')
+
+    logger.debug(f'{len(results)} rows of data generated ...')
+
+    return results
@@ -0,0 +1,296 @@
+'''Lining up data that are given at different dates
+
+The valuation functions expect the EPS, the shares outstanding, the revenue
+and the price of a company for the same periods. They come from different
+places, however: yearly statements are dated at the end of the fiscal year,
+quarterly statements at the end of the quarter, and prices from Yahoo! at the
+start of every month (or week, or day).
+
+The functions within this module look up, for every target date, the value
+of a series at the closest date according to a fill policy:
+
+``'previous'``
+    The last value at or before the target date (an *as-of* join). This is
+    the only policy that never uses information from the future.
+``'next'``
+    The first value at or after the target date.
+``'nearest'``
+    The value at the closest date, the earlier one on ties.
+``'exact'``
+    Only a value at the target date itself.
+
+All the series of all the companies are looked up together, with a single
+``numpy.searchsorted`` over the dates of all of them, so that the time taken
+grows as :math:`(N + M) \\log N` for N values and M target dates.
+
+.. code-block:: python
+
+    fields  = extractFields(fundamentals, ['EPS (Diluted)'])
+    prices  = {t: getStockDataYahoo(t, dt(2014, 1, 1), dt.now()) for t in fields['tickers']}
+    aligned = alignPrices(fields, prices)
+    priceToEarningsRatioBatch(aligned['values']['EPS (Diluted)'], aligned['price'], aligned['mask'])
+'''
+
+import logging
+import numpy as np
+from datetime import timedelta
+
+logBase = 'financeMacroFactors.companies.dateAlignment.'
+
+fillPolicies = ['previous', 'next', 'nearest', 'exact']
+
+def toDays(dates):
+    '''dates as a ``datetime64[D]`` array
+
+    Parameters
+    ----------
+    dates : array-like
+        ``datetime.datetime`` or ``datetime.date`` objects, ``datetime64`` values, or ISO
+        strings. ``None`` is a missing date.
+
+    Returns
+    -------
+    numpy array
+        A ``datetime64[D]`` array of the same shape, with ``NaT`` for missing dates
+    '''
+
+    if isinstance(dates, np.ndarray) and (dates.dtype.kind == 'M'):
+        return dates.astype('datetime64[D]')
+    return np.array(dates, dtype='datetime64[D]')
+
+def toDayDelta(delta):
+    'Internal function - do not use'
+
+    # A number of days, a datetime.timedelta or a timedelta64
+    if delta is None:
+        return None
+    if isinstance(delta, np.timedelta64):
+        return delta.astype('timedelta64[D]')
+    if isinstance(delta, timedelta):
+        return np.timedelta64(delta.days, 'D')
+    return np.timedelta64(int(delta), 'D')
+
+def groupedKeys(days, groups):
+    'Internal function - do not use'
+
+    # A day within a group becomes a single integer that sorts by the group
+    # first, so that all the groups are searched at once
+    return (groups.astype(np.int64) << 32) + (days.astype(np.int64) + (1 << 31))
+
+def matchIndices(sourceKeys, targetKeys, fill):
+    'Internal function - do not use'
+
+    # The position within the sorted ``sourceKeys`` that matches every target, or
+    # -1. Matches may belong to another group, which the caller checks.
+    n = len(sourceKeys)
+    if n == 0:
+        return np.full(len(targetKeys), -1)
+
+    after  = np.searchsorted(sourceKeys, targetKeys, side='left')
+    before = np.searchsorted(sourceKeys, targetKeys, side='right') - 1
+
+    if fill == 'previous':
+        return before
+    if fill == 'next':
+        return np.where(after < n, after, -1)
+    if fill == 'exact':
+        exact = (after < n) & (sourceKeys[np.minimum(after, n - 1)] == targetKeys)
+        return np.where(exact, after, -1)
+
+    # The nearest of the two neighbours, the earlier one on ties
+    nextKey = sourceKeys[np.minimum(after, n - 1)]
+    prevKey = sourceKeys[np.maximum(before, 0)]
+    useNext = (after < n) & ((before < 0) | (nextKey - targetKeys < targetKeys - prevKey))
+    return np.where(useNext, after, before)
+
+def alignTickers(sourceDates, sourceValues, targetDates, fill='previous', tolerance=None, lag=None):
+    '''look up the series of many companies at given dates
+
+    Parameters
+    ----------
+    sourceDates : list of array-like
+        The dates of the series of every company. They do not need to be sorted, and
+        missing dates are ignored.
+    sourceValues : list of array-like
+        The values of the series of every company, for the same dates
+    targetDates : array-like
+        The dates at which the series are needed: a 1d-array shared by all the companies,
+        or a 2d-array with a row for every company. Missing dates get ``NaN``.
+    fill : str, optional
+        One of ``'previous'``, ``'next'``, ``'nearest'`` or ``'exact'``, by default
+        ``'previous'``. See the description of this module.
+    tolerance : int or timedelta or ``None``, optional
+        The largest distance (in days) between a target date and the date of the value
+        used for it, by default ``None`` for no limit
+    lag : int or timedelta or ``None``, optional
+        The time (in days) after its date at which a value becomes available, by default
+        ``None`` for none. For example, yearly statements are published a few weeks
+        after the end of the fiscal year.
+
+    Returns
+    -------
+    numpy 2d-array
+        The values, with one row per company and one column per target date, and ``NaN``
+        where there is no value
+
+    Raises
+    ------
+    ValueError
+        If ``fill`` is not one of the above.
+    '''
+
+    if fill not in fillPolicies:
+        raise ValueError(f'Unknown fill policy {fill}. Should be one of {fillPolicies}')
+
+    nTickers = len(sourceDates)
+    days     = [toDays(d).ravel() for d in sourceDates]
+    values   = [np.asarray(v, dtype=np.float64).ravel() for v in sourceValues]
+    groups   = np.repeat(np.arange(nTickers), [len(d) for d in days])
+    days     = np.concatenate(days) if nTickers else np.zeros(0, dtype='datetime64[D]')
+    values   = np.concatenate(values) if nTickers else np.zeros(0)
+    assert len(days) == len(values), 'dimensions of the dates and the values are different'
+
+    lag = toDayDelta(lag)
+    if lag is not None:
+        days = days + lag
+
+    valid   = ~np.isnat(days)
+    keys    = groupedKeys(days[valid], groups[valid])
+    values  = values[valid]
+    # Series are usually sorted already, which is cheaper to check than to sort
+    if np.any(keys[1:] < keys[:-1]):
+        order  = np.argsort(keys, kind='stable')
+        keys   = keys[order]
+        values = values[order]
+
+    targets = toDays(targetDates)
+    targets = np.broadcast_to(targets, (nTickers,) + targets.shape[-1:]) if targets.ndim == 1 else targets
+    assert targets.shape[0] == nTickers, 'there should be a row of target dates for every company'
+
+    result  = np.full(targets.shape, np.nan)
+    wanted  = ~np.isnat(targets)
+    rows    = np.nonzero(wanted)[0]
+    wantedKeys = groupedKeys(targets[wanted], rows)
+
+    found = matchIndices(keys, wantedKeys, fill)
+    match = keys[np.maximum(found, 0)] if len(keys) else np.zeros(len(found), dtype=np.int64)
+    ok    = (found >= 0) & ((match >> 32) == rows)
+
+    tolerance = toDayDelta(tolerance)
+    if tolerance is not None:
+        ok &= np.abs(match - wantedKeys) <= tolerance.astype(np.int64)
+
+    aligned = np.full(len(found), np.nan)
+    aligned[ok] = values[found[ok]]
+    result[wanted] = aligned
+
+    return result
+
+def alignAsOf(sourceDates, sourceValues, targetDates, fill='previous', tolerance=None, lag=None):
+    '''look up a series at given dates
+
+    This is ``alignTickers()`` for a single series.
+
+    Returns
+    -------
+    numpy 1d-array
+        The values at the target dates, with ``NaN`` where there is no value
+    '''
+
+    return alignTickers([sourceDates], [sourceValues], toDays(targetDates)[None, :], fill, tolerance, lag)[0]
+
+def seriesFromPairs(pairs):
+    '''the dates and values of the result of ``extractYearlyData()`` or ``extractQuarterlyData()``
+
+    Returns
+    -------
+    tuple
+        ``(dates, values)`` as a ``datetime64[D]`` array and a ``float64`` array
+    '''
+
+    if not pairs:
+        return np.zeros(0, dtype='datetime64[D]'), np.zeros(0)
+
+    dates, values = zip(*pairs)
+    return toDays(list(dates)), np.array(values, dtype=np.float64)
+
+def seriesFromYahoo(data, column='Close'):
+    '''the dates and values of a column of the result of ``getStockDataYahoo()``
+
+    Parameters
+    ----------
+    data : list of list
+        Stock data as returned by ``getStockDataYahoo()``, with the dates converted
+    column : str, optional
+        The column, by default ``'Close'``. The asterisks that mark the footnotes of
+        the header and the case of the letters are ignored, so that ``'adj. close'``
+        is the ``'Adj. close**'`` column.
+
+    Returns
+    -------
+    tuple or None
+        ``(dates, values)``, oldest first, as a ``datetime64[D]`` array and a ``float64``
+        array, or ``None`` if the column is not present
+    '''
+
+    logger = logging.getLogger(logBase + 'seriesFromYahoo')
+
+    if not data:
+        return np.zeros(0, dtype='datetime64[D]'), np.zeros(0)
+
+    names = [h.rstrip('*').strip().lower() for h in data[0]]
+    name  = column.rstrip('*').strip().lower()
+    if name not in names:
+        logger.error(f'Unable to find the column [{column}] within {data[0]}')
+        return None
+
+    j      = names.index(name)
+    dates  = toDays([row[0] for row in data[1:]])
+    values = np.array([row[j] for row in data[1:]], dtype=np.float64)
+
+    # Yahoo! lists the newest prices first
+    order = np.argsort(dates, kind='stable')
+    return dates[order], values[order]
+
+def alignPrices(fields, prices, column='Close', fill='previous', tolerance=31):
+    '''add the prices at the end of every period to the result of ``extractFields()``
+
+    Parameters
+    ----------
+    fields : dict
+        The result of ``extractFields()``
+    prices : dict
+        Maps tickers to the result of ``getStockDataYahoo()``. Tickers that are not
+        present get no prices.
+    column : str, optional
+        The column of the prices, by default ``'Close'``
+    fill : str, optional
+        The fill policy, by default ``'previous'`` for the last price at or before the
+        end of every period
+    tolerance : int or timedelta or ``None``, optional
+        The largest distance in days between the end of a period and the date of its
+        price, by default 31
+
+    Returns
+    -------
+    dict or None
+        A copy of ``fields`` with the prices as a (tickers x periods) matrix under
+        ``'price'``, and with a ``'mask'`` that also requires a price. If there is an
+        error, it is logged and ``None`` is returned.
+    '''
+
+    logger = logging.getLogger(logBase + 'alignPrices')
+
+    try:
+        series = [seriesFromYahoo(prices.get(t) or [], column) for t in fields['tickers']]
+        series = [s if s is not None else seriesFromYahoo([], column) for s in series]
+        price  = alignTickers([s[0] for s in series], [s[1] for s in series], fields['dates'], fill, tolerance)
+
+        result = dict(fields)
+        result['price'] = price
+        result['mask']  = fields['mask'] & ~np.isnan(price)
+        return result
+
+    except Exception as e:
+        logger.error(f'Unable to align the prices: {e}')
+        return None
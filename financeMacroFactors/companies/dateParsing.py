@@ -0,0 +1,223 @@
+'''Parsing of whole columns of dates at once
+
+The dates within the pages of Marketwatch and Yahoo! come in a few fixed
+forms:
+
+- the headers of yearly statements are years, with the months of the fiscal
+  year within the first cell (``'Fiscal year is October-September. ...'``)
+- the headers of quarterly statements look like ``'27-Jun-2020'``
+- the rows of the price history of Yahoo! start with ``'31 Jul 2020'``
+
+Rather than splitting every string and creating a ``datetime.datetime`` for
+each, the functions within this module look at a whole column of strings as
+an array of characters (just as ``convertNumbersMW()`` does for numbers) and
+return a ``datetime64[D]`` array. ``toDatetimes()`` converts the result into
+``datetime.datetime`` objects for the functions that return them.
+'''
+
+import functools
+import numpy as np
+from datetime import date
+
+monthMaps = {
+    'January'    : 1  ,
+    'February'   : 2  ,
+    'March'      : 3  ,
+    'April'      : 4  ,
+    'May'        : 5  ,
+    'June'       : 6  ,
+    'July'       : 7  ,
+    'August'     : 8  ,
+    'September'  : 9  ,
+    'October'    : 10 ,
+    'November'   : 11 ,
+    'December'   : 12 }
+
+miniMonthMaps = {
+    'Jan'  : 1  ,
+    'Feb'  : 2  ,
+    'Mar'  : 3  ,
+    'Apr'  : 4  ,
+    'May'  : 5  ,
+    'Jun'  : 6  ,
+    'Jul'  : 7  ,
+    'Aug'  : 8  ,
+    'Sep'  : 9  ,
+    'Oct'  : 10 ,
+    'Nov'  : 11 ,
+    'Dec'  : 12 }
+
+separators = [ord(' '), ord('-'), ord('/')]
+
+epochOrdinal = date(1970, 1, 1).toordinal()
+notADay      = np.iinfo(np.int64).min
+
+# Below this number of strings the fixed cost of the array operations is
+# larger than that of parsing the strings one at a time
+vectorThreshold = 128
+
+def monthKeys(months):
+    'Internal function - do not use'
+
+    # Three letter names become integers that can be looked up with searchsorted
+    names  = [name for name in months if len(name) == 3]
+    keys   = np.array([(ord(a) << 42) + (ord(b) << 21) + ord(c) for a, b, c in names], dtype=np.int64)
+    values = np.array([months[name] for name in names], dtype=np.int64)
+    order  = np.argsort(keys)
+    return keys[order], values[order]
+
+def fromYearMonthDay(years, months, days):
+    'Internal function - do not use'
+
+    # Invalid combinations (such as the 31st of April) become NaT
+    start  = (years - 1970) * 12 + (months - 1)
+    start  = start.astype('datetime64[M]')
+    length = ((start + 1).astype('datetime64[D]') - start.astype('datetime64[D]')).astype(np.int64)
+    valid  = (years >= 1) & (months >= 1) & (months <= 12) & (days >= 1) & (days <= length)
+
+    dates = start.astype('datetime64[D]') + (days - 1)
+    dates[~valid] = np.datetime64('NaT')
+    return dates
+
+def dayNumber(text, months):
+    'Internal function - do not use'
+
+    # The same rules as parseDayMonthYear(), for a single string, giving the
+    # number of days since 1970-01-01, or NaT
+    text = text.strip()
+    if len(text) == 10:
+        text = '0' + text
+    day, sep, month, year = text[:2], text[2:3], text[3:6], text[7:]
+    if (len(text) != 11) or (sep not in ' -/') or (text[6] != sep) or (month not in months):
+        return notADay
+    if not ((day + year).isdigit() and (day + year).isascii()):
+        return notADay
+    try:
+        return date(int(year), months[month], int(day)).toordinal() - epochOrdinal
+    except ValueError:
+        return notADay
+
+@functools.lru_cache(maxsize=4096)
+def cachedDayNumber(text):
+    'Internal function - do not use'
+
+    # The headers of the statements of most companies share the same few dates
+    return dayNumber(text, miniMonthMaps)
+
+def parseDayMonthYearLoop(strings, months):
+    'Internal function - do not use'
+
+    if months is miniMonthMaps:
+        numbers = [cachedDayNumber(text) for text in strings]
+    else:
+        numbers = [dayNumber(text, months) for text in strings]
+    return np.array(numbers, dtype=np.int64).astype('datetime64[D]')
+
+def parseDayMonthYear(strings, months=None):
+    '''parse dates such as ``'27-Jun-2020'`` or ``'1 Aug 2020'``
+
+    The day has one or two digits, the month is a three letter name, the year has
+    four digits, and they are separated by single spaces, dashes or slashes.
+
+    Parameters
+    ----------
+    strings : array-like of str
+        The dates, of any shape
+    months : dict or ``None``, optional
+        Maps the names of the months to their numbers, by default ``None`` for
+        ``miniMonthMaps``
+
+    Returns
+    -------
+    numpy array
+        A ``datetime64[D]`` array of the same shape, with ``NaT`` for the strings that
+        are not dates
+    '''
+
+    months  = miniMonthMaps if months is None else months
+    if isinstance(strings, list) and (len(strings) < vectorThreshold) and all(isinstance(t, str) for t in strings):
+        return parseDayMonthYearLoop(strings, months)
+
+    strings = np.asarray(strings, dtype=str)
+    shape   = strings.shape
+    if strings.size < vectorThreshold:
+        return parseDayMonthYearLoop(strings.ravel().tolist(), months).reshape(shape)
+
+    keys, numbers = monthKeys(months)
+    strings = np.char.strip(strings.ravel())
+    result  = np.full(strings.shape, np.datetime64('NaT'), dtype='datetime64[D]')
+    if strings.itemsize == 0:
+        return result.reshape(shape)
+
+    # A row of code points for every string, with room for the longest form
+    width = strings.itemsize // 4
+    chars = strings.view(np.uint32).reshape(-1, width)
+    if width < 11:
+        chars = np.pad(chars, ((0, 0), (0, 11 - width)))
+
+    # Days of a single digit get a leading zero, so that every part is at the
+    # same column for all the strings: 'DD-Mon-YYYY'
+    length  = np.char.str_len(strings)
+    valid   = (length == 10) | (length == 11)
+    short   = length == 10
+    columns = [np.where(short, ord('0'), chars[:, 0]).astype(np.int64)]
+    columns += [np.where(short, chars[:, c-1], chars[:, c]).astype(np.int64) for c in range(1, 11)]
+
+    digits = [c - ord('0') for c in columns]
+    for c in [0, 1, 7, 8, 9, 10]:
+        valid &= (digits[c] >= 0) & (digits[c] <= 9)
+    valid &= np.isin(columns[2], separators) & (columns[6] == columns[2])
+    day    = digits[0]*10 + digits[1]
+    year   = ((digits[7]*10 + digits[8])*10 + digits[9])*10 + digits[10]
+
+    key    = (columns[3] << 42) + (columns[4] << 21) + columns[5]
+    found  = np.minimum(np.searchsorted(keys, key), len(keys) - 1)
+    valid &= keys[found] == key
+    month  = numbers[found]
+
+    result[valid] = fromYearMonthDay(year[valid], month[valid], day[valid])
+    return result.reshape(shape)
+
+def parseFiscalYearEnds(title, years):
+    '''the last days of fiscal years, from the header of a yearly statement
+
+    Parameters
+    ----------
+    title : str
+        The first cell of the header, such as ``'Fiscal year is October-September.
+        All values USD Millions.'``
+    years : list of str
+        The years of the header. Empty strings are years without data.
+
+    Returns
+    -------
+    numpy 1d-array
+        A ``datetime64[D]`` array with the last day of every fiscal year, and ``NaT``
+        for empty years and years up to 1900. Fiscal years are named after the
+        calendar year within which they end, so that ``'2019'`` ends on 2019-09-30
+        for a fiscal year from October to September, and on 2019-12-31 for one
+        from January to December.
+
+    Raises
+    ------
+    KeyError, ValueError
+        If the title does not name a month, or a year is not a number
+    '''
+
+    startingMonth = title.split('.')[0].split()[-1].split('-')[0]
+    startingMonth = monthMaps[startingMonth]
+
+    # A header only has a few years, which are converted to integers one by
+    # one, and to dates all together
+    values = np.array([(int(y) if str(y).strip() != '' else -1) for y in years], dtype=np.int64)
+    # The day before the start of the next fiscal year, which is in the
+    # following calendar year for fiscal years that start in January
+    starts = ((values - 1970 + (startingMonth == 1)) * 12 + (startingMonth - 1)).astype('datetime64[M]')
+
+    dates = starts.astype('datetime64[D]') - 1
+    dates[values <= 1900] = np.datetime64('NaT')
+    return dates
+
+def toDatetimes(dates):
+    '''a ``datetime64`` array as a list of ``datetime.datetime`` objects, with ``None`` for ``NaT``'''
+    return np.asarray(dates).astype('datetime64[us]').tolist()
@@ -0,0 +1,431 @@
+'''Columnar container for fundamental data
+
+The data returned by ``getDataFromMWURL()`` is a list of lists, where the
+first row is the header and every other row is a label followed by the
+values for each period. That is convenient to save and to look at, but
+finding a line item means scanning all the rows, and the dates have to be
+parsed again for every line item that is extracted.
+
+A ``FundamentalFrame`` holds the same information in a columnar form: an
+index from labels to rows, a ``float64`` matrix of values with ``NaN``
+for missing values, and the dates of the periods parsed once. A frame made
+from data obtained with ``convert=True`` gives the same list of lists back
+with ``toList()``. Data obtained with ``convert=False`` are converted on the
+way in, and so come back with numbers in place of their strings.
+
+``extractFields()`` uses the frames to pull a number of line items of many
+companies at once, lined up on common periods, in the form that the batch
+valuations expect:
+
+    fields = extractFields(getTickersFundamentalDataMW(tickers),
+                           ['Free Cash Flow', 'Diluted Shares Outstanding'])
+    discountedCashFlowBatch(fields['values']['Free Cash Flow'],
+                            fields['values']['Diluted Shares Outstanding'],
+                            mask=fields['mask'])
+'''
+
+import logging
+import numbers
+import numpy as np
+
+from financeMacroFactors import instrumentation
+from financeMacroFactors.companies import marketWarchData as mw
+
+logBase = 'financeMacroFactors.companies.fundamentalFrame.'
+
+yearlyStatements    = ['IncomeStatement', 'BalanceSheet', 'CashFlow']
+quarterlyStatements = ['IncomeStatementQuarter', 'BalanceSheetQuarter', 'CashFlowQuarter']
+
+class FundamentalFrame:
+    '''fundamental data of one statement of one company
+
+    Do not create instances directly. Use ``FundamentalFrame.fromList()`` instead.
+
+    Attributes
+    ----------
+    title : str
+        The first cell of the header (typically a description of the fiscal year and the units)
+    periods : list of str
+        The remaining cells of the header, one for each period
+    labels : list of str
+        The line items, in the order in which they appear on the statement
+    labelIndex : dict
+        Maps every label to its row within ``values``. If a label appears more than
+        once, the first row is used, just as in ``extractYearlyData()``.
+    values : numpy 2d-array
+        A ``float64`` matrix (labels x periods). Values that are not numbers are ``NaN``.
+    dates : numpy 1d-array
+        A ``datetime64[D]`` array with the date of each period, ``NaT`` for periods
+        without a valid date.
+    text : dict
+        Maps ``(row, column)`` to the original text of each cell that could not be
+        converted into a number, so that ``toList()`` can reproduce the original data.
+    '''
+
+    def __init__(self, title, periods, labels, values, dates, text=None):
+
+        self.title   = title
+        self.periods = list(periods)
+        self.labels  = list(labels)
+        self.values  = values
+        self.dates   = dates
+        self.text    = {} if text is None else text
+
+        self.labelIndex = {}
+        for i, label in enumerate(self.labels):
+            self.labelIndex.setdefault(label, i)
+
+    @classmethod
+    def fromList(cls, info, period='auto'):
+        '''create a frame from data in the list of lists form
+
+        Parameters
+        ----------
+        info : list of list
+            Statement data as returned by ``getDataFromMWURL()``, with or without
+            the conversion of the values into numbers.
+        period : str, optional
+            One of ``'year'``, ``'quarter'`` or ``'auto'``, by default ``'auto'``.
+            This decides how the dates of the header are parsed. With ``'auto'``,
+            headers that are plain years are taken to be yearly data, and all
+            other headers are taken to be quarterly data.
+
+        Returns
+        -------
+        FundamentalFrame or None
+            The frame. If the data cannot be converted, an error is logged and
+            ``None`` is returned.
+        '''
+
+        logger = logging.getLogger(logBase + 'fromList')
+
+        try:
+            header  = info[0]
+            periods = header[1:]
+
+            if period == 'auto':
+                isYear = all(p.strip().isdigit() or p.strip() == '' for p in periods)
+                period = 'year' if isYear else 'quarter'
+
+            if period == 'year':
+                dates = mw.convertToDates(info, asArray=True)
+            else:
+                dates = mw.convertToMonths(info, asArray=True)
+            if dates is None:
+                dates = np.full(len(periods), np.datetime64('NaT'), dtype='datetime64[D]')
+
+            rows   = info[1:]
+            labels = [row[0] for row in rows]
+            cells  = np.full((len(rows), len(periods)), '', dtype=object)
+            for i, row in enumerate(rows):
+                cells[i, :len(row)-1] = row[1:len(periods)+1]
+
+            # Cells that were already converted to numbers are used as they
+            # are, and only the strings go through convertNumbersMW()
+            numeric = np.array([isinstance(c, numbers.Real) for c in cells.ravel()], dtype=bool).reshape(cells.shape)
+            with instrumentation.stage('convert', 'fundamentalFrame'):
+                values, failed = mw.convertNumbersMW(np.where(numeric, '', cells).astype(str))
+            values[numeric] = np.asarray(cells[numeric].tolist(), dtype=np.float64)
+            failed[numeric] = False
+            instrumentation.count('conversionFailures', int(failed.sum()), source='fundamentalFrame')
+            text = {(int(i), int(j)): cells[i, j] for i, j in zip(*np.nonzero(failed))}
+
+            return cls(header[0], periods, labels, values, dates, text)
+
+        except Exception as e:
+            logger.error(f'Unable to convert the data into a FundamentalFrame: {e}')
+            return None
+
+    def toList(self):
+        '''convert the frame back into the list of lists form
+
+        Returns
+        -------
+        list of list
+            The data in the form returned by ``getDataFromMWURL()`` with ``convert=True``.
+        '''
+
+        allData = [[self.title] + self.periods]
+        for label, values in zip(self.labels, self.values.tolist()):
+            allData.append([label] + values)
+
+        for (i, j), cell in self.text.items():
+            allData[i+1][j+1] = cell
+
+        return allData
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __contains__(self, label):
+        return label in self.labelIndex
+
+    def row(self, label):
+        '''the values of a line item, or ``None`` if it is not present'''
+
+        i = self.labelIndex.get(label)
+        if i is None:
+            return None
+        return self.values[i]
+
+    def rows(self, labels):
+        '''the values of a number of line items
+
+        Parameters
+        ----------
+        labels : list of str
+            The line items to obtain
+
+        Returns
+        -------
+        numpy 2d-array
+            A (labels x periods) matrix. The rows of line items that are not
+            present are filled with ``NaN``.
+        '''
+
+        index  = np.array([self.labelIndex.get(label, -1) for label in labels], dtype=int)
+        found  = index >= 0
+        result = np.full((len(labels), len(self.periods)), np.nan)
+        result[found] = self.values[index[found]]
+
+        return result
+
+    def series(self, label):
+        '''the dates and values of a line item, for periods with a valid date
+
+        Returns
+        -------
+        tuple
+            ``(dates, values)`` as a ``datetime64[D]`` array and a ``float64`` array,
+            or ``None`` if the line item is not present.
+        '''
+
+        values = self.row(label)
+        if values is None:
+            return None
+
+        valid = ~np.isnat(self.dates)
+        return self.dates[valid], values[valid]
+
+    def extract(self, label):
+        '''extract a line item in the form of ``extractYearlyData()``
+
+        Returns
+        -------
+        list
+            A list of ``(datetime.datetime, value)`` tuples for the periods with a valid
+            date, or an empty list if the line item is not present.
+        '''
+
+        series = self.series(label)
+        if series is None:
+            return []
+
+        dates, values = series
+        return list(zip(dates.astype('datetime64[us]').tolist(), values.tolist()))
+
+def toFundamentalFrames(fundamentals):
+    '''convert all the statements of a company into frames
+
+    Parameters
+    ----------
+    fundamentals : dict
+        The result of ``getTickerFundamentalDataMW()``
+
+    Returns
+    -------
+    dict
+        Maps each statement to its ``FundamentalFrame``. Statements that are empty
+        or cannot be converted are left out.
+    '''
+
+    frames = {}
+    for statement, info in fundamentals.items():
+        if not info:
+            continue
+        period = 'quarter' if statement.endswith('Quarter') else 'year'
+        frame  = FundamentalFrame.fromList(info, period=period)
+        if frame is not None:
+            frames[statement] = frame
+
+    return frames
+
+def periodColumns(dates, period):
+    '''the period of every date, as an integer
+
+    Parameters
+    ----------
+    dates : numpy 1d-array
+        A ``datetime64[D]`` array, such as the ``dates`` of a ``FundamentalFrame``
+    period : str
+        Either ``'year'`` or ``'quarter'``
+
+    Returns
+    -------
+    tuple
+        ``(columns, valid)``: the year of every date (or ``4*year + quarter - 1`` for
+        calendar quarters), and whether the date is valid
+    '''
+
+    valid = ~np.isnat(dates)
+    years = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+    if period == 'year':
+        return years, valid
+
+    months = dates.astype('datetime64[M]').astype(np.int64) % 12
+    return 4 * years + months // 3, valid
+
+def periodLabels(columns, period):
+    '''the periods of ``periodColumns()`` as strings such as ``'2019'`` or ``'2019Q3'``'''
+
+    if period == 'year':
+        return [str(c) for c in columns]
+    return [f'{c // 4}Q{c % 4 + 1}' for c in columns]
+
+def statementIndex(info, period, headers):
+    'Internal function - do not use'
+
+    # The label index, the periods and their dates of a statement, and a function
+    # that returns the cells of a row for the periods with a valid date. The
+    # values are not converted, so that only the rows needed are. Most
+    # companies share the same few headers, which are only parsed once.
+    if not info:
+        return None
+
+    if isinstance(info, FundamentalFrame):
+        columns, valid = periodColumns(info.dates, period)
+        return info.labelIndex, columns[valid], lambda i: info.values[i][valid].tolist(), info.dates[valid]
+
+    header = tuple(info[0])
+    if header not in headers:
+        if period == 'year':
+            dates = mw.convertToDates(info, asArray=True)
+        else:
+            dates = mw.convertToMonths(info, asArray=True)
+        if dates is None:
+            headers[header] = None
+        else:
+            columns, valid = periodColumns(dates, period)
+            headers[header] = (columns[valid], np.flatnonzero(valid).tolist(), len(dates) + 1, dates[valid])
+    if headers[header] is None:
+        return None
+
+    columns, positions, width, dates = headers[header]
+    index = {}
+    for i, row in enumerate(info[1:], 1):
+        index.setdefault(row[0], i)
+
+    def lineItem(i):
+        row = info[i][1:width]
+        row = row + [''] * (width - 1 - len(row))
+        return [row[j] for j in positions]
+
+    return index, columns, lineItem, dates
+
+@instrumentation.timed('extract')
+def extractFields(fundamentals, fields, tickers=None, period='year', statements=None):
+    '''extract a number of line items of many companies at once
+
+    Each statement of each company is parsed once, whatever the number of line
+    items, and the line items are found through the label index of the statement.
+    The values are lined up on the periods of all the companies together (fiscal
+    years, or calendar quarters), so that they can be passed directly to the batch
+    valuations.
+
+    Parameters
+    ----------
+    fundamentals : dict
+        Maps every ticker to the result of ``getTickerFundamentalDataMW()``, as returned
+        by ``getTickersFundamentalDataMW()``. Statements may also be supplied as
+        ``FundamentalFrame`` objects.
+    fields : list
+        The line items to extract. A label (such as ``'EPS (Diluted)'``) is taken from
+        the first statement that has it. A ``(statement, label)`` tuple is only taken
+        from the given statement.
+    tickers : list of str or ``None``, optional
+        The tickers to extract, in order, by default ``None`` for all the tickers of
+        ``fundamentals``. Tickers without data get rows of ``NaN``.
+    period : str, optional
+        Either ``'year'`` or ``'quarter'``, by default ``'year'``
+    statements : list of str or ``None``, optional
+        The statements in which labels are looked for, in order, by default ``None``
+        for all the yearly (or quarterly) statements
+
+    Returns
+    -------
+    dict or None
+        A dictionary with
+
+        - ``'tickers'``: the tickers, in the order of the rows
+        - ``'periods'``: the periods of the columns, oldest first, as strings such as
+          ``'2019'`` or ``'2019Q3'``
+        - ``'dates'``: a (tickers x periods) ``datetime64[D]`` matrix with the last day of
+          every period of every company (fiscal years end in different months), ``NaT``
+          where there is no value
+        - ``'values'``: maps every field to a (tickers x periods) ``float64`` matrix,
+          with ``NaN`` where there is no value
+        - ``'mask'``: a (tickers x periods) matrix of bool, marking where every field
+          has a value
+
+        If the data cannot be extracted, an error is logged and ``None`` is returned.
+    '''
+
+    logger = logging.getLogger(logBase + 'extractFields')
+
+    try:
+        if period not in ('year', 'quarter'):
+            raise ValueError(f'Unknown period {period}')
+        if tickers is None:
+            tickers = list(fundamentals)
+        if statements is None:
+            statements = yearlyStatements if period == 'year' else quarterlyStatements
+
+        # The cells of every line item found are gathered, with the field, the
+        # ticker and the period of each, and converted all together at the end
+        cells, cellFields, cellRows, cellColumns, cellDates = [], [], [], [], []
+        headers = {}
+        for i, ticker in enumerate(tickers):
+            data    = fundamentals.get(ticker) or {}
+            indexed = {}
+            for k, field in enumerate(fields):
+                statement, label = field if isinstance(field, tuple) else (None, field)
+                for name in ([statement] if statement else statements):
+                    if name not in indexed:
+                        indexed[name] = statementIndex(data.get(name), period, headers)
+                    if (indexed[name] is None) or (label not in indexed[name][0]):
+                        continue
+                    index, columns, lineItem, dates = indexed[name]
+                    cells.extend(lineItem(index[label]))
+                    cellColumns.append(columns)
+                    cellDates.append(dates)
+                    cellFields.extend([k] * len(columns))
+                    cellRows.extend([i] * len(columns))
+                    break
+
+        cellColumns = np.concatenate(cellColumns) if cellColumns else np.zeros(0, dtype=np.int64)
+        cellDates   = np.concatenate(cellDates) if cellDates else np.zeros(0, dtype='datetime64[D]')
+        columns     = np.unique(cellColumns)
+        positions   = np.searchsorted(columns, cellColumns)
+
+        with instrumentation.stage('convert', 'fundamentalFrame'):
+            converted, failed = mw.convertNumbersMW(np.array(cells, dtype=str))
+        instrumentation.count('conversionFailures', int(failed.sum()), source='fundamentalFrame')
+
+        values = np.full((len(fields), len(tickers), len(columns)), np.nan)
+        values[cellFields, cellRows, positions] = converted
+
+        # The statements of a company share the dates of their periods
+        dates = np.full((len(tickers), len(columns)), np.datetime64('NaT'), dtype='datetime64[D]')
+        dates[cellRows, positions] = cellDates
+
+        return {
+            'tickers' : list(tickers),
+            'periods' : periodLabels(columns, period),
+            'dates'   : dates,
+            'values'  : dict(zip(fields, values)),
+            'mask'    : ~np.isnan(values).any(axis=0),
+        }
+
+    except Exception as e:
+        logger.error(f'Unable to extract {fields}: {e}')
+        return None
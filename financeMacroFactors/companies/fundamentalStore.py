@@ -0,0 +1,328 @@
+'''Point-in-time store of fundamental data
+
+Marketwatch only shows the last five years (or quarters) of a company, and
+the numbers of past periods are sometimes restated. Every download therefore
+replaces what was known before, and a back-test that uses today's data for
+a date in the past sees numbers that were not known at that date.
+
+A ``FundamentalStore`` keeps every version of every value, along with the
+time at which it was downloaded. Only the values that changed since the
+previous download are stored, so that recording the same statements every
+day costs almost nothing. The values known at any point in time can then be
+obtained without reading all the downloads:
+
+.. code-block:: python
+
+    store = FundamentalStore('~/data/fundamentals.sqlite')
+    store.record('AAPL', getTickerFundamentalDataMW('AAPL'))
+    ...
+    store.asOf('AAPL', 'EPS (Diluted)', dt(2021, 3, 1))
+    # {'2016': 2.08, '2017': 2.3, '2018': 2.98, '2019': 2.97, '2020': 3.28}
+
+The values are kept in an SQLite table with one row per ticker, line item,
+period and download time, whose primary key (in this order) is the index
+through which every query is answered.
+'''
+
+import os
+import logging
+import threading
+import numpy as np
+from datetime import datetime as dt
+
+from financeMacroFactors.companies.responseCache import threadConnection, toTimestamp
+from financeMacroFactors.companies.fundamentalFrame import FundamentalFrame
+from financeMacroFactors.companies.fundamentalFrame import periodColumns, periodLabels
+from financeMacroFactors.companies.fundamentalFrame import yearlyStatements, quarterlyStatements
+
+logBase = 'financeMacroFactors.companies.fundamentalStore.'
+
+def toValue(value):
+    'Internal function - do not use'
+
+    # Missing values are stored as NULL
+    return None if (value is None) or np.isnan(value) else value
+
+class FundamentalStore:
+    '''a versioned store of the fundamental data of many companies
+
+    Parameters
+    ----------
+    path : str
+        The SQLite file within which the data are stored. The folder is created
+        if it does not exist.
+
+    The values are identified by the ticker, the line item (``field``, such as
+    ``'EPS (Diluted)'``) and the period (such as ``'2019'`` for a fiscal year, or
+    ``'2019Q3'`` for a calendar quarter). Times are ``datetime.datetime`` or
+    ``datetime.date`` objects, or seconds since the epoch.
+    '''
+
+    def __init__(self, path):
+
+        self.path  = os.path.abspath(os.path.expanduser(path))
+        self.local = threading.local()
+
+        folder = os.path.dirname(self.path)
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+
+        with self.connection() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS observations (
+                                ticker  TEXT NOT NULL,
+                                field   TEXT NOT NULL,
+                                period  TEXT NOT NULL,
+                                fetched REAL NOT NULL,
+                                value   REAL,
+                                PRIMARY KEY (ticker, field, period, fetched)) WITHOUT ROWID''')
+            conn.execute('''CREATE TABLE IF NOT EXISTS snapshots (
+                                ticker  TEXT NOT NULL,
+                                fetched REAL NOT NULL,
+                                changed INTEGER NOT NULL,
+                                PRIMARY KEY (ticker, fetched)) WITHOUT ROWID''')
+
+    def connection(self):
+        'Internal function - do not use'
+
+        return threadConnection(self.local, self.path)
+
+    @staticmethod
+    def observations(data):
+        '''the values within the statements of a company
+
+        Parameters
+        ----------
+        data : dict
+            The result of ``getTickerFundamentalDataMW()``. Statements may also be
+            supplied as ``FundamentalFrame`` objects.
+
+        Returns
+        -------
+        dict
+            Maps ``(field, period)`` to the value. If a line item is present in more
+            than one statement, the first statement in which it appears is used.
+        '''
+
+        logger = logging.getLogger(logBase + 'observations')
+
+        values = {}
+        for period, statements in [('year', yearlyStatements), ('quarter', quarterlyStatements)]:
+            for statement in statements:
+                info = data.get(statement)
+                if not info:
+                    continue
+                frame = info if isinstance(info, FundamentalFrame) else FundamentalFrame.fromList(info, period=period)
+                if frame is None:
+                    logger.error(f'Unable to use the {statement}')
+                    continue
+
+                columns, valid = periodColumns(frame.dates, period)
+                periods = periodLabels(columns[valid], period)
+                matrix  = frame.values[:, valid].tolist()
+                for field, row in frame.labelIndex.items():
+                    for p, value in zip(periods, matrix[row]):
+                        values.setdefault((field, p), value)
+
+        return values
+
+    def record(self, ticker, data, fetched=None):
+        '''record the statements of a company, as downloaded at some time
+
+        Only the values that differ from those known at ``fetched`` are stored.
+        Periods that are not within ``data`` (for example years that are no
+        longer shown) keep their last known values.
+
+        Downloads may be recorded out of order, for example when statements
+        replayed from a page archive fill in the past. The values that such a
+        download changes are then also stored as they were known at the next
+        download, so that what was known from then on stays the same.
+
+        Parameters
+        ----------
+        ticker : str
+            The ticker
+        data : dict
+            The result of ``getTickerFundamentalDataMW()`` for the ticker
+        fetched : datetime or float or ``None``, optional
+            The time at which the data were downloaded, by default ``None`` for now
+
+        Returns
+        -------
+        int
+            The number of values that were stored
+        '''
+
+        fetched = toTimestamp(fetched)
+        values  = self.observations(data)
+        conn    = self.connection()
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            known = {(field, period): value for field, period, value, _ in conn.execute(
+                '''SELECT field, period, value, MAX(fetched) FROM observations
+                   WHERE ticker=? AND fetched<=? GROUP BY field, period''', (ticker, fetched))}
+
+            rows = []
+            for key, value in values.items():
+                value = toValue(value)
+                if (key not in known) or (known[key] != value):
+                    rows.append((ticker, key[0], key[1], fetched, value))
+
+            # A later download that did not change a value relied on the one
+            # known before it, which is written down before it is replaced
+            following, = conn.execute('SELECT MIN(fetched) FROM snapshots WHERE ticker=? AND fetched>?',
+                                      (ticker, fetched)).fetchone()
+            anchors = []
+            if (following is not None) and rows:
+                later = set(conn.execute('''SELECT DISTINCT field, period FROM observations
+                                            WHERE ticker=? AND fetched>? AND fetched<=?''',
+                                         (ticker, fetched, following)))
+                anchors = [(ticker, field, period, following, known[(field, period)])
+                           for _, field, period, _, _ in rows
+                           if ((field, period) in known) and ((field, period) not in later)]
+
+            conn.executemany('INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?)', rows + anchors)
+            conn.execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)', (ticker, fetched, len(rows)))
+            if anchors:
+                conn.execute('UPDATE snapshots SET changed=changed+? WHERE ticker=? AND fetched=?',
+                             (len(anchors), ticker, following))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        logging.getLogger(logBase + 'record').debug('%d of %d values of [%s] changed', len(rows), len(values), ticker)
+        return len(rows) + len(anchors)
+
+    def recordMany(self, fundamentals, fetched=None):
+        '''record the statements of many companies, as returned by ``getTickersFundamentalDataMW()``
+
+        Returns
+        -------
+        int
+            The number of values that were stored
+        '''
+
+        fetched = toTimestamp(fetched)
+        return sum(self.record(ticker, data, fetched) for ticker, data in fundamentals.items() if data)
+
+    def asOf(self, ticker, field, when, period=None):
+        '''the values of a line item known at some time
+
+        Parameters
+        ----------
+        ticker : str
+            The ticker
+        field : str
+            The line item, such as ``'EPS (Diluted)'``
+        when : datetime or float
+            The point in time
+        period : str or ``None``, optional
+            A single period (such as ``'2019'``), by default ``None`` for all of them
+
+        Returns
+        -------
+        dict or float or None
+            Maps every period known at ``when`` to its latest value at that time
+            (``NaN`` if it was missing), in the order of the periods. For a single
+            period, its value, or ``None`` if it was not known at ``when``.
+        '''
+
+        when = toTimestamp(when)
+        conn = self.connection()
+
+        if period is not None:
+            row = conn.execute('''SELECT value FROM observations
+                                  WHERE ticker=? AND field=? AND period=? AND fetched<=?
+                                  ORDER BY fetched DESC LIMIT 1''', (ticker, field, period, when)).fetchone()
+            if row is None:
+                return None
+            return np.nan if row[0] is None else row[0]
+
+        rows = conn.execute('''SELECT period, value, MAX(fetched) FROM observations
+                               WHERE ticker=? AND field=? AND fetched<=? GROUP BY period ORDER BY period''',
+                            (ticker, field, when))
+        return {p: (np.nan if value is None else value) for p, value, _ in rows}
+
+    def asOfFields(self, tickers, fields, when, period='year'):
+        '''the values of many line items of many companies known at some time
+
+        This is the point-in-time counterpart of ``extractFields()``, and returns
+        the same structure, except for the ``'dates'`` of the periods, which are
+        not stored.
+
+        Parameters
+        ----------
+        tickers : list of str
+            The tickers, in the order of the rows
+        fields : list of str
+            The line items
+        when : datetime or float
+            The point in time
+        period : str, optional
+            Either ``'year'`` or ``'quarter'``, by default ``'year'``
+
+        Returns
+        -------
+        dict
+            A dictionary with the ``'tickers'``, the ``'periods'`` (oldest first), the
+            ``'values'`` of every field as a (tickers x periods) matrix with ``NaN``
+            where there is no value, and a ``'mask'`` marking where every field has
+            a value.
+        '''
+
+        when = toTimestamp(when)
+        conn = self.connection()
+
+        rowOf   = {t: i for i, t in enumerate(tickers)}
+        fieldOf = {f: k for k, f in enumerate(fields)}
+        found   = []
+        # SQLite limits the number of parameters of a statement
+        for start in range(0, len(tickers), 500):
+            part  = tickers[start:start+500]
+            query = f'''SELECT ticker, field, period, value, MAX(fetched) FROM observations
+                        WHERE ticker IN ({",".join("?"*len(part))}) AND field IN ({",".join("?"*len(fields))})
+                        AND fetched<=? GROUP BY ticker, field, period'''
+            found.extend(conn.execute(query, list(part) + list(fields) + [when]))
+
+        isQuarter = period == 'quarter'
+        found   = [r for r in found if ('Q' in r[2]) == isQuarter]
+        periods = sorted({r[2] for r in found})
+        column  = {p: j for j, p in enumerate(periods)}
+
+        values = np.full((len(fields), len(tickers), len(periods)), np.nan)
+        for ticker, field, p, value, _ in found:
+            if value is not None:
+                values[fieldOf[field], rowOf[ticker], column[p]] = value
+
+        return {
+            'tickers' : list(tickers),
+            'periods' : periods,
+            'values'  : dict(zip(fields, values)),
+            'mask'    : ~np.isnan(values).any(axis=0),
+        }
+
+    def history(self, ticker, field, period):
+        '''every version of a value
+
+        Returns
+        -------
+        list of tuple
+            ``(fetched, value)`` for every time the value changed, oldest first, with
+            ``fetched`` as a ``datetime.datetime``
+        '''
+
+        rows = self.connection().execute('''SELECT fetched, value FROM observations
+                                            WHERE ticker=? AND field=? AND period=? ORDER BY fetched''',
+                                         (ticker, field, period))
+        return [(dt.fromtimestamp(fetched), np.nan if value is None else value) for fetched, value in rows]
+
+    def fetchTimes(self, ticker):
+        '''the times at which the data of a ticker were recorded, oldest first'''
+
+        rows = self.connection().execute('SELECT fetched FROM snapshots WHERE ticker=? ORDER BY fetched', (ticker,))
+        return [dt.fromtimestamp(fetched) for fetched, in rows]
+
+    def tickers(self):
+        '''the tickers within the store'''
+        return [t for t, in self.connection().execute('SELECT DISTINCT ticker FROM snapshots ORDER BY ticker')]
@@ -0,0 +1,195 @@
+'''Pooled, concurrent HTTP fetching for the data downloaders
+
+All the functions that download data from the internet should obtain their
+pages through this module. A single ``requests.Session`` is shared by all
+of them, so that connections (and their TLS handshakes) are reused across
+pages of the same host. Many pages can be fetched at once with
+``fetchURLs()``, which runs the downloads in a bounded thread pool. Every
+request goes through the shared ``RequestScheduler`` of the ``scheduler``
+module, which adapts the rate and concurrency of the requests to each host
+(so that the concurrency of a host is never more than its adaptive limit),
+and retries transient failures.
+When the page archive is enabled (see ``pageArchive.configureArchive()``),
+the downloaded pages are archived, or read from the archive when replaying.
+'''
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from financeMacroFactors.companies import scheduler, pageArchive
+from financeMacroFactors.companies.scheduler import FetchError, retryStatusCodes
+
+logBase = 'financeMacroFactors.companies.httpFetcher.'
+
+sessionLock   = threading.Lock()
+sharedSession = None
+
+def getSession(poolSize=32):
+    '''get the shared HTTP session
+
+    The session is created the first time that this function is called,
+    and is reused by every subsequent call. Connections to the same host
+    are kept alive and reused, with up to ``poolSize`` connections kept
+    per host.
+
+    Parameters
+    ----------
+    poolSize : int, optional
+        The maximum number of connections kept alive per host, by default 32.
+        This is only used when the session is first created.
+
+    Returns
+    -------
+    requests.Session
+        The session shared by all the downloaders
+    '''
+
+    global sharedSession
+
+    with sessionLock:
+        if sharedSession is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            sharedSession = session
+
+    return sharedSession
+
+def fetchURL(url, session=None, timeout=30, retries=3, backoff=0.5, maxConcurrency=None):
+    '''download the text of a single page
+
+    The request is made through the shared ``RequestScheduler`` (see
+    ``scheduler.getScheduler()``), which limits the rate and concurrency of the
+    requests made to every host. Connection errors, timeouts and responses with
+    a status code that signals a temporary problem (429 and 5xx) are retried up
+    to ``retries`` times, waiting about ``backoff * 2**attempt`` seconds between
+    attempts.
+
+    Parameters
+    ----------
+    url : str
+        The URL to download
+    session : requests.Session or ``None``, optional
+        The session to use, by default ``None``, in which case the shared
+        session (see ``getSession()``) is used.
+    timeout : float, optional
+        Timeout in seconds for each attempt, by default 30
+    retries : int, optional
+        The number of times a failed attempt is retried, by default 3
+    backoff : float, optional
+        The base delay in seconds between successive attempts, by default 0.5
+    maxConcurrency : int or ``None``, optional
+        An upper bound on the adaptive concurrency limit of the host, by default
+        ``None`` for none
+
+    Returns
+    -------
+    str
+        The text of the page
+
+    Raises
+    ------
+    FetchError
+        If the page could not be downloaded (or, when replaying, is not within the
+        page archive). Its ``transient`` attribute tells whether trying again later
+        may succeed.
+    '''
+
+    if pageArchive.replaying():
+        return pageArchive.replayPage(url)
+
+    if session is None:
+        session = getSession()
+
+    result = scheduler.getScheduler().fetch(url, session, timeout=timeout, retries=retries, backoff=backoff,
+                                            maxConcurrency=maxConcurrency)
+    if not result.ok:
+        raise FetchError(result)
+
+    pageArchive.archivePage(url, result.text)
+    return result.text
+
+def fetchURLs(urls, process=None, maxWorkers=16, perHostLimit=None, timeout=30, retries=3, backoff=0.5, progress=None, session=None,
+              returnErrors=False):
+    '''download a number of pages concurrently
+
+    The pages are downloaded in a pool of at most ``maxWorkers`` threads. The
+    number of concurrent requests to any single host is the adaptive limit of
+    the ``RequestScheduler``, which ``perHostLimit`` may cap. If a ``process``
+    function is supplied, it is called with the text of every page within the
+    worker thread that downloaded it, so that the processing of one page
+    overlaps with the download of others. Pages that cannot be downloaded or
+    processed are logged and returned as ``None``.
+
+    Parameters
+    ----------
+    urls : list of str
+        The URLs to download
+    process : callable or ``None``, optional
+        A function that is applied to the text of every page, by default ``None``,
+        in which case the text is returned as is.
+    maxWorkers : int, optional
+        The maximum number of threads, by default 16
+    perHostLimit : int or ``None``, optional
+        An upper bound on the concurrent requests per host, by default ``None``
+        for the adaptive limit of the scheduler alone
+    timeout : float, optional
+        Timeout in seconds for each attempt, by default 30
+    retries : int, optional
+        The number of times a failed attempt is retried, by default 3
+    backoff : float, optional
+        The base delay in seconds between successive attempts, by default 0.5
+    progress : callable or ``None``, optional
+        A function called as ``progress(url, done, total)`` every time a page is
+        completed, by default ``None``.
+    session : requests.Session or ``None``, optional
+        The session to use, by default ``None``, in which case the shared session
+        is used.
+    returnErrors : bool, optional
+        Also return the errors, by default ``False``
+
+    Returns
+    -------
+    list or tuple
+        The (processed) pages in the same order as ``urls``, with ``None`` for
+        the pages that failed. With ``returnErrors``, a tuple ``(pages, errors)``,
+        where ``errors`` has the exception of every page that failed (a ``FetchError``
+        for a download, whose ``transient`` attribute tells whether trying again later
+        may succeed), and ``None`` for the other pages.
+    '''
+
+    logger = logging.getLogger(logBase + 'fetchURLs')
+
+    if session is None:
+        session = getSession(poolSize=max(maxWorkers, 10))
+
+    def worker(url):
+        text = fetchURL(url, session=session, timeout=timeout, retries=retries, backoff=backoff,
+                        maxConcurrency=perHostLimit)
+        if process is not None:
+            return process(text)
+        return text
+
+    results = [None] * len(urls)
+    errors  = [None] * len(urls)
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        futures = {executor.submit(worker, url): i for i, url in enumerate(urls)}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                logger.error(f'Unable to obtain the data from the URL [{urls[i]}]: {e}')
+                errors[i] = e
+
+            if progress is not None:
+                progress(urls[i], done, len(urls))
+
+    if returnErrors:
+        return results, errors
+    return results
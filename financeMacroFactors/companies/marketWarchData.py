@@ -1,12 +1,28 @@
 import logging
-import requests
-from bs4 import BeautifulSoup
-from datetime import datetime as dt 
-from datetime import timedelta as tDel
+import numpy as np
+
+from financeMacroFactors import instrumentation
+from financeMacroFactors.companies.httpFetcher import fetchURL, fetchURLs
+from financeMacroFactors.companies.scheduler import FetchError
+from financeMacroFactors.companies import responseCache
+from financeMacroFactors.companies.tableParser import iterTableRows
+from financeMacroFactors.companies.dateParsing import monthMaps, miniMonthMaps
+from financeMacroFactors.companies.dateParsing import parseDayMonthYear, parseFiscalYearEnds, toDatetimes
 
 
 logBase = 'financeMacroFactors.companies.marketWatchData.'
 
+mwBaseURL = 'https://www.marketwatch.com'
+
+mwStatementPaths = {
+    'IncomeStatement'       : '/investing/stock/{}/financials',
+    'IncomeStatementQuarter': '/investing/stock/{}/financials/income/quarter',
+    'BalanceSheet'          : '/investing/stock/{}/financials/balance-sheet',
+    'BalanceSheetQuarter'   : '/investing/stock/{}/financials/balance-sheet/quarter',
+    'CashFlow'              : '/investing/stock/{}/financials/cash-flow',
+    'CashFlowQuarter'       : '/investing/stock/{}/financials/cash-flow/quarter',
+}
+
 def convertNumberMW(number):
     '''translate a string to a potential number
     Marketwatch contains numbers within HTML tables as text. The
@@ -30,42 +46,175 @@ def convertNumberMW(number):
     logger = logging.getLogger(logBase + 'convertNumberMW')
     
     try:
-        if number == '-':
-            return 0
-
-        number = number.replace(',', '')
-        sign = 1
-        # This is a negative number
-        if number.startswith('(') and number.endswith(')'):
-            number = number[1:-1]
-            sign = -1
-            
-        multiplier = 1
-        if number.endswith('T'):
-            number = number[:-1]
-            multiplier = 1e12
-        if number.endswith('B'):
-            number = number[:-1]
-            multiplier = 1e9
-        if number.endswith('M'):
-            number = number[:-1]
-            multiplier = 1e6
-        if number.endswith('K'):
-            number = number[:-1]
-            multiplier = 1e3
-        if number.endswith('%'):
-            number = number[:-1]
-            multiplier = 1e-2
-        
-        number = float(number) * multiplier * sign
-        return number
+        return parseNumberMW(number)
     except Exception as e:
-        logger.error(f'Unable to convert {number}: {e}', file=sys.stderr)
+        logger.error(f'Unable to convert {number}: {e}')
         return number
     
     return number
 
-def getDataFromMWURL(url, convert=True):
+def parseNumberMW(number):
+    'Internal function - do not use'
+
+    # The rules of convertNumberMW(), raising an exception for strings that
+    # are not numbers
+    if number == '-':
+        return 0
+
+    number = number.replace(',', '')
+    sign = 1
+    # This is a negative number
+    if number.startswith('(') and number.endswith(')'):
+        number = number[1:-1]
+        sign = -1
+        
+    multiplier = 1
+    if number.endswith('T'):
+        number = number[:-1]
+        multiplier = 1e12
+    if number.endswith('B'):
+        number = number[:-1]
+        multiplier = 1e9
+    if number.endswith('M'):
+        number = number[:-1]
+        multiplier = 1e6
+    if number.endswith('K'):
+        number = number[:-1]
+        multiplier = 1e3
+    if number.endswith('%'):
+        number = number[:-1]
+        multiplier = 1e-2
+    
+    return float(number) * multiplier * sign
+
+mwMultipliers = {'T': 1e12, 'B': 1e9, 'M': 1e6, 'K': 1e3, '%': 1e-2}
+
+def convertNumbersMW(numbers):
+    '''translate a whole table of strings into numbers
+
+    This does what ``convertNumberMW()`` does, for a whole array of strings
+    at once. Commas are removed, numbers within parenthesis are negative,
+    the suffixes ``T``, ``B``, ``M``, ``K`` and ``%`` scale the number, and 
+    ``'-'`` is translated to ``0``. Rather than converting one string at a 
+    time, all the strings are processed together as an array of characters.
+    The few strings that are not in this plain form (such as ``'1e5'`` or
+    ``' 7'``) are converted one at a time with the rules of
+    ``convertNumberMW()``, so that both always give the same numbers.
+
+    Parameters
+    ----------
+    numbers : array-like of str
+        The strings to be converted. This may have any shape.
+    
+    Returns
+    -------
+    tuple
+        ``(values, failed)``, two arrays with the same shape as the input. ``values``
+        is a ``float64`` array with the converted numbers, and ``failed`` is a boolean
+        array which is ``True`` for the strings that could not be converted. The
+        corresponding ``values`` are ``NaN``.
+    '''
+
+    strings = np.asarray(numbers, dtype=str)
+    shape   = strings.shape
+    strings = strings.ravel()
+
+    values = np.full(strings.shape, np.nan)
+    failed = np.ones(strings.shape, dtype=bool)
+    if (strings.size == 0) or (strings.itemsize == 0):
+        return values.reshape(shape), failed.reshape(shape)
+
+    dashes = strings == '-'
+
+    # Each string is looked at as a row of unicode code points, padded with
+    # zeros. Characters that have been dealt with are set to zero as well.
+    width   = strings.itemsize // 4
+    original = strings.view(np.uint32).reshape(-1, width)
+    chars   = original.copy()
+    rows    = np.arange(len(chars))
+    first   = np.zeros(len(chars), dtype=int)
+    length  = np.char.str_len(strings)
+    last    = np.maximum(length - 1, 0)
+
+    negative = (chars[:, 0] == ord('(')) & (chars[rows, last] == ord(')'))
+    chars[negative, 0] = 0
+    chars[rows[negative], last[negative]] = 0
+    first[negative] += 1
+    last[negative]  -= 1
+
+    multipliers = np.ones(128)
+    for suffix, m in mwMultipliers.items():
+        multipliers[ord(suffix)] = m
+    multiplier = multipliers[np.minimum(chars[rows, np.maximum(last, 0)], 127)]
+    hasSuffix  = multiplier != 1
+    chars[rows[hasSuffix], last[hasSuffix]] = 0
+
+    sign      = np.where(negative, -1.0, 1.0)
+    firstChar = chars[rows, np.minimum(first, width-1)]
+    minus     = firstChar == ord('-')
+    signed    = minus | (firstChar == ord('+'))
+    sign[minus] *= -1
+    chars[rows[signed], first[signed]] = 0
+
+    # What remains is read one column at a time (the strings are short), 
+    # building an integer mantissa from the digits, and counting the digits 
+    # after the decimal point. Only digits, commas and at most one decimal 
+    # point are allowed.
+    mantissa = np.zeros(len(chars), dtype=np.int64)
+    decimals = np.zeros(len(chars), dtype=np.int64)
+    nDigits  = np.zeros(len(chars), dtype=np.int64)
+    nPoints  = np.zeros(len(chars), dtype=np.int64)
+    invalid  = np.zeros(len(chars), dtype=bool)
+    for j in range(width):
+        column = chars[:, j].astype(np.int64)
+        digit  = (column >= ord('0')) & (column <= ord('9'))
+        point  = column == ord('.')
+        # Zeros are characters that were dealt with, or the padding after the
+        # end of the string, but not NUL characters within it
+        empty  = (column == 0) & ((original[:, j] != 0) | (j >= length))
+        invalid  |= ~(digit | point | (column == ord(',')) | empty)
+        mantissa  = np.where(digit, mantissa*10 + (column - ord('0')), mantissa)
+        decimals += digit & (nPoints > 0)
+        nDigits  += digit
+        nPoints  += point
+
+    valid = ~invalid & (nPoints <= 1) & (nDigits > 0)
+
+    # For up to 15 digits both the mantissa and the power of ten are exact,
+    # so that the division is correctly rounded, and the result is identical
+    # to that of float(). Longer numbers are left to numpy.
+    short  = valid & (nDigits <= 15)
+    values[short] = mantissa[short] / 10.0**decimals[short]
+
+    long = valid & (nDigits > 15)
+    if long.any():
+        digits = np.where((chars[long] >= ord('0')) & (chars[long] <= ord('9')) | (chars[long] == ord('.')), chars[long], 0)
+        values[long] = [float(row.tobytes().decode('utf-32-le').replace('\x00', '')) for row in digits.astype('<u4')]
+
+    values  = values * multiplier * sign
+    values[dashes] = 0
+    failed = ~(valid | dashes)
+
+    # Anything else (exponents, spaces, 'nan', several suffixes, ...) gets
+    # the scalar rules, once for each distinct string, as tables repeat the
+    # same few strings that are not numbers
+    retry = np.flatnonzero(failed)
+    if len(retry):
+        unique, inverse = np.unique(strings[retry], return_inverse=True)
+        converted = np.full(len(unique), np.nan)
+        ok        = np.zeros(len(unique), dtype=bool)
+        for k, text in enumerate(unique.tolist()):
+            try:
+                converted[k], ok[k] = parseNumberMW(text), True
+            except Exception:
+                pass
+        inverse = inverse.ravel()
+        values[retry] = converted[inverse]
+        failed[retry] = ~ok[inverse]
+
+    return values.reshape(shape), failed.reshape(shape)
+
+def getDataFromMWURL(url, convert=True, raiseErrors=False):
     '''Get data from a mamrketwatch URL page
     Given a particular URL, this function is going to return
     all the data that is associated with the particular URL.
@@ -87,48 +236,105 @@ def getDataFromMWURL(url, convert=True):
     convert : bool, optional
         determine whether numbers represented as strings should
         be coonverted into numbers, by default ``True``.
+    raiseErrors : bool, optional
+        Raise the ``FetchError`` of a page that could not be downloaded, rather
+        than returning an empty list, by default ``False``. Its ``transient``
+        attribute tells a throttled or failing server from a missing page.
     
     Returns
     -------
     list of list
         The data present within the tables within the supplied
         URL.
+
+    Raises
+    ------
+    FetchError
+        If ``raiseErrors`` is set and the page could not be downloaded
     '''
     
     logger = logging.getLogger(logBase + 'getDataFromMWURL')
     
     try:
-        data = requests.get(url)
-        html_data = data.text
-        page_content = BeautifulSoup(html_data, 'lxml')
-        
-        allData = []
+        return responseCache.cachedCall('marketwatch', url, {'convert': convert},
+            lambda : parseMWPage(fetchURL(url), convert=convert))
+    except FetchError as e:
+        if raiseErrors:
+            raise
+        logger.error(f'Unable to obtain the data from the URL [{url}]: {e}')
+        return []
+    except Exception as e:
+        logger.error(f'Unable to obtain the data from the URL [{url}]: {e}')
+        return []
 
-        tables = page_content.find_all('table')
+def parseMWPage(html_data, convert=True):
+    '''Parse the tables within a Marketwatch page
 
-        for tNo, table in enumerate(tables):
-            for i, row in enumerate(table.find_all('tr')):
-                if (i == 0) and (tNo == 0):
-                    header = [d.get_text().strip() for d in row.find_all('th')][:-1]
-                    allData.append(header)
+    This does the parsing part of ``getDataFromMWURL()`` for the HTML of
+    a page that has already been downloaded. The data from all the tables
+    are combined into a single table, the first row of which is the header.
 
-                data = [d.get_text().strip() for d in row.find_all('td')][:-1]
+    Parameters
+    ----------
+    html_data : str
+        The HTML of a Marketwatch financials page
+    convert : bool, optional
+        determine whether numbers represented as strings should
+        be coonverted into numbers, by default ``True``.
 
-                if len(data) == 0:
-                    continue
-                if data[0].endswith('Growth') or data[0].endswith('Margin'):
-                    continue
+    Returns
+    -------
+    list of list
+        The data present within the tables within the page.
+    '''
 
-                if convert:
-                    data = data[:1] + [convertNumberMW(d) for d in data[1:]]
-                allData.append(data)
-                
-        return allData
-    except Exception as e:
-        logger.error(f'Unable to obtain the data from the URL [{url}]: {e}')
-        return []
+    allData = []
+
+    with instrumentation.stage('parse', 'marketwatch'):
+        for tNo, i, cells in iterTableRows(html_data):
+            if (i == 0) and (tNo == 0):
+                header = [text.strip() for tag, text in cells if tag == 'th'][:-1]
+                allData.append(header)
+
+            data = [text.strip() for tag, text in cells if tag == 'td'][:-1]
+
+            if len(data) == 0:
+                continue
+            if data[0].endswith('Growth') or data[0].endswith('Margin'):
+                continue
+
+            allData.append(data)
 
-def getTickerFundamentalDataMW(ticker, convert=True):
+    instrumentation.count('rows', len(allData), source='marketwatch')
+
+    if convert:
+        convertRowsMW(allData[1:])
+            
+    return allData
+
+def convertRowsMW(rows):
+    'Internal function - do not use'
+
+    # All the values of all the rows are converted at once. Strings that 
+    # cannot be converted are left as they are, just as convertNumberMW()
+    # does.
+    with instrumentation.stage('convert', 'marketwatch'):
+        cells = [d for row in rows for d in row[1:]]
+        values, failed = convertNumbersMW(cells)
+        values = values.tolist()
+
+    instrumentation.count('conversionFailures', int(failed.sum()), source='marketwatch')
+
+    k = 0
+    for row in rows:
+        for j in range(1, len(row)):
+            if not failed[k]:
+                row[j] = values[k]
+            k += 1
+
+    return rows
+
+def getTickerFundamentalDataMW(ticker, convert=True, raiseErrors=False):
     '''get Valuation data for the supplied ticker
     This is going to get all financials from marketwatch, including the income statement,
     the balance sheet, and the cash-flow sheet for the lat few quarters and years separately
@@ -143,33 +349,34 @@ def getTickerFundamentalDataMW(ticker, convert=True):
         Used to convert numeric data present in the webpage as a string back into a 
         number, by default ``True``. Set this to False if you want to save the data
         from the internet as CSV files.
+    raiseErrors : bool, optional
+        Raise the ``FetchError`` of the first statement that could not be downloaded,
+        rather than using an empty list for it, by default ``False``
     
     Returns
     -------
     dict
         financial data associated with a particular stock
+
+    Raises
+    ------
+    FetchError
+        If ``raiseErrors`` is set and a statement could not be downloaded
     '''
 
     logger = logging.getLogger(logBase + 'getTickerFundamentalDataMW')
 
-    urls = {
-        'IncomeStatement'       : 'https://www.marketwatch.com/investing/stock/{}/financials',
-        'IncomeStatementQuarter': 'https://www.marketwatch.com/investing/stock/{}/financials/income/quarter',
-        'BalanceSheet'          : 'https://www.marketwatch.com/investing/stock/{}/financials/balance-sheet',
-        'BalanceSheetQuarter'   : 'https://www.marketwatch.com/investing/stock/{}/financials/balance-sheet/quarter',
-        'CashFlow'              : 'https://www.marketwatch.com/investing/stock/{}/financials/cash-flow',
-        'CashFlowQuarter'       : 'https://www.marketwatch.com/investing/stock/{}/financials/cash-flow/quarter',
-    }
-
     allResults = {}
 
     try:
-        for urlKey in urls:
-            url = urls[urlKey].format(ticker)
-            allData = getDataFromMWURL(url, convert=convert)
+        for urlKey in mwStatementPaths:
+            url = mwBaseURL + mwStatementPaths[urlKey].format(ticker)
+            allData = getDataFromMWURL(url, convert=convert, raiseErrors=raiseErrors)
 
             allResults[urlKey] = allData
 
+    except FetchError:
+        raise
     except Exception as e:
         logger.error(f'Unable to generate information for ticker [{ticker}]: {e}')
         return {}
@@ -177,54 +384,152 @@ def getTickerFundamentalDataMW(ticker, convert=True):
 
     return allResults
 
-monthMaps = {
-    'January'    : 1  , 
-    'February'   : 2  , 
-    'March'      : 3  , 
-    'April'      : 4  , 
-    'May'        : 5  , 
-    'June'       : 6  , 
-    'July'       : 7  , 
-    'August'     : 8  , 
-    'September'  : 9  , 
-    'October'    : 10 ,  
-    'November'   : 11 ,  
-    'December'   : 12 }
-
-miniMonthMaps = {
-    'Jan'  : 1  , 
-    'Feb'  : 2  , 
-    'Mar'  : 3  , 
-    'Apr'  : 4  , 
-    'May'  : 5  , 
-    'Jun'  : 6  , 
-    'Jul'  : 7  , 
-    'Aug'  : 8  , 
-    'Sep'  : 9  , 
-    'Oct'  : 10 ,  
-    'Nov'  : 11 ,  
-    'Dec'  : 12 }
-
-def convertToDates(yearInfo):
+def getTickersFundamentalDataMW(tickers, convert=True, maxWorkers=16, perHostLimit=None, retries=3, backoff=0.5, progress=None, baseURL=None,
+                                parseProcesses=None, returnErrors=False):
+    '''get Valuation data for a number of tickers concurrently
+
+    This returns the same information as ``getTickerFundamentalDataMW()`` for
+    every one of the supplied tickers. Rather than downloading one page after
+    the other, all the pages of all the tickers are downloaded by a bounded pool
+    of threads sharing a single pool of connections. Each page is parsed by the
+    thread that downloaded it. Pages that cannot be downloaded are retried with an
+    exponential backoff, and if they still fail, an error is logged and an empty
+    list is used for that statement, just as ``getDataFromMWURL()`` does. Use
+    ``returnErrors`` to tell these statements from those that have no data.
+
+    Parameters
+    ----------
+    tickers : list of str
+        Valid tickers for downloading company data.
+    convert : bool, optional
+        Used to convert numeric data present in the webpage as a string back into a 
+        number, by default ``True``.
+    maxWorkers : int, optional
+        The maximum number of pages that are downloaded at the same time, by default 16
+    perHostLimit : int or ``None``, optional
+        An upper bound on the concurrent requests to the Marketwatch host, by default
+        ``None`` for the adaptive limit of the request scheduler alone
+    retries : int, optional
+        The number of times a failed download is retried, by default 3
+    backoff : float, optional
+        The base delay in seconds between successive attempts, by default 0.5
+    progress : callable or ``None``, optional
+        A function called as ``progress(ticker, done, total)`` every time all the
+        statements of a ticker have been obtained, by default ``None``.
+    baseURL : str or ``None``, optional
+        The scheme and host from which the pages are obtained, by default ``None``,
+        in which case ``mwBaseURL`` is used.
+    parseProcesses : int or ``None``, optional
+        If supplied, the pages are parsed by a ``ParserPool`` of this many processes
+        rather than by the threads that download them, by default ``None``. This is
+        worth it when there are many pages and many cores.
+    returnErrors : bool, optional
+        Also return the statements that failed, by default ``False``
+
+    Returns
+    -------
+    dict or tuple
+        A dictionary mapping every ticker to its financial data, in the form returned
+        by ``getTickerFundamentalDataMW()``. With ``returnErrors``, a tuple ``(data,
+        errors)``, where ``errors`` maps the tickers that had failures to a dictionary
+        of the failed statements and their exceptions. Downloads that failed have a
+        ``FetchError``, whose ``transient`` attribute is ``True`` when the server was
+        throttling or failing, so that the ticker may be tried again later.
+    '''
+
+    logger = logging.getLogger(logBase + 'getTickersFundamentalDataMW')
+
+    if baseURL is None:
+        baseURL = mwBaseURL
+
+    tickers = list(dict.fromkeys(tickers))
+    keys    = [(ticker, urlKey) for ticker in tickers for urlKey in mwStatementPaths]
+    urls    = [baseURL + mwStatementPaths[urlKey].format(ticker) for ticker, urlKey in keys]
+    owners  = dict(zip(urls, keys))
+
+    remaining = {ticker: len(mwStatementPaths) for ticker in tickers}
+    completed = []
+
+    def pageDone(url, done, total):
+        ticker = owners[url][0]
+        remaining[ticker] -= 1
+        if remaining[ticker] == 0:
+            completed.append(ticker)
+            logger.debug('All statements obtained for [%s]', ticker)
+            if progress is not None:
+                progress(ticker, len(completed), len(tickers))
+
+    # Pages present within the cache are not downloaded again
+    pages   = [None] * len(urls)
+    missing = []
+    for i, url in enumerate(urls):
+        found, pages[i] = responseCache.lookup('marketwatch', url, {'convert': convert})
+        if found:
+            pageDone(url, None, None)
+        else:
+            missing.append(i)
+
+    process = lambda html_data: parseMWPage(html_data, convert=convert)
+    pool    = None
+    if parseProcesses:
+        # The download threads only hand the pages over to the pool
+        from financeMacroFactors.companies.parsePool import ParserPool
+        pool    = ParserPool(parseProcesses)
+        process = lambda html_data: pool.submit('marketwatch', html_data, convert=convert)
+
+    try:
+        fetched, errors = fetchURLs(
+            [urls[i] for i in missing], process=process,
+            maxWorkers=maxWorkers, perHostLimit=perHostLimit, retries=retries, 
+            backoff=backoff, progress=pageDone, returnErrors=True)
+
+        if pool is not None:
+            for k, (i, future) in enumerate(zip(missing, fetched)):
+                try:
+                    fetched[k] = future.result() if future is not None else None
+                except Exception as e:
+                    logger.error(f'Unable to parse the data from the URL [{urls[i]}]: {e}')
+                    fetched[k], errors[k] = None, e
+    finally:
+        if pool is not None:
+            pool.close()
+
+    for i, allData in zip(missing, fetched):
+        pages[i] = allData
+        responseCache.store('marketwatch', urls[i], allData, {'convert': convert})
+
+    allResults = {ticker: {} for ticker in tickers}
+    for (ticker, urlKey), allData in zip(keys, pages):
+        allResults[ticker][urlKey] = allData if allData is not None else []
+
+    if not returnErrors:
+        return allResults
+
+    allErrors = {}
+    for i, error in zip(missing, errors):
+        if error is not None:
+            ticker, urlKey = keys[i]
+            allErrors.setdefault(ticker, {})[urlKey] = error
+
+    return allResults, allErrors
+
+def convertToDates(yearInfo, asArray=False):
     'Internal function - do not use'
     
     logger = logging.getLogger(logBase + 'convertToDates')
 
     try:
-        startingMonth = yearInfo[0][0].split('.')[0].split()[-1].split('-')[0]
-        startingMonth = monthMaps[startingMonth] # Convert month to an integer
-
         # Sometimes in marketwatch data, the year is an empty string. We
         # Need to address that. This typically happens when the data is not
         # available on a aprticular year ...
-        years = [(int(y) if y!='' else -1) for y in yearInfo[0][1:]]
-        dates = [((dt(y, startingMonth, 1)- tDel(1)  ) if y > 1900 else None)  for y in years ]
+        dates = parseFiscalYearEnds(yearInfo[0][0], yearInfo[0][1:])
     except Exception as e:
         print(f'Unable to convert {yearInfo} to a date: {e}')
         return None
             
-    return dates
+    return dates if asArray else toDatetimes(dates)
 
+@instrumentation.timed('extract')
 def extractYearlyData(info, toExtract='EPS (Diluted)'):
     '''extract required data from a given list of items
 
@@ -287,31 +592,24 @@ def extractYearlyData(info, toExtract='EPS (Diluted)'):
         logger.error(f'Unable to extract requested data from {info}: {e}')
         return []
 
-def convertToMonths(info):
+def convertToMonths(info, asArray=False):
     'Internal function - do not use'
     
     logger = logging.getLogger(logBase + 'convertToMonths')
 
     try:
-
-        dates = []
-        for d in info[0][1:]:
-
-            if d == '':
-                dates.append(None)
-                continue
-
-            d, m, y = d.split('-')
-            d, y = int(d), int(y)
-            m = miniMonthMaps[m]
-            
-            dates.append( dt(y, m, d) )
+        header  = [d.strip() for d in info[0][1:]]
+        dates   = parseDayMonthYear(header)
+        invalid = [d for d, missing in zip(header, np.isnat(dates)) if missing and (d != '')]
+        if invalid:
+            raise ValueError(f'{invalid} are not dates')
     except Exception as e:
         logger.error(f'Unable to convert to month {info}: {e}')
         return None
 
-    return dates
+    return dates if asArray else toDatetimes(dates)
 
+@instrumentation.timed('extract')
 def extractQuarterlyData(info, toExtract='EPS (Diluted)'):
     '''extract required data from a given list of items
 
@@ -0,0 +1,427 @@
+'''Archive of the raw pages downloaded by the downloaders
+
+The response cache keeps parsed results for a while, and then forgets them.
+When a parser is fixed, or a new line item is needed, every page has to be
+downloaded again, at the rate that the sites allow. This module keeps the
+raw text of every downloaded page instead, compressed, along with the time
+at which it was downloaded, so that the pages can be parsed again later
+without any network access.
+
+The pages are appended to a single pack file, and an SQLite index maps every
+``(url, fetched)`` pair to the position of its page within the pack. A page
+that has not changed since the last download of the same URL is not stored
+again. Pages are compressed with ``gzip`` by default, or with ``zstd`` (which
+is both smaller and faster) when the ``zstandard`` package is installed.
+
+The archive is disabled by default. Once it is enabled with
+``configureArchive()``, every page downloaded through ``fetchURL()`` (and so
+by ``getDataFromMWURL()``, ``getStockDataYahoo()``, ``getSNP500CompanyList()``
+and their asynchronous versions) is archived. In *replay* mode, pages are
+read from the archive rather than downloaded, and pages that are not within
+the archive are errors:
+
+.. code-block:: python
+
+    from financeMacroFactors.companies import pageArchive
+    pageArchive.configureArchive('~/data/pages', compression='zstd')
+    getTickersFundamentalDataMW(tickers)                    # downloads and archives
+
+    pageArchive.configureArchive('~/data/pages', replay=True)
+    getTickersFundamentalDataMW(tickers, parseProcesses=8)  # no network access
+
+Replaying is only limited by the time taken to parse the pages, which can be
+spread over processes with ``parseProcesses``. The response cache should be
+disabled while replaying, or the cached results are returned without parsing
+the pages again.
+
+Pages are found by their exact URL. The prices of Yahoo! are the exception,
+as their URLs hold the start and end dates: when there is no page for the
+exact dates, the latest page of the same ticker and frequency whose dates
+cover the ones asked for is replayed instead (so that the rows may extend
+beyond them). A page whose end date is the time at which it was downloaded
+covers every later end date, since there were no later prices to download.
+'''
+
+import os
+import gzip
+import hashlib
+import logging
+import threading
+from datetime import datetime as dt
+from urllib.parse import urlsplit, parse_qs
+
+from financeMacroFactors.companies.scheduler import FetchError, FetchResult
+from financeMacroFactors.companies.responseCache import threadConnection, toTimestamp
+
+logBase = 'financeMacroFactors.companies.pageArchive.'
+
+compressions = ['gzip', 'zstd']
+
+def importZstandard():
+    'Internal function - do not use'
+
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('The zstd compression requires zstandard. '
+                          'Install it with "pip install financeMacroFactors[zstd]".')
+    return zstandard
+
+def compress(data, compression):
+    'Internal function - do not use'
+
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    return importZstandard().ZstdCompressor(level=10).compress(data)
+
+def decompress(blob, compression):
+    'Internal function - do not use'
+
+    if compression == 'gzip':
+        return gzip.decompress(blob)
+    return importZstandard().ZstdDecompressor().decompress(blob)
+
+class PageArchive:
+    '''a compressed, append-only archive of raw pages
+
+    Parameters
+    ----------
+    path : str
+        The folder within which the archive is stored (as ``pages.pack`` and
+        ``pages.sqlite``). It is created if it does not exist.
+    compression : str, optional
+        How new pages are compressed, either ``'gzip'`` or ``'zstd'``, by default
+        ``'gzip'``. Pages are always read with the compression with which they
+        were written.
+
+    Raises
+    ------
+    ValueError
+        If the compression is not one of the above.
+    ImportError
+        If ``'zstd'`` is asked for and ``zstandard`` is not installed.
+
+    Times are ``datetime.datetime`` or ``datetime.date`` objects, or seconds since
+    the epoch. The archive may be used by several threads and processes at the
+    same time.
+    '''
+
+    def __init__(self, path, compression='gzip'):
+
+        if compression not in compressions:
+            raise ValueError(f'Unknown compression {compression}. Should be one of {compressions}')
+        if compression == 'zstd':
+            importZstandard()
+
+        self.path        = os.path.abspath(os.path.expanduser(path))
+        self.packPath    = os.path.join(self.path, 'pages.pack')
+        self.compression = compression
+        self.local       = threading.local()
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path, exist_ok=True)
+
+        with self.connection() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS pages (
+                                url         TEXT NOT NULL,
+                                fetched     REAL NOT NULL,
+                                offset      INTEGER NOT NULL,
+                                length      INTEGER NOT NULL,
+                                size        INTEGER NOT NULL,
+                                compression TEXT NOT NULL,
+                                digest      TEXT NOT NULL,
+                                PRIMARY KEY (url, fetched)) WITHOUT ROWID''')
+
+    def connection(self):
+        'Internal function - do not use'
+
+        return threadConnection(self.local, os.path.join(self.path, 'pages.sqlite'))
+
+    def pack(self):
+        'Internal function - do not use'
+
+        # Every thread reads through its own handle, so that seeking in one
+        # thread does not move the position of another
+        pack = getattr(self.local, 'pack', None)
+        if pack is None:
+            pack = open(self.packPath, 'rb')
+            self.local.pack = pack
+        return pack
+
+    def put(self, url, text, fetched=None):
+        '''add a page to the archive
+
+        Parameters
+        ----------
+        url : str
+            The URL of the page
+        text : str
+            The text of the page
+        fetched : datetime or float or ``None``, optional
+            The time at which the page was downloaded, by default ``None`` for now
+
+        Returns
+        -------
+        bool
+            ``True`` if the text was written to the pack, and ``False`` if it is the
+            same as that of the last version of the page, which is reused
+        '''
+
+        fetched = toTimestamp(fetched)
+        data    = text.encode('utf-8')
+        digest  = hashlib.sha1(data).hexdigest()
+        conn    = self.connection()
+
+        # The page is appended while holding the write lock of the index, so
+        # that pages written by other processes cannot be interleaved with it
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            last = conn.execute('''SELECT offset, length, size, compression, digest FROM pages
+                                   WHERE url=? AND fetched<=? ORDER BY fetched DESC LIMIT 1''',
+                                (url, fetched)).fetchone()
+            written = (last is None) or (last[4] != digest)
+            if written:
+                blob = compress(data, self.compression)
+                with open(self.packPath, 'ab') as f:
+                    offset = f.seek(0, os.SEEK_END)
+                    f.write(blob)
+                last = (offset, len(blob), len(data), self.compression, digest)
+
+            conn.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)', (url, fetched) + tuple(last))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        return written
+
+    def get(self, url, when=None):
+        '''the text of a page
+
+        Parameters
+        ----------
+        url : str
+            The URL of the page
+        when : datetime or float or ``None``, optional
+            The point in time, by default ``None`` for the latest version
+
+        Returns
+        -------
+        str or None
+            The text of the last version of the page downloaded at or before
+            ``when``, or ``None`` if there is none
+        '''
+
+        query = 'SELECT offset, length, compression FROM pages WHERE url=?'
+        args  = (url,)
+        if when is not None:
+            query += ' AND fetched<=?'
+            args  += (toTimestamp(when),)
+
+        row = self.connection().execute(query + ' ORDER BY fetched DESC LIMIT 1', args).fetchone()
+        if row is None:
+            return None
+
+        offset, length, compression = row
+        pack = self.pack()
+        pack.seek(offset)
+        return decompress(pack.read(length), compression).decode('utf-8')
+
+    def versions(self, url):
+        '''the times at which a page was downloaded, oldest first'''
+
+        rows = self.connection().execute('SELECT fetched FROM pages WHERE url=? ORDER BY fetched', (url,))
+        return [dt.fromtimestamp(fetched) for fetched, in rows]
+
+    def urls(self, prefix=''):
+        '''the URLs within the archive that start with ``prefix``'''
+
+        rows = self.connection().execute('SELECT DISTINCT url FROM pages WHERE substr(url, 1, ?)=? ORDER BY url',
+                                         (len(prefix), prefix))
+        return [url for url, in rows]
+
+    def iterPages(self, prefix='', when=None):
+        '''the latest version of every page, as ``(url, text)`` pairs
+
+        Parameters
+        ----------
+        prefix : str, optional
+            Only the URLs that start with it, by default all of them
+        when : datetime or float or ``None``, optional
+            The point in time, by default ``None`` for the latest versions
+        '''
+
+        for url in self.urls(prefix):
+            text = self.get(url, when)
+            if text is not None:
+                yield url, text
+
+    def stats(self):
+        '''the number of versions of pages, their size, and the size of the pack'''
+
+        versions, size = self.connection().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages').fetchone()
+        packed = os.path.getsize(self.packPath) if os.path.exists(self.packPath) else 0
+        return {'versions': versions, 'bytes': size, 'packedBytes': packed}
+
+    def __len__(self):
+        return self.connection().execute('SELECT COUNT(DISTINCT url) FROM pages').fetchone()[0]
+
+activeArchive = None
+replayMode    = False
+replayTime    = None
+
+# A Yahoo! page whose end date is within this many seconds of the time at
+# which it was downloaded holds every price up to that time
+openEndSlack = 24*60*60
+
+def configureArchive(path, compression='gzip', replay=False, when=None):
+    '''enable the archive shared by all the downloaders
+
+    Parameters
+    ----------
+    path : str
+        The folder within which the archive is stored
+    compression : str, optional
+        How new pages are compressed, either ``'gzip'`` or ``'zstd'``, by default ``'gzip'``
+    replay : bool, optional
+        Read pages from the archive instead of downloading them, by default ``False``
+    when : datetime or float or ``None``, optional
+        In replay mode, the point in time of the pages, by default ``None`` for the
+        latest versions
+
+    Returns
+    -------
+    PageArchive
+        The archive that is now used by the downloaders
+    '''
+
+    global activeArchive, replayMode, replayTime
+    activeArchive = PageArchive(path, compression)
+    replayMode    = replay
+    replayTime    = when
+    return activeArchive
+
+def disableArchive():
+    '''stop the downloaders from using the archive'''
+
+    global activeArchive, replayMode, replayTime
+    activeArchive, replayMode, replayTime = None, False, None
+
+def getArchive():
+    '''the archive used by the downloaders, or ``None`` if it is disabled'''
+    return activeArchive
+
+def replaying():
+    '''``True`` if pages are read from the archive instead of being downloaded'''
+    return (activeArchive is not None) and replayMode
+
+def historyRange(url):
+    'Internal function - do not use'
+
+    # The URL without its query (which names the ticker), and the dates and
+    # frequency of a page of Yahoo! prices, or None for any other URL
+    parts = urlsplit(url)
+    path  = parts.path.rstrip('/').split('/')
+    if len(path) < 3 or path[-1] != 'history' or path[-3] != 'quote':
+        return None
+
+    query = parse_qs(parts.query)
+    try:
+        start, end = int(query['period1'][0]), int(query['period2'][0])
+        interval   = query['interval'][0]
+    except (KeyError, ValueError):
+        return None
+
+    return url.split('?')[0] + '?', start, end, interval
+
+def coveringPage(archive, url, when=None):
+    '''the archived Yahoo! page of prices that covers the dates of a URL
+
+    Parameters
+    ----------
+    archive : PageArchive
+        The archive to search
+    url : str
+        The URL of a page of prices, as made by ``getStockDataYahoo()``
+    when : datetime or float or ``None``, optional
+        The point in time, by default ``None`` for the latest versions
+
+    Returns
+    -------
+    str or None
+        The URL of the archived page of the same ticker and frequency whose dates
+        include those of ``url``, downloaded last, or ``None`` if there is none
+        (or if ``url`` is not a page of prices)
+    '''
+
+    wanted = historyRange(url)
+    if wanted is None:
+        return None
+
+    prefix, start, end, interval = wanted
+    limit = None if when is None else toTimestamp(when)
+    best  = None
+    for candidate in archive.urls(prefix):
+        found = historyRange(candidate)
+        if found is None or found[3] != interval or found[1] > start:
+            continue
+
+        fetched = [v.timestamp() for v in archive.versions(candidate)]
+        fetched = [f for f in fetched if limit is None or f <= limit]
+        if len(fetched) == 0:
+            continue
+
+        openEnded = found[2] >= fetched[-1] - openEndSlack
+        if (found[2] < end) and not openEnded:
+            continue
+
+        if best is None or fetched[-1] > best[0]:
+            best = (fetched[-1], candidate)
+
+    return None if best is None else best[1]
+
+def replayPage(url):
+    '''read a page from the active archive, in replay mode
+
+    Pages of Yahoo! prices that are not within the archive for the exact dates
+    of ``url`` are replaced by the page that covers them (see ``coveringPage()``).
+
+    Raises
+    ------
+    FetchError
+        If the page is not within the archive (or could not be read). The error
+        is permanent, as replaying again does not change that.
+    '''
+
+    try:
+        text = activeArchive.get(url, replayTime)
+        if text is None:
+            covering = coveringPage(activeArchive, url, replayTime)
+            if covering is not None:
+                logging.getLogger(logBase + 'replayPage').debug('Replaying [%s] in place of [%s]', covering, url)
+                text = activeArchive.get(covering, replayTime)
+        error = None if text is not None else LookupError(f'[{url}] is not within the page archive')
+    except Exception as e:
+        text, error = None, e
+
+    if error is not None:
+        raise FetchError(FetchResult(url, error=error, transient=False))
+
+    logging.getLogger(logBase + 'replayPage').debug('Replayed [%s]', url)
+    return text
+
+def archivePage(url, text):
+    '''write a downloaded page to the active archive
+
+    Nothing is stored when the archive is disabled. Problems with the archive are
+    logged and otherwise ignored, so that they never prevent a download.
+    '''
+
+    archive = activeArchive
+    if archive is None:
+        return
+
+    try:
+        archive.put(url, text)
+    except Exception as e:
+        logging.getLogger(logBase + 'archivePage').error(f'Unable to archive [{url}]: {e}')
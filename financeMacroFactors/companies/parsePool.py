@@ -0,0 +1,194 @@
+'''Parsing of pages in a pool of processes
+
+Parsing the tables of a page is CPU bound Python code, and the threads that
+download pages all share a single core for it because of the GIL. A
+``ParserPool`` hands the pages to a pool of worker processes instead, so
+that parsing scales with the number of cores.
+
+Sending the parsed tables back as lists of lists of Python objects would
+cost almost as much pickling as the parsing saves. The workers send back a
+compact form instead: the labels and headers as lists of strings, all the
+numbers of a page in one ``float64`` array, and the dates as one
+``datetime64[D]`` array. The lists of lists that ``parseMWPage()`` and
+``parseStockDataYahoo()`` return are rebuilt from these in the calling
+process.
+
+    with ParserPool(8) as pool:
+        futures = [pool.submit('marketwatch', page) for page in pages]
+        results = [future.result() for future in futures]
+'''
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, Future
+
+from financeMacroFactors.companies import marketWarchData as mw
+from financeMacroFactors.companies import yahooData
+
+def compactMWPage(page, convert=True):
+    '''parse a Marketwatch page into its compact form
+
+    Parameters
+    ----------
+    page : str or bytes
+        The HTML of the page
+    convert : bool, optional
+        Convert the values into numbers, by default ``True``
+
+    Returns
+    -------
+    tuple or None
+        ``(header, labels, lengths, values, failed, texts)``, or ``None`` if the
+        page has no tables. ``values`` and ``failed`` hold the cells of all the rows
+        one after the other (``lengths`` of them for each row), and ``texts`` the
+        original text of the cells that are not numbers (all of them if ``convert``
+        is ``False``).
+    '''
+
+    allData = mw.parseMWPage(page, convert=False)
+    if not allData:
+        return None
+
+    rows    = allData[1:]
+    labels  = [row[0] for row in rows]
+    lengths = np.array([len(row) - 1 for row in rows], dtype=np.int32)
+    cells   = [d for row in rows for d in row[1:]]
+
+    if convert:
+        values, failed = mw.convertNumbersMW(cells)
+    else:
+        values, failed = np.full(len(cells), np.nan), np.ones(len(cells), dtype=bool)
+    texts = [cells[i] for i in np.flatnonzero(failed)]
+
+    return allData[0], labels, lengths, values, np.packbits(failed), texts
+
+def expandMWPage(compact):
+    '''rebuild the result of ``parseMWPage()`` from its compact form'''
+
+    if compact is None:
+        return []
+
+    header, labels, lengths, values, failed, texts = compact
+    failed = np.unpackbits(failed, count=len(values)).astype(bool)
+
+    cells = np.array(values, dtype=object)
+    cells[failed] = texts
+    cells = cells.tolist() if len(texts) else values.tolist()
+
+    allData = [header]
+    k = 0
+    for label, n in zip(labels, lengths.tolist()):
+        allData.append([label] + cells[k:k+n])
+        k += n
+
+    return allData
+
+def compactYahooPage(page, convert=True):
+    '''parse a Yahoo! history page into its compact form
+
+    Returns
+    -------
+    tuple or None
+        ``(header, dates, values)`` where ``dates`` is a ``datetime64[D]`` array if
+        ``convert`` is ``True`` (and a list of strings otherwise), and ``values`` is a
+        (rows x 6) ``float64`` array. ``None`` is returned if the page has no tables.
+    '''
+
+    allData = yahooData.parseStockDataYahoo(page, 'datetime64' if convert else False)
+    if not allData:
+        return None
+
+    rows   = allData[1:]
+    dates  = [row[0] for row in rows]
+    values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), -1)
+    if convert:
+        dates = np.array(dates, dtype='datetime64[D]')
+
+    return allData[0], dates, values
+
+def expandYahooPage(compact):
+    '''rebuild the result of ``parseStockDataYahoo()`` from its compact form'''
+
+    if compact is None:
+        return []
+
+    header, dates, values = compact
+    if isinstance(dates, np.ndarray):
+        dates = dates.astype('datetime64[us]').tolist()
+
+    return [header] + [[d] + v for d, v in zip(dates, values.tolist())]
+
+parsers = {
+    'marketwatch' : (compactMWPage,    expandMWPage),
+    'yahoo'       : (compactYahooPage, expandYahooPage),
+}
+
+class ParserPool:
+    '''a pool of processes that parse pages
+
+    Parameters
+    ----------
+    processes : int or ``None``, optional
+        The number of worker processes, by default ``None``, in which case
+        ``os.cpu_count()`` is used
+    '''
+
+    def __init__(self, processes=None):
+
+        self.processes = processes or os.cpu_count() or 1
+        self.executor  = ProcessPoolExecutor(max_workers=self.processes)
+
+    def submit(self, kind, page, convert=True):
+        '''start parsing a page
+
+        Parameters
+        ----------
+        kind : str
+            Either ``'marketwatch'`` or ``'yahoo'``
+        page : str or bytes
+            The HTML of the page. Strings are sent to the workers encoded as UTF-8.
+        convert : bool, optional
+            Convert the values (and for Yahoo!, the dates), by default ``True``
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The future result of ``parseMWPage()`` or ``parseStockDataYahoo()``
+        '''
+
+        compact, expand = parsers[kind]
+        if isinstance(page, str):
+            page = page.encode('utf-8')
+
+        result = Future()
+
+        def done(future):
+            try:
+                result.set_result(expand(future.result()))
+            except Exception as e:
+                result.set_exception(e)
+
+        self.executor.submit(compact, page, convert).add_done_callback(done)
+
+        return result
+
+    def parse(self, kind, page, convert=True):
+        '''parse a page, waiting for the result'''
+        return self.submit(kind, page, convert).result()
+
+    def map(self, kind, pages, convert=True):
+        '''parse a number of pages, returning the results in the same order'''
+
+        futures = [self.submit(kind, page, convert) for page in pages]
+        return [future.result() for future in futures]
+
+    def close(self):
+        '''stop the worker processes'''
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
@@ -0,0 +1,196 @@
+'''Memory-mapped archive of the prices of many tickers
+
+The prices returned by ``getStockDataYahoo()`` are lists of lists of Python
+objects, which take more than 100 bytes for every value. Decades of daily
+prices for thousands of tickers do not fit into memory in that form. A price
+archive stores them in a folder as one contiguous binary file per field,
+with the rows of all the tickers one after the other:
+
+- ``date.i8``: the dates, as the number of days since 1970-01-01 (``int64``)
+- ``open.f8``, ``high.f8``, ``low.f8``, ``close.f8``, ``adjClose.f8`` (``float64``)
+- ``volume.i8`` (``int64``)
+- ``offsets.i8``: the row at which each ticker starts, followed by the total number of rows
+- ``tickers.json``: the tickers, in the same order as the offsets
+
+A ``PriceArchive`` opens these files with ``numpy.memmap``. Slicing the prices
+of a ticker, or of a range of dates, does not copy or read anything but the
+pages that are actually used.
+'''
+
+import os
+import json
+import logging
+import numpy as np
+
+from financeMacroFactors.companies.priceStore import toRecords, toEpochDay
+
+logBase = 'financeMacroFactors.companies.priceArchive.'
+
+archiveFields = {
+    'date'     : '<i8',
+    'open'     : '<f8',
+    'high'     : '<f8',
+    'low'      : '<f8',
+    'close'    : '<f8',
+    'adjClose' : '<f8',
+    'volume'   : '<i8',
+}
+
+def fieldPath(folder, field):
+    'Internal function - do not use'
+    return os.path.join(folder, f'{field}.{archiveFields[field][1:]}')
+
+def writePriceArchive(folder, prices):
+    '''write the prices of many tickers into an archive
+
+    The tickers are written one at a time, so that only the prices of a single
+    ticker need to be in memory at any time. An existing archive in the same
+    folder is overwritten.
+
+    Parameters
+    ----------
+    folder : str
+        The folder of the archive. It is created if it does not exist.
+    prices : dict or iterable of tuples
+        Maps each ticker to its prices, or yields ``(ticker, prices)`` tuples. The
+        prices are either in the form returned by ``getStockDataYahoo()`` (with
+        ``convert=True``) or records as used by ``PriceStore``.
+
+    Returns
+    -------
+    int
+        The total number of rows written
+    '''
+
+    logger = logging.getLogger(logBase + 'writePriceArchive')
+
+    folder = os.path.abspath(os.path.expanduser(folder))
+    os.makedirs(folder, exist_ok=True)
+
+    if isinstance(prices, dict):
+        prices = prices.items()
+
+    files   = {field: open(fieldPath(folder, field) + '.tmp', 'wb') for field in archiveFields}
+    tickers = []
+    offsets = [0]
+    try:
+        for ticker, data in prices:
+            records = data if isinstance(data, np.ndarray) else toRecords(data)
+            for field, dtype in archiveFields.items():
+                values = records[field]
+                if dtype == '<i8':
+                    values = np.rint(values)
+                files[field].write(values.astype(dtype).tobytes())
+
+            tickers.append(ticker)
+            offsets.append(offsets[-1] + len(records))
+            logger.debug('%d rows written for [%s]', len(records), ticker)
+    finally:
+        for f in files.values():
+            f.close()
+
+    for field in archiveFields:
+        os.replace(fieldPath(folder, field) + '.tmp', fieldPath(folder, field))
+
+    np.array(offsets, dtype='<i8').tofile(os.path.join(folder, 'offsets.i8'))
+    with open(os.path.join(folder, 'tickers.json'), 'w') as f:
+        json.dump(tickers, f)
+
+    return offsets[-1]
+
+class PriceArchive:
+    '''read-only, memory-mapped access to a price archive
+
+    Parameters
+    ----------
+    folder : str
+        The folder of an archive written by ``writePriceArchive()``
+
+    Attributes
+    ----------
+    tickers : list of str
+        The tickers within the archive
+    offsets : numpy 1d-array
+        The row at which each ticker starts, followed by the total number of rows
+    fields : dict
+        Maps each field to a ``numpy.memmap`` of all its rows. The ``date`` field
+        is a ``datetime64[D]`` view.
+    '''
+
+    def __init__(self, folder):
+
+        self.folder = os.path.abspath(os.path.expanduser(folder))
+
+        with open(os.path.join(self.folder, 'tickers.json')) as f:
+            self.tickers = json.load(f)
+        self.offsets = np.fromfile(os.path.join(self.folder, 'offsets.i8'), dtype='<i8')
+        self.index   = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+        self.fields = {}
+        for field, dtype in archiveFields.items():
+            if self.offsets[-1] == 0:
+                self.fields[field] = np.zeros(0, dtype=dtype)
+            else:
+                self.fields[field] = np.memmap(fieldPath(self.folder, field), dtype=dtype, mode='r')
+        self.fields['date'] = self.fields['date'].view('datetime64[D]')
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def __contains__(self, ticker):
+        return ticker in self.index
+
+    def rows(self, ticker, startDate=None, endDate=None):
+        '''the range of rows that hold the prices of a ticker
+
+        Parameters
+        ----------
+        ticker : str
+            The ticker
+        startDate : datetime.datetime or ``None``, optional
+            The first date to include, by default ``None`` for no limit
+        endDate : datetime.datetime or ``None``, optional
+            The last date to include, by default ``None`` for no limit
+
+        Returns
+        -------
+        slice
+            The rows within every field
+        '''
+
+        i = self.index[ticker]
+        start, end = int(self.offsets[i]), int(self.offsets[i+1])
+
+        # The dates of every ticker are sorted
+        dates = self.fields['date'][start:end].view('<i8')
+        first = 0 if startDate is None else int(np.searchsorted(dates, toEpochDay(startDate), 'left'))
+        last  = len(dates) if endDate is None else int(np.searchsorted(dates, toEpochDay(endDate), 'right'))
+
+        return slice(start + first, start + max(first, last))
+
+    def slice(self, ticker, startDate=None, endDate=None, fields=None):
+        '''the prices of a ticker, without copying them
+
+        Parameters
+        ----------
+        ticker : str
+            The ticker
+        startDate : datetime.datetime or ``None``, optional
+            The first date to include, by default ``None`` for no limit
+        endDate : datetime.datetime or ``None``, optional
+            The last date to include, by default ``None`` for no limit
+        fields : list of str or ``None``, optional
+            The fields to return, by default ``None`` for all of them
+
+        Returns
+        -------
+        dict
+            Maps each field to a view of the memory-mapped file. The views are
+            read-only.
+        '''
+
+        rows = self.rows(ticker, startDate, endDate)
+        if fields is None:
+            fields = list(archiveFields)
+
+        return {field: self.fields[field][rows] for field in fields}
@@ -0,0 +1,334 @@
+'''Local store of daily stock prices
+
+Refreshing years of price history for many companies every day would mean
+downloading almost exactly the same data over and over. A ``PriceStore``
+keeps the daily prices of every ticker in a file of its own, and remembers
+the last date that has been stored (the high-water mark). ``sync()`` only
+asks Yahoo! for the dates after that, and appends the new rows to the end
+of the file. Weekly and monthly prices are built from the stored daily
+prices, rather than being downloaded separately.
+
+Each file is a sequence of fixed size binary records (see ``recordType``),
+sorted by date. Dates are stored as the number of days since 1970-01-01.
+'''
+
+import os
+import logging
+import numpy as np
+from datetime import datetime as dt
+from datetime import timedelta as tDel
+
+from financeMacroFactors.companies.yahooData import getStockDataYahoo
+
+logBase = 'financeMacroFactors.companies.priceStore.'
+
+yahooHeader = ['Date', 'Open', 'High', 'Low', 'Close*', 'Adj. close**', 'Volume']
+
+recordType = np.dtype([
+    ('date',     '<i8'),
+    ('open',     '<f8'),
+    ('high',     '<f8'),
+    ('low',      '<f8'),
+    ('close',    '<f8'),
+    ('adjClose', '<f8'),
+    ('volume',   '<f8'),
+])
+
+monthNames = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+def toRecords(allData):
+    '''convert the output of ``getStockDataYahoo()`` into records
+
+    Parameters
+    ----------
+    allData : list of list
+        Data as returned by ``getStockDataYahoo()`` with ``convert=True``
+
+    Returns
+    -------
+    numpy structured array
+        The records of type ``recordType``, sorted by date
+    '''
+
+    rows    = allData[1:]
+    records = np.zeros(len(rows), dtype=recordType)
+    if len(rows) == 0:
+        return records
+
+    records['date'] = np.array([r[0] for r in rows], dtype='datetime64[D]').astype(np.int64)
+    values = np.array([r[1:7] for r in rows], dtype=np.float64)
+    for i, field in enumerate(recordType.names[1:]):
+        records[field] = values[:, i]
+
+    return records[np.argsort(records['date'], kind='stable')]
+
+def toYahooList(records, convert=True):
+    '''convert records into the form returned by ``getStockDataYahoo()``
+
+    Parameters
+    ----------
+    records : numpy structured array
+        Records of type ``recordType``, sorted by date
+    convert : bool, optional
+        If ``True`` dates are returned as ``datetime.datetime`` objects, otherwise
+        as strings in the form that Yahoo! uses, by default ``True``
+
+    Returns
+    -------
+    list of list
+        The header followed by one row per record, latest date first.
+    '''
+
+    records = records[::-1]
+    dates   = records['date'].astype('datetime64[D]').astype('datetime64[us]').tolist()
+    if not convert:
+        dates = [f'{d.day} {monthNames[d.month-1]} {d.year}' for d in dates]
+
+    values  = np.stack([records[f] for f in recordType.names[1:]], axis=1).tolist()
+    allData = [list(yahooHeader)] + [[d] + v for d, v in zip(dates, values)]
+
+    return allData
+
+def resample(records, frequency='1mo'):
+    '''aggregate daily records into weekly or monthly records
+
+    The aggregation follows Yahoo!: a week starts on a Monday and a month on
+    its first day, and the record of a period is dated at its start. The open
+    is the first open of the period, the high and low are the extremes, the
+    close and adjusted close are the last of the period, and the volumes are
+    added up.
+
+    Parameters
+    ----------
+    records : numpy structured array
+        Daily records of type ``recordType``, sorted by date
+    frequency : str, optional
+        One of ``'1d'``, ``'1wk'`` or ``'1mo'``, by default ``'1mo'``
+
+    Returns
+    -------
+    numpy structured array
+        The aggregated records
+    '''
+
+    if (frequency == '1d') or (len(records) == 0):
+        return records.copy()
+
+    days = records['date']
+    if frequency == '1wk':
+        # 1970-01-01 was a Thursday
+        periods = days - (days + 3) % 7
+    elif frequency == '1mo':
+        periods = days.astype('datetime64[D]').astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+    else:
+        raise ValueError(f'Unknown frequency {frequency}')
+
+    starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+    ends   = np.r_[starts[1:], len(records)] - 1
+
+    result = np.zeros(len(starts), dtype=recordType)
+    result['date']     = periods[starts]
+    result['open']     = records['open'][starts]
+    result['high']     = np.maximum.reduceat(records['high'], starts)
+    result['low']      = np.minimum.reduceat(records['low'], starts)
+    result['close']    = records['close'][ends]
+    result['adjClose'] = records['adjClose'][ends]
+    result['volume']   = np.add.reduceat(records['volume'], starts)
+
+    return result
+
+class PriceStore:
+    '''a folder of daily prices, one append-only file per ticker
+
+    Parameters
+    ----------
+    folder : str
+        The folder within which the prices are stored. It is created if
+        it does not exist.
+    '''
+
+    def __init__(self, folder):
+
+        self.folder = os.path.abspath(os.path.expanduser(folder))
+        os.makedirs(self.folder, exist_ok=True)
+
+    def path(self, ticker):
+        '''the file within which the prices of ``ticker`` are stored'''
+        return os.path.join(self.folder, f'{ticker}.prices')
+
+    def load(self, ticker, startDate=None, endDate=None):
+        '''the stored daily records of a ticker
+
+        Parameters
+        ----------
+        ticker : str
+            The ticker
+        startDate : datetime.datetime or ``None``, optional
+            The first date to return, by default ``None`` for no limit
+        endDate : datetime.datetime or ``None``, optional
+            The last date to return, by default ``None`` for no limit
+
+        Returns
+        -------
+        numpy structured array
+            Records of type ``recordType`` sorted by date. This is empty if nothing
+            has been stored for the ticker.
+        '''
+
+        path = self.path(ticker)
+        if not os.path.exists(path):
+            return np.zeros(0, dtype=recordType)
+
+        records = np.fromfile(path, dtype=recordType)
+        if startDate is not None:
+            records = records[records['date'] >= toEpochDay(startDate)]
+        if endDate is not None:
+            records = records[records['date'] <= toEpochDay(endDate)]
+
+        return records
+
+    def highWaterMark(self, ticker):
+        '''the last date stored for a ticker, or ``None`` if there is none'''
+
+        path = self.path(ticker)
+        if (not os.path.exists(path)) or (os.path.getsize(path) < recordType.itemsize):
+            return None
+
+        with open(path, 'rb') as f:
+            f.seek(-recordType.itemsize, os.SEEK_END)
+            last = np.frombuffer(f.read(recordType.itemsize), dtype=recordType)[0]
+
+        return np.datetime64(int(last['date']), 'D').astype('datetime64[us]').tolist()
+
+    def append(self, ticker, records):
+        '''add new daily records to the end of the file of a ticker
+
+        Records are only ever written at the end of a file. If the new records
+        start on or before the last stored date (for example because the price of
+        the latest, still open, trading day has changed), the stored records from
+        that date onwards are replaced.
+
+        Parameters
+        ----------
+        ticker : str
+            The ticker
+        records : numpy structured array
+            Records of type ``recordType``, sorted by date
+
+        Returns
+        -------
+        int
+            The number of records written
+        '''
+
+        if len(records) == 0:
+            return 0
+
+        path = self.path(ticker)
+        if os.path.exists(path):
+            dates = np.memmap(path, dtype=recordType, mode='r')['date'] \
+                    if os.path.getsize(path) else np.zeros(0, dtype=np.int64)
+            keep  = int(np.searchsorted(dates, records['date'][0]))
+            del dates
+            if keep * recordType.itemsize < os.path.getsize(path):
+                os.truncate(path, keep * recordType.itemsize)
+
+        with open(path, 'ab') as f:
+            f.write(records.tobytes())
+
+        return len(records)
+
+    def sync(self, ticker, startDate=None, endDate=None):
+        '''download the daily prices of a ticker that are not stored yet
+
+        Only the dates from the high-water mark (inclusive, so that the latest
+        trading day is refreshed) to ``endDate`` are requested.
+
+        Parameters
+        ----------
+        ticker : str
+            The ticker
+        startDate : datetime.datetime or ``None``, optional
+            Where to start when nothing is stored for the ticker yet, by default
+            ``None``, in which case ``dt.now()-tDel(365)`` is used.
+        endDate : datetime.datetime or ``None``, optional
+            The last date to request, by default ``None``, in which case ``dt.now()``
+            is used.
+
+        Returns
+        -------
+        int or None
+            The number of records written, or ``None`` if the prices could not be
+            obtained.
+        '''
+
+        logger = logging.getLogger(logBase + 'sync')
+
+        if endDate is None:
+            endDate = dt.now()
+
+        mark = self.highWaterMark(ticker)
+        if mark is not None:
+            startDate = mark
+        elif startDate is None:
+            startDate = endDate - tDel(365)
+
+        if startDate > endDate:
+            return 0
+
+        allData = getStockDataYahoo(ticker, startDate, endDate, frequency='1d')
+        if allData == []:
+            logger.error(f'Unable to obtain prices for [{ticker}] from {startDate} to {endDate}')
+            return None
+
+        records = toRecords(allData)
+        records = records[records['date'] >= toEpochDay(startDate)]
+        written = self.append(ticker, records)
+        logger.debug('%d records written for [%s]', written, ticker)
+
+        return written
+
+    def getStockData(self, ticker, startDate=None, endDate=None, frequency='1mo', convert=True):
+        '''stored prices in the form returned by ``getStockDataYahoo()``
+
+        The weekly and monthly prices are aggregated from the stored daily prices
+        (see ``resample()``). Nothing is downloaded. Use ``sync()`` first to bring
+        the stored prices up to date.
+
+        Parameters
+        ----------
+        ticker : str
+            The ticker
+        startDate : datetime.datetime or ``None``, optional
+            The first date to return, by default ``None`` for no limit
+        endDate : datetime.datetime or ``None``, optional
+            The last date to return, by default ``None`` for no limit
+        frequency : str, optional
+            One of ``'1d'``, ``'1wk'`` or ``'1mo'``, by default ``'1mo'``
+        convert : bool, optional
+            Return dates as ``datetime.datetime`` objects rather than strings, by
+            default ``True``
+
+        Returns
+        -------
+        list of list
+            The prices, latest first, or an empty list if nothing is stored or the
+            frequency is not known.
+        '''
+
+        logger = logging.getLogger(logBase + 'getStockData')
+
+        possibleFrequencies = ['1d', '1wk', '1mo']
+        if frequency not in possibleFrequencies:
+            logger.error(f'Incorrect frequency supplied {frequency}. Should be one of {possibleFrequencies}')
+            return []
+
+        records = self.load(ticker, startDate, endDate)
+        if len(records) == 0:
+            return []
+
+        return toYahooList(resample(records, frequency), convert=convert)
+
+def toEpochDay(date):
+    'Internal function - do not use'
+    return int(np.datetime64(date, 'D').astype(np.int64))
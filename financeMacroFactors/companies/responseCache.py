@@ -0,0 +1,333 @@
+'''Persistent cache for the results of the data downloaders
+
+Fundamental data change once a quarter, and the list of S&P 500 companies
+only a few times a year. There is thus little point in downloading and
+parsing the same pages over and over again. This module provides a cache
+on disk that is shared by all the downloaders in this package. The parsed
+results are stored, keyed by the URL and the parameters that were used for
+parsing. Each source of data has its own time-to-live, and the least
+recently used entries are evicted when the cache grows beyond its byte
+budget.
+
+The cache is stored within an SQLite database, and may be used by several
+threads and processes at the same time. It is disabled by default. Enable
+it with ``configureCache()``:
+
+.. code-block:: python
+
+    from financeMacroFactors.companies import responseCache
+    responseCache.configureCache('~/.cache/financeMacroFactors/responses.sqlite')
+
+'''
+
+import os
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime as dt
+from datetime import date
+
+logBase = 'financeMacroFactors.companies.responseCache.'
+
+day = 24*60*60
+
+defaultTTLs = {
+    'marketwatch' : 7*day,
+    'yahoo'       : 0.5*day,
+    'wikipedia'   : 7*day,
+}
+
+defaultPath = os.path.join('~', '.cache', 'financeMacroFactors', 'responses.sqlite')
+
+def threadConnection(local, path):
+    '''the connection of the current thread to an SQLite file
+
+    SQLite connections cannot be shared between threads, so every thread gets
+    its own connection to the same file, which is kept within ``local`` (a
+    ``threading.local`` object). The connection is in autocommit mode, so that
+    transactions are started explicitly, and the file is in WAL mode, so that
+    it may be read while it is written by other threads and processes.
+
+    This is shared by the SQLite stores of this package (the response cache,
+    the page archive and the fundamental store).
+    '''
+
+    conn = getattr(local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        local.conn = conn
+    return conn
+
+def toTimestamp(when):
+    '''seconds since the epoch, from a ``datetime.datetime`` or ``datetime.date``
+    object, a number, or ``None`` for now'''
+
+    if when is None:
+        return time.time()
+    if isinstance(when, dt):
+        return when.timestamp()
+    if isinstance(when, date):
+        return dt(when.year, when.month, when.day).timestamp()
+    return float(when)
+
+class ResponseCache:
+    '''an on-disk cache of parsed responses
+
+    Parameters
+    ----------
+    path : str
+        The SQLite file within which the cache is stored. The folder is created
+        if it does not exist.
+    maxBytes : int, optional
+        The maximum size of all the stored values, by default 256 MB. When this
+        is exceeded, the least recently used entries are evicted.
+    ttls : dict or ``None``, optional
+        Time-to-live in seconds for each source, by default ``None``, in which
+        case ``defaultTTLs`` is used. Sources that are not present never expire.
+    '''
+
+    def __init__(self, path, maxBytes=256*1024*1024, ttls=None):
+
+        self.path     = os.path.abspath(os.path.expanduser(path))
+        self.maxBytes = maxBytes
+        self.ttls     = dict(defaultTTLs if ttls is None else ttls)
+        self.local    = threading.local()
+
+        folder = os.path.dirname(self.path)
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+
+        with self.connection() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS responses (
+                                key      TEXT PRIMARY KEY,
+                                source   TEXT NOT NULL,
+                                created  REAL NOT NULL,
+                                accessed REAL NOT NULL,
+                                size     INTEGER NOT NULL,
+                                value    BLOB NOT NULL)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS responsesAccessed ON responses (accessed)')
+
+    def connection(self):
+        'Internal function - do not use'
+
+        return threadConnection(self.local, self.path)
+
+    @staticmethod
+    def makeKey(source, url, params=None):
+        '''the key under which a response is stored'''
+
+        params = sorted((params or {}).items())
+        text   = json.dumps([source, url, params], default=str)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get(self, source, url, params=None):
+        '''obtain a stored response
+
+        Parameters
+        ----------
+        source : str
+            The source of the data, (e.g. ``'marketwatch'``). This decides the
+            time-to-live of the entry.
+        url : str
+            The URL from which the data were obtained
+        params : dict or ``None``, optional
+            Any other parameters that change the stored result, by default ``None``
+
+        Returns
+        -------
+        tuple
+            A tuple ``(found, value)``. If the entry is not present or has expired,
+            ``found`` is ``False`` and ``value`` is ``None``.
+        '''
+
+        key  = self.makeKey(source, url, params)
+        now  = time.time()
+        conn = self.connection()
+
+        row = conn.execute('SELECT created, value FROM responses WHERE key=?', (key,)).fetchone()
+        if row is None:
+            return False, None
+
+        created, value = row
+        ttl = self.ttls.get(source)
+        if (ttl is not None) and (now - created > ttl):
+            conn.execute('DELETE FROM responses WHERE key=? AND created=?', (key, created))
+            return False, None
+
+        conn.execute('UPDATE responses SET accessed=? WHERE key=?', (now, key))
+        return True, pickle.loads(value)
+
+    def put(self, source, url, value, params=None):
+        '''store a response
+
+        The arguments are the same as those of ``get()``, along with the value
+        that is to be stored. The value must be picklable. After the value is
+        stored, the least recently used entries are evicted until the cache is
+        within its byte budget.
+        '''
+
+        key  = self.makeKey(source, url, params)
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now  = time.time()
+        conn = self.connection()
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (key, source, now, now, len(blob), blob))
+            self.evict(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def evict(self, conn):
+        'Internal function - do not use'
+
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.maxBytes:
+            return
+
+        excess = total - self.maxBytes
+        keys   = []
+        for key, size in conn.execute('SELECT key, size FROM responses ORDER BY accessed'):
+            keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+
+        conn.executemany('DELETE FROM responses WHERE key=?', keys)
+        logging.getLogger(logBase + 'evict').debug('Evicted %d entries', len(keys))
+
+    def totalBytes(self):
+        '''the total size of all the stored values'''
+        return self.connection().execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def clear(self, source=None):
+        '''remove all the entries, or only those from ``source``'''
+
+        if source is None:
+            self.connection().execute('DELETE FROM responses')
+        else:
+            self.connection().execute('DELETE FROM responses WHERE source=?', (source,))
+
+activeCache = None
+
+def configureCache(path=defaultPath, maxBytes=256*1024*1024, ttls=None):
+    '''enable the cache shared by all the downloaders
+
+    Parameters
+    ----------
+    path : str, optional
+        The SQLite file within which the cache is stored, by default
+        ``~/.cache/financeMacroFactors/responses.sqlite``
+    maxBytes : int, optional
+        The byte budget of the cache, by default 256 MB
+    ttls : dict or ``None``, optional
+        Time-to-live in seconds for each source, by default ``None``, in which
+        case ``defaultTTLs`` is used.
+
+    Returns
+    -------
+    ResponseCache
+        The cache that is now used by the downloaders
+    '''
+
+    global activeCache
+    activeCache = ResponseCache(path, maxBytes=maxBytes, ttls=ttls)
+    return activeCache
+
+def disableCache():
+    '''stop the downloaders from using the cache'''
+
+    global activeCache
+    activeCache = None
+
+def getCache():
+    '''the cache used by the downloaders, or ``None`` if it is disabled'''
+    return activeCache
+
+def lookup(source, url, params=None):
+    '''read an entry from the active cache
+
+    Returns
+    -------
+    tuple
+        A tuple ``(found, value)``. ``found`` is ``False`` when the cache is
+        disabled, when the entry is missing or has expired, and when the cache
+        could not be read (in which case an error is logged).
+    '''
+
+    logger = logging.getLogger(logBase + 'lookup')
+
+    cache = activeCache
+    if cache is None:
+        return False, None
+
+    try:
+        found, value = cache.get(source, url, params)
+        if found:
+            logger.debug('Cache hit for [%s]', url)
+        return found, value
+    except Exception as e:
+        logger.error(f'Unable to read [{url}] from the cache: {e}')
+        return False, None
+
+def store(source, url, value, params=None):
+    '''write an entry to the active cache
+
+    Nothing is stored when the cache is disabled, or when the value is empty,
+    since the downloaders signal errors with empty results, and errors should
+    not be cached. Problems with the cache are logged and otherwise ignored.
+    '''
+
+    logger = logging.getLogger(logBase + 'store')
+
+    cache = activeCache
+    if (cache is None) or (not value):
+        return
+
+    try:
+        cache.put(source, url, value, params)
+    except Exception as e:
+        logger.error(f'Unable to write [{url}] to the cache: {e}')
+
+def cachedCall(source, url, params, compute):
+    '''return a cached result, or compute and cache it
+
+    When the cache is enabled and holds a valid entry for ``(source, url, params)``,
+    it is returned. Otherwise ``compute()`` is called and its result is stored
+    (see ``store()``). Problems with the cache itself never prevent the result from
+    being computed.
+
+    Parameters
+    ----------
+    source : str
+        The source of the data
+    url : str
+        The URL from which the data are obtained
+    params : dict or ``None``
+        Any other parameters that change the result
+    compute : callable
+        A function without arguments that computes the result
+
+    Returns
+    -------
+    object
+        The (possibly cached) result
+    '''
+
+    found, value = lookup(source, url, params)
+    if found:
+        return value
+
+    value = compute()
+    store(source, url, value, params)
+
+    return value
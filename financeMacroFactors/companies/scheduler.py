@@ -0,0 +1,555 @@
+'''Scheduling of the requests made to every host
+
+All the downloads, whichever their source, go through a single
+``RequestScheduler``. For every host it keeps
+
+- a token bucket, that limits the rate of requests (by default unlimited),
+- a concurrency limit that adapts to the host: it grows by one for every
+  window of successful requests, and is halved when the host throttles
+  (``429``), fails (``5xx``), times out, or becomes slower than a target
+  latency (additive increase, multiplicative decrease),
+
+and it retries transient failures after an exponential delay with random
+jitter, honouring any ``Retry-After`` header. The outcome of a download is a
+``FetchResult``, which separates transient failures (that may succeed if
+tried later) from permanent ones (such as a missing page). The downloaders
+raise a ``FetchError`` carrying this result.
+
+The scheduler is shared by all the downloaders. Set its parameters with
+``configureScheduler()``:
+
+    from financeMacroFactors.companies import scheduler
+    scheduler.configureScheduler(rate=5, burst=10, hostRates={'sg.finance.yahoo.com': 1})
+'''
+
+import time
+import random
+import asyncio
+import logging
+import threading
+from urllib.parse import urlsplit
+
+import requests
+
+from financeMacroFactors import instrumentation
+
+logBase = 'financeMacroFactors.companies.scheduler.'
+
+retryStatusCodes = [429, 500, 502, 503, 504]
+
+class TokenBucket:
+    '''a token bucket that limits the rate of requests
+
+    Tokens are added at ``rate`` per second, up to ``burst`` of them. Every
+    request takes one token, waiting for it if there is none.
+
+    Parameters
+    ----------
+    rate : float or ``None``
+        The number of requests per second, or ``None`` for no limit
+    burst : int, optional
+        The number of requests that can be made at once, by default 1
+    '''
+
+    def __init__(self, rate, burst=1):
+        self.rate    = rate
+        self.burst   = max(burst, 1)
+        self.tokens  = float(self.burst)
+        self.updated = time.monotonic()
+        self.resume  = 0.0
+        self.lock    = threading.Lock()
+
+    def reserve(self):
+        '''take a token, returning the number of seconds to wait before using it'''
+
+        with self.lock:
+            now   = time.monotonic()
+            pause = max(self.resume - now, 0.0)
+            if self.rate is None:
+                return pause
+
+            self.tokens  = min(self.burst, self.tokens + (now - self.updated)*self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(pause, -self.tokens/self.rate)
+
+    def pause(self, seconds):
+        '''do not hand out tokens for the next ``seconds`` seconds'''
+
+        with self.lock:
+            self.resume = max(self.resume, time.monotonic() + seconds)
+
+class HostState:
+    '''the token bucket and adaptive concurrency limit of a single host
+
+    Parameters
+    ----------
+    bucket : TokenBucket
+        The limit on the rate of requests to the host
+    concurrency : int
+        The initial number of concurrent requests
+    minConcurrency : int
+        The smallest number of concurrent requests
+    maxConcurrency : int
+        The largest number of concurrent requests
+    latencyTarget : float or ``None``
+        Responses slower than this (in seconds) reduce the concurrency, or ``None``
+        if the latency should not be taken into account
+    '''
+
+    def __init__(self, bucket, concurrency, minConcurrency, maxConcurrency, latencyTarget):
+        self.bucket         = bucket
+        self.limit          = float(concurrency)
+        self.minConcurrency = minConcurrency
+        self.maxConcurrency = maxConcurrency
+        self.latencyTarget  = latencyTarget
+        self.latency        = None
+        self.lastDecrease   = 0.0
+        self.inFlight       = 0
+        self.counts         = {'success': 0, 'throttled': 0, 'transient': 0, 'permanent': 0}
+        self.condition      = threading.Condition()
+        self.waiters        = []
+
+    def slots(self, cap=None):
+        'Internal function - do not use'
+
+        limit = int(self.limit)
+        return limit if cap is None else max(min(limit, cap), 1)
+
+    def tryEnter(self, cap=None):
+        '''take a slot for a request if there is one free, without waiting
+
+        ``cap`` is an upper bound on the adaptive concurrency limit, or ``None``.
+        '''
+
+        with self.condition:
+            if self.inFlight < self.slots(cap):
+                self.inFlight += 1
+                return True
+            return False
+
+    def enter(self, cap=None):
+        '''take a slot for a request, waiting for one to be free
+
+        ``cap`` is an upper bound on the adaptive concurrency limit, or ``None``.
+        '''
+
+        with self.condition:
+            while self.inFlight >= self.slots(cap):
+                self.condition.wait()
+            self.inFlight += 1
+
+    async def enterAsync(self, cap=None):
+        '''take a slot for a request, waiting for one to be free without blocking the event loop
+
+        ``cap`` is an upper bound on the adaptive concurrency limit, or ``None``.
+        '''
+
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.condition:
+                if self.inFlight < self.slots(cap):
+                    self.inFlight += 1
+                    return
+                waiter = loop.create_future()
+                self.waiters.append((loop, waiter))
+            try:
+                await waiter
+            finally:
+                with self.condition:
+                    if (loop, waiter) in self.waiters:
+                        self.waiters.remove((loop, waiter))
+
+    def wakeAll(self):
+        'Internal function - do not use'
+
+        # Called with the condition held. Waiters may have different caps, so
+        # all of them (threads and coroutines alike) check again for a slot.
+        self.condition.notify_all()
+        for loop, waiter in self.waiters:
+            try:
+                loop.call_soon_threadsafe(wakeWaiter, waiter)
+            except RuntimeError:
+                # The event loop of the waiter has been closed
+                pass
+        self.waiters.clear()
+
+    def leave(self):
+        '''free the slot of a request'''
+
+        with self.condition:
+            self.inFlight -= 1
+            self.wakeAll()
+
+    def record(self, outcome, latency=None):
+        '''adapt the concurrency to the outcome of a request
+
+        Parameters
+        ----------
+        outcome : str
+            One of ``'success'``, ``'throttled'`` (a ``429`` or ``5xx`` response, or
+            a timeout), ``'transient'`` (any other error that may not happen again)
+            or ``'permanent'``
+        latency : float or ``None``, optional
+            The time taken by the request in seconds, by default ``None``
+        '''
+
+        with self.condition:
+            self.counts[outcome] += 1
+            now = time.monotonic()
+
+            if latency is not None:
+                self.latency = latency if self.latency is None else 0.8*self.latency + 0.2*latency
+
+            slow = (outcome == 'success') and (self.latencyTarget is not None) and \
+                   (self.latency is not None) and (self.latency > self.latencyTarget)
+
+            if (outcome == 'throttled') or slow:
+                # Requests that were already under way when the host became
+                # congested report it too, so the limit is only decreased once
+                # for every round trip
+                if now - self.lastDecrease >= (self.latency or 0):
+                    self.limit = max(self.minConcurrency, self.limit/2)
+                    self.lastDecrease = now
+            elif outcome == 'success':
+                self.limit = min(self.maxConcurrency, self.limit + 1/self.limit)
+                self.wakeAll()
+
+def wakeWaiter(waiter):
+    'Internal function - do not use'
+
+    if not waiter.done():
+        waiter.set_result(None)
+
+class FetchResult:
+    '''the outcome of a download
+
+    Attributes
+    ----------
+    url : str
+        The URL that was downloaded
+    text : str or ``None``
+        The text of the page, or ``None`` if it could not be downloaded
+    status : int or ``None``
+        The status code of the last response, or ``None`` if there was no response
+    error : Exception or ``None``
+        The error of the last attempt, or ``None`` if the download succeeded
+    transient : bool
+        ``True`` if the download failed for a reason that may go away when it is
+        tried later (throttling, server errors, timeouts, connection errors and
+        responses cut short), and ``False`` if it succeeded, or failed for good
+    attempts : int
+        The number of requests that were made
+    elapsed : float
+        The time spent in seconds, including the waits between attempts
+    '''
+
+    def __init__(self, url, text=None, status=None, error=None, transient=False, attempts=0, elapsed=0.0):
+        self.url       = url
+        self.text      = text
+        self.status    = status
+        self.error     = error
+        self.transient = transient
+        self.attempts  = attempts
+        self.elapsed   = elapsed
+
+    @property
+    def ok(self):
+        '''``True`` if the page was downloaded'''
+        return self.error is None
+
+    def __repr__(self):
+        state = 'ok' if self.ok else ('transient' if self.transient else 'permanent')
+        return f'FetchResult({self.url!r}, {state}, status={self.status}, attempts={self.attempts})'
+
+class FetchError(requests.RequestException):
+    '''a page could not be downloaded
+
+    The ``result`` attribute holds the ``FetchResult`` of the download, and
+    ``transient`` tells whether trying again later may succeed.
+    '''
+
+    def __init__(self, result):
+        kind = 'transient' if result.transient else 'permanent'
+        super().__init__(f'{kind} failure after {result.attempts} attempt(s) for {result.url}: {result.error}')
+        self.result    = result
+        self.transient = result.transient
+
+class FetchAttempts:
+    '''the attempts made to download a single page
+
+    This holds what is common to the blocking (``RequestScheduler.fetch()``) and
+    asynchronous (``asyncData.fetchURLAsync()``) downloads: the classification of
+    every attempt, its effect on the host, and whether and when to try again.
+    Those only make the requests:
+
+    .. code-block:: python
+
+        attempts = FetchAttempts(schedule, url, retries, backoff)
+        while True:
+            time.sleep(attempts.wait())
+            ...                     # make a request, reporting its outcome
+            delay = attempts.next()
+            if delay is None:
+                return attempts.result
+            time.sleep(delay)
+
+    The outcome of a request is reported with ``responded()`` followed by either
+    ``succeeded()`` or ``rejected()``, or with ``raised()`` when there was no
+    response.
+
+    Parameters
+    ----------
+    schedule : RequestScheduler
+        The scheduler of the host
+    url : str
+        The URL to download
+    retries : int
+        The number of times a transient failure is retried
+    backoff : float
+        The base delay in seconds between successive attempts
+    '''
+
+    def __init__(self, schedule, url, retries, backoff):
+        self.schedule   = schedule
+        self.state      = schedule.host(url)
+        self.host       = urlsplit(url).netloc
+        self.result     = FetchResult(url)
+        self.retries    = retries
+        self.backoff    = backoff
+        self.attempt    = 0
+        self.outcome    = None
+        self.retryAfter = None
+        self.start      = time.perf_counter()
+
+    def wait(self):
+        '''the time to wait for the rate limit of the host before making a request'''
+
+        self.outcome, self.retryAfter = None, None
+        return self.state.bucket.reserve()
+
+    def responded(self, status, headers, latency):
+        '''report a response, returning ``True`` if it was successful'''
+
+        instrumentation.count('requests', source=self.host)
+        self.outcome, self.retryAfter = self.schedule.classify(status, headers)
+        self.state.record(self.outcome, latency)
+        self.result.status = status
+        return self.outcome == 'success'
+
+    def succeeded(self, text, nBytes):
+        '''report the page of a successful response'''
+
+        instrumentation.count('bytes', nBytes, source=self.host)
+        self.result.text, self.result.error, self.result.transient = text, None, False
+
+    def rejected(self, error):
+        '''report the error of an unsuccessful response'''
+
+        self.result.error     = error
+        self.result.transient = self.outcome != 'permanent'
+
+    def raised(self, error, outcome='transient'):
+        '''report a request without a response: ``'throttled'`` for timeouts, and ``'transient'`` otherwise'''
+
+        self.state.record(outcome)
+        self.result.error, self.result.transient = error, True
+
+    def next(self):
+        '''end an attempt, returning the delay before the next one, or ``None`` if there is none'''
+
+        logger = logging.getLogger(logBase + 'FetchAttempts.next')
+
+        self.result.attempts = self.attempt + 1
+        if self.result.transient:
+            if self.retryAfter is not None:
+                self.state.bucket.pause(self.retryAfter)
+            if self.attempt < self.retries:
+                delay = self.schedule.retryDelay(self.attempt, self.backoff, self.retryAfter)
+                instrumentation.count('retries', source=self.host)
+                logger.debug('Attempt %d for [%s] failed (%s). Retrying in %.2fs',
+                             self.attempt+1, self.result.url, self.result.error, delay)
+                self.attempt += 1
+                return delay
+
+        self.result.elapsed = time.perf_counter() - self.start
+        return None
+
+class RequestScheduler:
+    '''schedule the requests made to every host
+
+    Parameters
+    ----------
+    rate : float or ``None``, optional
+        The number of requests per second made to each host, by default ``None``
+        for no limit
+    burst : int, optional
+        The number of requests that can be made at once to a host within the rate,
+        by default 10
+    hostRates : dict or ``None``, optional
+        A rate for specific hosts, which takes the place of ``rate``, by default ``None``
+    concurrency : int, optional
+        The initial number of concurrent requests to each host, by default 8
+    minConcurrency : int, optional
+        The smallest number of concurrent requests to each host, by default 1
+    maxConcurrency : int, optional
+        The largest number of concurrent requests to each host, by default 32
+    latencyTarget : float or ``None``, optional
+        A host whose responses take longer than this (in seconds) gets fewer concurrent
+        requests, by default ``None``, in which case the latency is not taken into account
+    maxBackoff : float, optional
+        The longest wait in seconds between attempts, by default 60
+    '''
+
+    def __init__(self, rate=None, burst=10, hostRates=None, concurrency=8, minConcurrency=1,
+                 maxConcurrency=32, latencyTarget=None, maxBackoff=60):
+
+        self.rate           = rate
+        self.burst          = burst
+        self.hostRates      = dict(hostRates or {})
+        self.concurrency    = concurrency
+        self.minConcurrency = minConcurrency
+        self.maxConcurrency = maxConcurrency
+        self.latencyTarget  = latencyTarget
+        self.maxBackoff     = maxBackoff
+        self.lock           = threading.Lock()
+        self.hosts          = {}
+
+    def host(self, url):
+        '''the state of the host of ``url``'''
+
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                bucket = TokenBucket(self.hostRates.get(host, self.rate), self.burst)
+                self.hosts[host] = HostState(bucket, self.concurrency, self.minConcurrency,
+                                             self.maxConcurrency, self.latencyTarget)
+            return self.hosts[host]
+
+    def retryDelay(self, attempt, backoff, retryAfter=None):
+        '''the time to wait before the next attempt
+
+        This is ``backoff * 2**attempt``, scaled by a random factor between 0.5 and 1
+        so that the requests that failed together are not retried together, and
+        never less than ``retryAfter``. It never exceeds ``maxBackoff``.
+        '''
+
+        delay = backoff * 2**attempt * random.uniform(0.5, 1.0)
+        if retryAfter is not None:
+            delay = max(delay, retryAfter)
+        return min(delay, self.maxBackoff)
+
+    def fetch(self, url, session, timeout=30, retries=3, backoff=0.5, maxConcurrency=None):
+        '''download a page
+
+        Parameters
+        ----------
+        url : str
+            The URL to download
+        session : requests.Session
+            The session to use
+        timeout : float, optional
+            Timeout in seconds for each attempt, by default 30
+        retries : int, optional
+            The number of times a transient failure is retried, by default 3
+        backoff : float, optional
+            The base delay in seconds between successive attempts, by default 0.5
+        maxConcurrency : int or ``None``, optional
+            An upper bound on the concurrent requests to the host for this download,
+            on top of the adaptive limit, by default ``None`` for none
+
+        Returns
+        -------
+        FetchResult
+            The outcome of the download. This function does not raise for failed
+            downloads.
+        '''
+
+        attempts = FetchAttempts(self, url, retries, backoff)
+        state    = attempts.state
+
+        while True:
+            time.sleep(attempts.wait())
+            state.enter(maxConcurrency)
+            try:
+                sent = time.perf_counter()
+                with instrumentation.stage('http', attempts.host):
+                    response = session.get(url, timeout=timeout)
+                if attempts.responded(response.status_code, response.headers, time.perf_counter() - sent):
+                    attempts.succeeded(response.text, len(response.content))
+                else:
+                    attempts.rejected(requests.HTTPError(f'status {response.status_code} for {url}', response=response))
+            except requests.Timeout as e:
+                attempts.raised(e, 'throttled')
+            except requests.RequestException as e:
+                # Connections that fail or close early, and bodies cut short
+                attempts.raised(e, 'transient')
+            finally:
+                state.leave()
+
+            delay = attempts.next()
+            if delay is None:
+                return attempts.result
+            time.sleep(delay)
+
+    def classify(self, status, headers):
+        '''the outcome of a response, and the delay asked for by the server (if any)'''
+
+        if status < 400:
+            return 'success', None
+        if (status in retryStatusCodes) or (status >= 500):
+            return 'throttled', parseRetryAfter(headers.get('Retry-After'))
+        return 'permanent', None
+
+    def stats(self):
+        '''the state of every host
+
+        Returns
+        -------
+        dict
+            For every host, the current concurrency limit (``'concurrency'``), the
+            average latency in seconds (``'latency'``), and the number of requests
+            that succeeded, were throttled, or failed transiently or permanently.
+        '''
+
+        with self.lock:
+            hosts = dict(self.hosts)
+
+        stats = {}
+        for host, state in hosts.items():
+            with state.condition:
+                stats[host] = dict(state.counts, concurrency=int(state.limit), latency=state.latency)
+
+        return stats
+
+def parseRetryAfter(value):
+    'Internal function - do not use'
+
+    # Only the number of seconds is supported, and not HTTP dates
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+activeScheduler = RequestScheduler()
+
+def configureScheduler(**kwargs):
+    '''replace the scheduler used by all the downloaders
+
+    The parameters are those of ``RequestScheduler``. What was learned about
+    every host by the previous scheduler is discarded.
+
+    Returns
+    -------
+    RequestScheduler
+        The new scheduler
+    '''
+
+    global activeScheduler
+
+    activeScheduler = RequestScheduler(**kwargs)
+    return activeScheduler
+
+def getScheduler():
+    '''the scheduler used by all the downloaders'''
+    return activeScheduler
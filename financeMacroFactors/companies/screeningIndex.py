@@ -0,0 +1,419 @@
+'''Cross-sectional screening of many companies
+
+Questions such as "which companies have grown their EPS by more than 10% a
+year over the last five years" need the same line item of every company.
+Answering them from the lists of lists returned by
+``getTickerFundamentalDataMW()`` means extracting the line item from every
+company, one at a time, for every question.
+
+A ``ScreeningIndex`` holds every line item as a matrix of tickers x periods,
+so that such questions become a few vectorized operations over the whole
+universe:
+
+    index  = ScreeningIndex.build(getTickersFundamentalDataMW(tickers))
+    growth = index.cagr('EPS (Diluted)', years=5)
+    cheap  = index.latest('EPS (Diluted)') > index.mean('EPS (Diluted)')
+    index.select((growth > 0.10) & cheap)
+    index.topK(growth, 10)
+
+The periods of yearly statements are fiscal years, so that the statements of
+companies with different fiscal year ends line up. The periods of quarterly
+statements are calendar quarters. When the data of a ticker is refreshed with
+``update()``, only the row of that ticker is rewritten.
+'''
+
+import logging
+import numpy as np
+
+from financeMacroFactors.companies.fundamentalFrame import FundamentalFrame
+from financeMacroFactors.companies.fundamentalFrame import periodColumns, periodLabels
+from financeMacroFactors.companies.fundamentalFrame import yearlyStatements, quarterlyStatements
+
+logBase = 'financeMacroFactors.companies.screeningIndex.'
+
+class ScreeningIndex:
+    '''a matrix of tickers x periods for every line item
+
+    Parameters
+    ----------
+    period : str, optional
+        Either ``'year'`` or ``'quarter'``, by default ``'year'``. This decides
+        which statements are used.
+    statements : list of str or ``None``, optional
+        The statements to use, by default ``None``, in which case all the yearly
+        (or quarterly) statements are used. If a line item is present in more
+        than one statement, the first statement in which it appears is used.
+
+    Attributes
+    ----------
+    tickers : list of str
+        The tickers, in the order of the rows of the matrices. Removed tickers
+        keep their row (which is emptied) until they are added again.
+    columns : numpy 1d-array
+        An integer for every period, in increasing order: the fiscal year, or
+        ``4*year + quarter - 1`` for calendar quarters.
+    '''
+
+    def __init__(self, period='year', statements=None):
+
+        if period not in ('year', 'quarter'):
+            raise ValueError(f'Unknown period {period}')
+
+        self.period     = period
+        self.statements = statements or (yearlyStatements if period == 'year' else quarterlyStatements)
+
+        self.tickers     = []
+        self.tickerIndex = {}
+        self.active      = np.zeros(0, dtype=bool)
+        self.columns     = np.zeros(0, dtype=np.int64)
+        self.items       = {}
+        self.capacity    = 0
+
+    @classmethod
+    def build(cls, fundamentals, period='year', statements=None):
+        '''create an index for many tickers
+
+        Parameters
+        ----------
+        fundamentals : dict
+            Maps every ticker to the result of ``getTickerFundamentalDataMW()``, as
+            returned by ``getTickersFundamentalDataMW()``
+        period : str, optional
+            Either ``'year'`` or ``'quarter'``, by default ``'year'``
+        statements : list of str or ``None``, optional
+            The statements to use, by default ``None`` for all of them
+
+        Returns
+        -------
+        ScreeningIndex
+            The index
+        '''
+
+        index = cls(period, statements)
+        for ticker, data in fundamentals.items():
+            index.update(ticker, data)
+
+        return index
+
+    def __len__(self):
+        return int(self.active.sum())
+
+    def __contains__(self, ticker):
+        i = self.tickerIndex.get(ticker)
+        return (i is not None) and bool(self.active[i])
+
+    @property
+    def labels(self):
+        '''the line items present within the index'''
+        return list(self.items)
+
+    @property
+    def periods(self):
+        '''the periods of the columns, as strings such as ``'2019'`` or ``'2019Q3'``'''
+
+        return periodLabels(self.columns, self.period)
+
+    def addColumns(self, columns):
+        'Internal function - do not use'
+
+        new = np.setdiff1d(columns, self.columns)
+        if len(new) == 0:
+            return
+
+        merged    = np.union1d(self.columns, new)
+        positions = np.searchsorted(merged, self.columns)
+        for label, matrix in self.items.items():
+            grown = np.full((self.capacity, len(merged)), np.nan)
+            grown[:, positions] = matrix
+            self.items[label] = grown
+
+        self.columns = merged
+
+    def addRow(self, ticker):
+        'Internal function - do not use'
+
+        i = self.tickerIndex.get(ticker)
+        if i is not None:
+            return i
+
+        i = len(self.tickers)
+        if i == self.capacity:
+            # The matrices grow by doubling, so that adding tickers one at a
+            # time costs a constant amount on average
+            self.capacity = max(16, 2 * self.capacity)
+            for label, matrix in self.items.items():
+                grown = np.full((self.capacity, len(self.columns)), np.nan)
+                grown[:len(matrix)] = matrix
+                self.items[label] = grown
+            active = np.zeros(self.capacity, dtype=bool)
+            active[:len(self.active)] = self.active
+            self.active = active
+
+        self.tickers.append(ticker)
+        self.tickerIndex[ticker] = i
+        return i
+
+    def update(self, ticker, data):
+        '''add a ticker, or replace everything known about it
+
+        Parameters
+        ----------
+        ticker : str
+            The ticker
+        data : dict
+            The result of ``getTickerFundamentalDataMW()`` for the ticker. Statements
+            may also be supplied as ``FundamentalFrame`` objects.
+
+        Returns
+        -------
+        int
+            The number of line items of the ticker within the index
+        '''
+
+        logger = logging.getLogger(logBase + 'update')
+
+        frames = []
+        for statement in self.statements:
+            info = data.get(statement)
+            if not info:
+                continue
+            frame = info if isinstance(info, FundamentalFrame) else FundamentalFrame.fromList(info, period=self.period)
+            if frame is None:
+                logger.error(f'Unable to use the {statement} of [{ticker}]')
+                continue
+            frames.append(frame)
+
+        for frame in frames:
+            columns, valid = periodColumns(frame.dates, self.period)
+            self.addColumns(columns[valid])
+
+        i = self.addRow(ticker)
+        for matrix in self.items.values():
+            matrix[i] = np.nan
+
+        seen = set()
+        for frame in frames:
+            columns, valid = periodColumns(frame.dates, self.period)
+            positions = np.searchsorted(self.columns, columns[valid])
+            for label, row in frame.labelIndex.items():
+                if label in seen:
+                    continue
+                seen.add(label)
+                if label not in self.items:
+                    self.items[label] = np.full((self.capacity, len(self.columns)), np.nan)
+                self.items[label][i, positions] = frame.values[row][valid]
+
+        self.active[i] = True
+        return len(seen)
+
+    def remove(self, ticker):
+        '''remove a ticker from the index'''
+
+        i = self.tickerIndex.get(ticker)
+        if i is None:
+            return
+        for matrix in self.items.values():
+            matrix[i] = np.nan
+        self.active[i] = False
+
+    def matrix(self, label):
+        '''the values of a line item
+
+        Parameters
+        ----------
+        label : str
+            The line item
+
+        Returns
+        -------
+        numpy 2d-array
+            A (tickers x columns) matrix, with ``NaN`` where there is no value. The rows
+            are in the order of ``tickers``. This is a view into the index, and should
+            not be modified. A line item that is not present gives a matrix of ``NaN``.
+        '''
+
+        matrix = self.items.get(label)
+        if matrix is None:
+            return np.full((len(self.tickers), len(self.columns)), np.nan)
+        return matrix[:len(self.tickers)]
+
+    def values(self, item):
+        'Internal function - do not use'
+
+        return self.matrix(item) if isinstance(item, str) else np.asarray(item, dtype=np.float64)
+
+    def column(self, item, period):
+        '''the values of every ticker for a single period
+
+        Parameters
+        ----------
+        item : str or numpy 2d-array
+            A line item, or a matrix derived from line items
+        period : int
+            The fiscal year, or ``4*year + quarter - 1`` for quarters
+
+        Returns
+        -------
+        numpy 1d-array
+            One value per ticker
+        '''
+
+        j = int(np.searchsorted(self.columns, period))
+        if (j == len(self.columns)) or (self.columns[j] != period):
+            return np.full(len(self.tickers), np.nan)
+        return self.values(item)[:, j]
+
+    def latestIndices(self, values):
+        'Internal function - do not use'
+
+        # The column of the last valid value of every row, -1 for rows without any
+        valid = ~np.isnan(values)
+        last  = values.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+        return np.where(valid.any(axis=1), last, -1)
+
+    def latest(self, item, lag=0):
+        '''the latest value of every ticker
+
+        Parameters
+        ----------
+        item : str or numpy 2d-array
+            A line item, or a matrix derived from line items
+        lag : int, optional
+            Go back this many periods from the latest one, by default 0
+
+        Returns
+        -------
+        numpy 1d-array
+            One value per ticker, ``NaN`` where there is none
+        '''
+
+        values = self.values(item)
+        last   = self.latestIndices(values) - lag
+        ok     = last >= 0
+        result = np.full(len(values), np.nan)
+        result[ok] = values[np.flatnonzero(ok), last[ok]]
+        return result
+
+    def mean(self, item, periods=None):
+        '''the mean of every ticker over its valid values
+
+        Parameters
+        ----------
+        item : str or numpy 2d-array
+            A line item, or a matrix derived from line items
+        periods : int or ``None``, optional
+            Only use the last ``periods`` columns, by default ``None`` for all of them
+        '''
+
+        values = self.values(item)
+        if periods is not None:
+            values = values[:, -periods:]
+        valid  = ~np.isnan(values)
+        counts = valid.sum(axis=1)
+        sums   = np.where(valid, values, 0).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    def cagr(self, item, years=5):
+        '''the compound annual growth rate of every ticker
+
+        The growth is measured from the value ``years`` periods before the latest
+        valid one, to the latest valid one. For quarterly indices the rate is still
+        per year. Growth from a value that is not positive is not defined.
+
+        Parameters
+        ----------
+        item : str or numpy 2d-array
+            A line item, or a matrix derived from line items
+        years : int, optional
+            The number of periods over which the growth is measured, by default 5
+
+        Returns
+        -------
+        numpy 1d-array
+            The growth rate of every ticker (0.1 for 10% a year), ``NaN`` where it
+            is not defined
+        '''
+
+        values = self.values(item)
+        last   = self.latest(values)
+        first  = self.latest(values, lag=years)
+        span   = years if self.period == 'year' else years / 4
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratio = last / first
+            return np.where((first > 0) & (ratio >= 0), np.power(ratio, 1 / span) - 1, np.nan)
+
+    def select(self, mask):
+        '''the tickers for which ``mask`` is ``True``'''
+
+        mask = np.asarray(mask, dtype=bool) & self.active[:len(self.tickers)]
+        return [self.tickers[i] for i in np.flatnonzero(mask)]
+
+    def topK(self, scores, k=10, largest=True):
+        '''the tickers with the ``k`` largest (or smallest) scores
+
+        Parameters
+        ----------
+        scores : numpy 1d-array
+            One score per ticker, as returned by ``latest()``, ``cagr()``, ... Tickers
+            with a ``NaN`` score are left out.
+        k : int, optional
+            The number of tickers, by default 10
+        largest : bool, optional
+            Return the largest scores, by default ``True``
+
+        Returns
+        -------
+        list of tuple
+            ``(ticker, score)`` tuples, best first
+        '''
+
+        scores = np.asarray(scores, dtype=np.float64)
+        rows   = np.flatnonzero(~np.isnan(scores) & self.active[:len(self.tickers)])
+        keys   = -scores[rows] if largest else scores[rows]
+
+        k = min(k, len(rows))
+        if k == 0:
+            return []
+        best = np.argpartition(keys, k - 1)[:k]
+        best = best[np.argsort(keys[best], kind='stable')]
+
+        return [(self.tickers[rows[i]], float(scores[rows[i]])) for i in best]
+
+    def percentiles(self, scores, q):
+        '''percentiles of the scores over all the tickers, ignoring ``NaN``
+
+        Parameters
+        ----------
+        scores : numpy 1d-array
+            One score per ticker
+        q : float or list of float
+            The percentiles, between 0 and 100
+        '''
+
+        scores = np.asarray(scores, dtype=np.float64)[self.active[:len(self.tickers)]]
+        scores = scores[~np.isnan(scores)]
+        if len(scores) == 0:
+            return np.full(np.shape(q), np.nan)
+        return np.percentile(scores, q)
+
+    def percentileRanks(self, scores):
+        '''the percentile rank (between 0 and 100) of the score of every ticker
+
+        Ties get the same rank. Tickers with a ``NaN`` score get a ``NaN`` rank.
+        '''
+
+        scores = np.asarray(scores, dtype=np.float64)
+        valid  = ~np.isnan(scores) & self.active[:len(self.tickers)]
+        ranks  = np.full(len(scores), np.nan)
+
+        ordered = np.sort(scores[valid])
+        if len(ordered) == 1:
+            ranks[valid] = 100.0
+        elif len(ordered) > 1:
+            below = np.searchsorted(ordered, scores[valid], 'left')
+            above = np.searchsorted(ordered, scores[valid], 'right')
+            ranks[valid] = 100 * ((below + above - 1) / 2) / (len(ordered) - 1)
+
+        return ranks
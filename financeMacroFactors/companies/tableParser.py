@@ -0,0 +1,118 @@
+'''Streaming extraction of rows from HTML tables
+
+All the pages that are scraped by this package hold their data within
+HTML tables. Building a complete document tree for such a page, only to
+walk through its tables afterwards, uses a lot of memory and time for
+large pages. The functions within this module use an event based (SAX
+style) ``lxml`` parser instead. No tree is built at all: the text of
+every cell is collected as the parser goes along, and the rows are
+yielded as soon as they are complete.
+'''
+
+from lxml import etree
+
+class TableRowTarget:
+    '''parser target that collects the rows of HTML tables
+
+    This is used internally by ``iterTableRows()``. Completed rows are
+    appended to ``rows`` as tuples ``(tableNo, rowNo, cells)``, and are
+    expected to be removed by the caller after every call to ``feed()``.
+    '''
+
+    def __init__(self, tableId=None):
+        self.tableId    = tableId
+        self.tableCount = 0
+        self.tables     = [] # stack of [tableNo, rowCount, selected]
+        self.rows       = []
+        self.cells      = None
+        self.cellTag    = None
+        self.cellText   = None
+
+    def start(self, tag, attrib):
+
+        if tag == 'table':
+            selected = (self.tableId is None) or (attrib.get('id') == self.tableId) or \
+                       (len(self.tables) > 0 and self.tables[-1][2])
+            self.tables.append([self.tableCount, 0, selected])
+            self.tableCount += 1
+
+        elif (tag == 'tr') and self.tables:
+            self.cells = []
+
+        elif (tag in ('td', 'th')) and (self.cells is not None):
+            self.cellTag  = tag
+            self.cellText = []
+
+    def end(self, tag):
+
+        if (tag in ('td', 'th')) and (self.cellText is not None):
+            self.cells.append( (self.cellTag, ''.join(self.cellText)) )
+            self.cellText = None
+
+        elif (tag == 'tr') and (self.cells is not None):
+            table = self.tables[-1]
+            if table[2]:
+                self.rows.append( (table[0], table[1], self.cells) )
+            table[1] += 1
+            self.cells = None
+
+        elif (tag == 'table') and self.tables:
+            self.tables.pop()
+
+    def data(self, data):
+        if self.cellText is not None:
+            self.cellText.append(data)
+
+    def close(self):
+        return None
+
+def iterTableRows(source, tableId=None, chunkSize=64*1024):
+    '''iterate over the rows of all the tables within an HTML page
+
+    The page is fed to the parser in chunks, and the rows that are complete
+    after every chunk are yielded. The text of a cell is the concatenation of
+    all the text within it (the same as what ``BeautifulSoup``'s ``get_text()``
+    returns). Rows are numbered within their own table, and tables are numbered
+    in the order in which they start within the page.
+
+    Parameters
+    ----------
+    source : str, bytes or iterable
+        The HTML of the page, or an iterable of chunks of the page (for example
+        the ``iter_content()`` of a streamed ``requests`` response).
+    tableId : str or ``None``, optional
+        Only return the rows of the table with this ``id`` attribute (and the
+        tables nested within it), by default ``None``, in which case the rows of
+        all tables are returned.
+    chunkSize : int, optional
+        The size of the chunks into which a ``str`` or ``bytes`` source is split,
+        by default 64 kB.
+
+    Yields
+    ------
+    tuple
+        ``(tableNo, rowNo, cells)`` where ``cells`` is a list of ``(tag, text)``
+        tuples, and ``tag`` is either ``'th'`` or ``'td'``.
+    '''
+
+    if isinstance(source, (str, bytes)):
+        chunks = (source[i:i+chunkSize] for i in range(0, len(source), chunkSize))
+    else:
+        chunks = source
+
+    target = TableRowTarget(tableId)
+    parser = etree.HTMLParser(target=target)
+
+    fed = False
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        parser.feed(chunk)
+        fed = True
+        if target.rows:
+            rows, target.rows = target.rows, []
+            yield from rows
+
+    if fed:
+        parser.close()
+        yield from target.rows
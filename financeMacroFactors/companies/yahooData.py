@@ -1,19 +1,28 @@
 import logging
-import requests
-from bs4 import BeautifulSoup
+import numpy as np
 from datetime import datetime as dt 
 from datetime import timedelta as tDel
 
+from financeMacroFactors import instrumentation
+from financeMacroFactors.companies import responseCache
+from financeMacroFactors.companies.httpFetcher import fetchURL
+from financeMacroFactors.companies.scheduler import FetchError
+from financeMacroFactors.companies.tableParser import iterTableRows
+from financeMacroFactors.companies.dateParsing import parseDayMonthYear, toDatetimes
+
 logBase = 'financeMacroFactors.companies.yahooData.'
 
-def getStockDataYahoo( ticker, startDate=dt.now()-tDel(365), endDate=dt.now(), frequency='1mo', convert=True):
+yahooBaseURL = 'https://sg.finance.yahoo.com'
+
+def getStockDataYahoo( ticker, startDate=None, endDate=None, frequency='1mo', convert=True, raiseErrors=False):
     '''obtains historical stock prices from Yahoo!
 
     Historic prices of a company as obtained form yahoo. It comprises of a list of lists.
     The first like represents the header. The data is present in the following lines. 
     Data for dividents and stock splits are removed from the list. All numerical values
     are converted to floating point numbers. If ``convert`` is set to ``True``, the dates
-    are converted into a ``datetime.datetime`` object. Otherwise it is retained as a string.
+    are converted into a ``datetime.datetime`` object (or a ``numpy.datetime64`` one if ``convert``
+    is ``'datetime64'``). Otherwise it is retained as a string.
 
     The returned data like the following:
 
@@ -25,114 +34,162 @@ def getStockDataYahoo( ticker, startDate=dt.now()-tDel(365), endDate=dt.now(), f
 
     In case there is an error, an error will be logged and an empty list will be returned.
 
+    When the page archive replays pages (see ``pageArchive.configureArchive()``), the
+    prices come from the archived page of the same ticker and frequency whose dates
+    cover ``startDate`` and ``endDate``, and so may include rows outside of them. The
+    default dates change with every call, so they only find a page when one was
+    downloaded with its end date at the time of the download (as with the defaults)
+    and a start date no later than the one asked for. Otherwise, pass explicit dates
+    within those of an archived page.
+
     Parameters
     ----------
     ticker : str
         a valid sticker symbol of the company for which the data is to be obtained.
-    startDate : datetime.datetime, optional
+    startDate : datetime.datetime or ``None``, optional
         This is the start date from which the date should be obtained, by default 
-        ``dt.now()-tDel(365)``
-    endDate : datetime.datetime, optional
+        ``None``, in which case ``dt.now()-tDel(365)`` is used
+    endDate : datetime.datetime or ``None``, optional
         This is the last datetime for which the data should be obtained, 
-        by default ``dt.now()``
+        by default ``None``, in which case ``dt.now()`` is used
     frequency : str, optional
         This is either ``'1d'``, ``'1wk'``, ``'1mo'``. By default this is set
         to ``'1mo'`` for an average data for a month.
-    convert : bool, optional
+    convert : bool or str, optional
         If this is set to ``True``, then the dates are converted into ``datetime.datetime``
-        objects. Otherwise, they are kept as strings. By default, this is set to
-        ``True``.
+        objects, and if it is set to ``'datetime64'``, into ``numpy.datetime64`` objects.
+        Otherwise, they are kept as strings. By default, this is set to ``True``.
+    raiseErrors : bool, optional
+        Raise the ``FetchError`` of a page that could not be downloaded, rather than
+        returning an empty list, by default ``False``. Its ``transient`` attribute
+        tells a throttled or failing server from a missing page.
 
     Returns
     -------
     list of list
         Stock data as returned from Yahoo. See the description above.
+
+    Raises
+    ------
+    FetchError
+        If ``raiseErrors`` is set and the page could not be downloaded
     '''
 
-    logger = logging.getLogger(logBase + 'getTickerFundamentalDataMW')
-
-    miniMonthMaps = {
-        'Jan'  : 1  , 
-        'Feb'  : 2  , 
-        'Mar'  : 3  , 
-        'Apr'  : 4  , 
-        'May'  : 5  , 
-        'Jun'  : 6  , 
-        'Jul'  : 7  , 
-        'Aug'  : 8  , 
-        'Sep'  : 9  , 
-        'Oct'  : 10 ,  
-        'Nov'  : 11 ,  
-        'Dec'  : 12 }
+    logger = logging.getLogger(logBase + 'getStockDataYahoo')
 
     possibleFrequencies = ['1d', '1wk', '1mo']
     if frequency not in possibleFrequencies:
         logger.error(f'Incorrect frequency supplied {frequency}. Should be one of {possibleFrequencies}')
         return []
     
+    # The defaults are evaluated on every call, rather than once when
+    # this module is imported
+    if startDate is None:
+        startDate = dt.now()-tDel(365)
+    if endDate is None:
+        endDate = dt.now()
+
     try:
 
-        string  = f'https://sg.finance.yahoo.com/quote/{ticker}/history?'
-        string += f'period1={int(startDate.timestamp())}'
-        string += f'&period2={int(endDate.timestamp())}'
-        string += '&interval=1mo'
-        string += '&filter=history'
-        string += '&frequency=1mo' 
+        url, params = historyCacheKey(ticker, startDate, endDate, frequency, convert)
+        return responseCache.cachedCall('yahoo', url, params, 
+            lambda : downloadStockDataYahoo(ticker, startDate, endDate, frequency, convert))
 
-        logger.debug(f'Attempting to obtain data from {string}')
+    except FetchError as e:
+        if raiseErrors:
+            raise
+        logger.error(f'Unable to get Stock data from Yahoo: {e}')
+        return []
+    except Exception as e:
+        logger.error(f'Unable to get Stock data from Yahoo: {e}')
+        return []
 
-        html_data = requests.get(string).text
 
-        logger.debug(f'Obtained HTML data')
+    return []
 
-        page_content = BeautifulSoup(html_data, 'lxml')
-        logger.debug(f'Converted to page content information')
+def historyCacheKey(ticker, startDate, endDate, frequency, convert):
+    'Internal function - do not use'
 
-        tables = page_content.find_all('table')
-        logger.debug(f'Table informaiton generated. Starting to parse the data')
+    # Yahoo! only provides data at a daily resolution, so requests made 
+    # on the same day for the same dates share the cached result.
+    url    = f'{yahooBaseURL}/quote/{ticker}/history'
+    params = {
+        'startDate' : startDate.date(), 'endDate' : endDate.date(), 
+        'frequency' : frequency,        'convert' : convert }
 
-        # There is only a single table in this page
-        allData = []
-        for tNo, table in enumerate(tables):
-            for i, row in enumerate(table.find_all('tr')):
+    return url, params
 
-                
-                if (i == 0) and (tNo == 0):
-                    header = [d.get_text().strip() for d in row.find_all('th')]
-                    allData.append(header)
+def historyURL(ticker, startDate, endDate, frequency):
+    'Internal function - do not use'
 
+    string  = f'{yahooBaseURL}/quote/{ticker}/history?'
+    string += f'period1={int(startDate.timestamp())}'
+    string += f'&period2={int(endDate.timestamp())}'
+    string += f'&interval={frequency}'
+    string += '&filter=history'
+    string += f'&frequency={frequency}' 
 
-                data = [d.get_text() for d in row.find_all('td')]
-                logger.debug(f'Row [{i:4d}]: Processing data - {data}')
+    return string
 
-                if len(data) < len(header):
-                    logger.debug(f'Skipping [{data}]')
-                    continue
+def downloadStockDataYahoo(ticker, startDate, endDate, frequency, convert):
+    'Internal function - do not use'
 
-                if '-' in data:
-                    logger.debug(f'Skipping [{data}]')
-                    continue
+    logger = logging.getLogger(logBase + 'downloadStockDataYahoo')
 
+    string = historyURL(ticker, startDate, endDate, frequency)
 
-                    
-                # convert the date to datetime
-                if convert:
-                    d, m, y = data[0].split()
-                    d, m, y = int(d), miniMonthMaps[m], int(y)
-                    date    = dt(y, m, d)
-                    data[0] = date
-                    
-                data = data[:1] + [float(d.replace(',','')) for d in data[1:]]
-                allData.append(data)
+    logger.debug(f'Attempting to obtain data from {string}')
 
-                
-        logger.debug(f'A total if {len(allData)} values generated. Returning data')
+    html_data = fetchURL(string)
 
-        return allData
+    logger.debug(f'Obtained HTML data')
 
-    except Exception as e:
-        logger.error(f'Unable to get Stock data from Yahoo: {e}')
-        return []
+    return parseStockDataYahoo(html_data, convert)
+
+def parseStockDataYahoo(html_data, convert, miniMonthMaps=None):
+    'Internal function - do not use'
+
+    logger = logging.getLogger(logBase + 'parseStockDataYahoo')
+
+    # Per-row messages are only formatted when they are going to be used
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    # There is only a single table in this page
+    allData = []
+    with instrumentation.stage('parse', 'yahoo'):
+        for tNo, i, cells in iterTableRows(html_data):
+
+            if (i == 0) and (tNo == 0):
+                header = [text.strip() for tag, text in cells if tag == 'th']
+                allData.append(header)
+
+            data = [text for tag, text in cells if tag == 'td']
+            if debug:
+                logger.debug('Row [%4d]: Processing data - %s', i, data)
+
+            if len(data) < len(header):
+                if debug:
+                    logger.debug('Skipping [%s]', data)
+                continue
+
+            if '-' in data:
+                if debug:
+                    logger.debug('Skipping [%s]', data)
+                continue
+
+            data = data[:1] + [float(d.replace(',','')) for d in data[1:]]
+            allData.append(data)
+
+        # All the dates are converted together
+        if convert and (len(allData) > 1):
+            dates = parseDayMonthYear([row[0] for row in allData[1:]], miniMonthMaps)
+            if np.isnat(dates).any():
+                raise ValueError(f'Unable to convert the dates {[row[0] for row in allData[1:]]}')
+            dates = list(dates) if convert == 'datetime64' else toDatetimes(dates)
+            for row, date in zip(allData[1:], dates):
+                row[0] = date
 
+    instrumentation.count('rows', len(allData), source='yahoo')
+    logger.debug('A total if %d values generated. Returning data', len(allData))
 
-    return []
\ No newline at end of file
+    return allData
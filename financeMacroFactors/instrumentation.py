@@ -0,0 +1,285 @@
+'''Timing and counting of the stages of the hot paths
+
+The data downloaders and the valuation methods report how long each of
+their stages takes, and count what goes through them:
+
+- stages: ``http`` (downloading pages), ``parse`` (walking through the HTML
+  tables), ``convert`` (turning strings into numbers), ``extract`` (pulling
+  line items out of statements) and ``valuation``
+- counters: ``bytes`` (downloaded), ``rows`` (parsed), ``conversionFailures``
+  (cells that are not numbers), ``requests`` and ``retries`` (HTTP attempts)
+
+Stages and counters carry an optional ``source`` (for example ``'yahoo'``, or
+the name of a valuation method). Nothing is recorded unless a sink has been
+added with ``addSink()``. Without sinks, ``stage()`` returns a shared
+do-nothing context manager and ``count()`` returns immediately, so that the
+instrumentation costs next to nothing when it is not used.
+
+    from financeMacroFactors import companies, instrumentation
+
+    sink = instrumentation.addSink(instrumentation.MemorySink())
+    data = companies.getStockDataYahoo('AAPL')
+    print(sink.report())
+
+A sink is any object with ``time(stage, source, seconds)`` and
+``count(name, source, value)`` methods.
+'''
+
+import time
+import threading
+import functools
+
+sinks = []
+
+class NullStage:
+    'Internal class - do not use'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+nullStage = NullStage()
+
+class TimedStage:
+    'Internal class - do not use'
+
+    __slots__ = ('name', 'source', 'start')
+
+    def __init__(self, name, source):
+        self.name   = name
+        self.source = source
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        elapsed = time.perf_counter() - self.start
+        for sink in sinks:
+            sink.time(self.name, self.source, elapsed)
+        return False
+
+def stage(name, source=None):
+    '''time a stage
+
+    Use the result as a context manager around the work of the stage:
+
+        with instrumentation.stage('parse', 'yahoo'):
+            ...
+
+    Parameters
+    ----------
+    name : str
+        The stage (``'http'``, ``'parse'``, ``'convert'``, ``'extract'`` or ``'valuation'``)
+    source : str or ``None``, optional
+        What the stage is working on, by default ``None``
+
+    Returns
+    -------
+    context manager
+        This reports the time spent within it to every sink
+    '''
+
+    if not sinks:
+        return nullStage
+    return TimedStage(name, source)
+
+def count(name, value=1, source=None):
+    '''add ``value`` to a counter
+
+    Parameters
+    ----------
+    name : str
+        The counter (``'bytes'``, ``'rows'``, ``'conversionFailures'``, ...)
+    value : int or float, optional
+        The amount to add, by default 1
+    source : str or ``None``, optional
+        What is being counted, by default ``None``
+    '''
+
+    for sink in sinks:
+        sink.count(name, source, value)
+
+def timed(name, source=None):
+    '''decorator that times every call of a function as a stage
+
+    Parameters
+    ----------
+    name : str
+        The stage
+    source : str or ``None``, optional
+        What the stage is working on, by default ``None``, in which case the
+        name of the function is used
+    '''
+
+    def decorator(function):
+        label = function.__name__ if source is None else source
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not sinks:
+                return function(*args, **kwargs)
+            with TimedStage(name, label):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+def enabled():
+    '''whether any sink is present'''
+    return len(sinks) > 0
+
+def addSink(sink):
+    '''start reporting to a sink
+
+    Parameters
+    ----------
+    sink : object
+        A ``MemorySink``, ``PrometheusSink`` or any object with the same
+        ``time()`` and ``count()`` methods
+
+    Returns
+    -------
+    object
+        The sink
+    '''
+
+    if sink not in sinks:
+        sinks.append(sink)
+    return sink
+
+def removeSink(sink):
+    '''stop reporting to a sink'''
+
+    if sink in sinks:
+        sinks.remove(sink)
+
+def clearSinks():
+    '''stop reporting to all sinks, which disables the instrumentation'''
+    sinks.clear()
+
+class MemorySink:
+    '''aggregates the stages and counters in memory
+
+    For every ``(stage, source)`` the number of calls, and the total, minimum
+    and maximum time are kept. For every ``(counter, source)`` the total is
+    kept. Sinks may be updated from many threads at once.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''forget everything recorded so far'''
+
+        with self.lock:
+            self.stages   = {}
+            self.counters = {}
+
+    def time(self, stage, source, seconds):
+
+        key = (stage, source)
+        with self.lock:
+            entry = self.stages.get(key)
+            if entry is None:
+                self.stages[key] = {'calls': 1, 'total': seconds, 'min': seconds, 'max': seconds}
+            else:
+                entry['calls'] += 1
+                entry['total'] += seconds
+                entry['min']    = min(entry['min'], seconds)
+                entry['max']    = max(entry['max'], seconds)
+
+    def count(self, name, source, value):
+
+        key = (name, source)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self):
+        '''a copy of everything recorded so far
+
+        Returns
+        -------
+        dict
+            ``{'stages': {(stage, source): {'calls', 'total', 'min', 'max'}},
+            'counters': {(counter, source): total}}``
+        '''
+
+        with self.lock:
+            return {
+                'stages'   : {k: dict(v) for k, v in self.stages.items()},
+                'counters' : dict(self.counters),
+            }
+
+    def report(self):
+        '''a table of the stages and counters, for printing'''
+
+        snapshot = self.snapshot()
+        lines = [f'{"stage":12s} {"source":30s} {"calls":>8s} {"total s":>10s} {"mean ms":>10s} {"max ms":>10s}']
+        for (name, source), e in sorted(snapshot['stages'].items(), key=lambda kv: -kv[1]['total']):
+            lines.append(f'{name:12s} {str(source or ""):30s} {e["calls"]:8d} {e["total"]:10.3f} '
+                         f'{e["total"]/e["calls"]*1e3:10.3f} {e["max"]*1e3:10.3f}')
+
+        lines.append('')
+        lines.append(f'{"counter":20s} {"source":30s} {"total":>14s}')
+        for (name, source), total in sorted(snapshot['counters'].items(), key=lambda kv: str(kv[0])):
+            lines.append(f'{name:20s} {str(source or ""):30s} {total:14,.0f}')
+
+        return '\n'.join(lines)
+
+class PrometheusSink(MemorySink):
+    '''aggregates in memory, and exports in the Prometheus text format
+
+    Parameters
+    ----------
+    prefix : str, optional
+        The prefix of the names of all the metrics, by default ``'financeMacroFactors'``
+    '''
+
+    def __init__(self, prefix='financeMacroFactors'):
+        self.prefix = prefix
+        super().__init__()
+
+    @staticmethod
+    def labels(**labels):
+        'Internal function - do not use'
+
+        text = ','.join(f'{k}="{v}"' for k, v in labels.items() if v is not None)
+        return '{' + text + '}' if text else ''
+
+    def render(self):
+        '''the metrics in the Prometheus text exposition format
+
+        Returns
+        -------
+        str
+            Stages are exported as ``<prefix>_stage_seconds_total`` and
+            ``<prefix>_stage_calls_total``, and counters as ``<prefix>_<counter>_total``,
+            all of them labelled with the stage and source.
+        '''
+
+        snapshot = self.snapshot()
+        p = self.prefix
+        lines = []
+
+        lines.append(f'# HELP {p}_stage_seconds_total Time spent within each stage')
+        lines.append(f'# TYPE {p}_stage_seconds_total counter')
+        for (name, source), e in sorted(snapshot['stages'].items(), key=str):
+            lines.append(f'{p}_stage_seconds_total{self.labels(stage=name, source=source)} {e["total"]!r}')
+
+        lines.append(f'# HELP {p}_stage_calls_total Number of times each stage was run')
+        lines.append(f'# TYPE {p}_stage_calls_total counter')
+        for (name, source), e in sorted(snapshot['stages'].items(), key=str):
+            lines.append(f'{p}_stage_calls_total{self.labels(stage=name, source=source)} {e["calls"]}')
+
+        for name in sorted({name for name, _ in snapshot['counters']}):
+            lines.append(f'# TYPE {p}_{name}_total counter')
+            for (n, source), total in sorted(snapshot['counters'].items(), key=str):
+                if n == name:
+                    lines.append(f'{p}_{name}_total{self.labels(source=source)} {total!r}')
+
+        return '\n'.join(lines) + '\n'
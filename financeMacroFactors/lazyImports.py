@@ -0,0 +1,58 @@
+'''Lazy loading of the contents of a package
+
+Importing a package of this library should not import everything within it
+(and with it ``requests``, ``lxml``, NumPy and SciPy), since most programs
+only use a small part of it. A package lists what it provides, and where
+from, and the modules are only imported when something within them is first
+used:
+
+    __getattr__, __dir__ = lazyAttributes(__name__, {
+        'getStockDataYahoo' : 'yahooData',
+        ...
+    }, submodules=['yahooData', ...])
+
+This uses module level ``__getattr__`` functions (PEP 562).
+'''
+
+import importlib
+
+def lazyAttributes(package, attributes, submodules=()):
+    '''the ``__getattr__`` and ``__dir__`` functions of a lazily loaded package
+
+    Parameters
+    ----------
+    package : str
+        The name of the package (its ``__name__``)
+    attributes : dict
+        Maps every name that the package provides to the module (relative to the
+        package) that defines it
+    submodules : list of str, optional
+        Modules of the package that can be used as its attributes without importing
+        them first, by default none
+
+    Returns
+    -------
+    tuple
+        ``(__getattr__, __dir__)``
+    '''
+
+    submodules = set(submodules)
+
+    def __getattr__(name):
+
+        if name in attributes:
+            module = importlib.import_module(f'{package}.{attributes[name]}')
+            value  = getattr(module, name)
+        elif name in submodules:
+            value  = importlib.import_module(f'{package}.{name}')
+        else:
+            raise AttributeError(f'module {package!r} has no attribute {name!r}')
+
+        # Later uses find the value without calling this function again
+        setattr(importlib.import_module(package), name, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(importlib.import_module(package))) | set(attributes) | submodules)
+
+    return __getattr__, __dir__
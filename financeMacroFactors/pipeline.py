@@ -0,0 +1,519 @@
+'''Valuation of a whole universe of companies as a streaming job
+
+Valuing the S&P 500 means obtaining the list of companies, downloading the
+statements and the prices of every one of them, extracting the line items
+and running the valuation methods. Done one after the other, with every
+intermediate result kept in a list, the memory used grows with the number of
+companies, and the network sits idle while pages are parsed.
+
+This module runs the work as a pipeline of stages, connected by bounded
+queues:
+
+1. ``fetch``: a pool of threads downloads the pages of every ticker (the
+   annual income statement and cash flow statement from MarketWatch, and
+   monthly prices from Yahoo!). Pages already present in the response cache
+   are not downloaded again.
+2. ``parse``: the tables of the pages are parsed (and stored in the cache).
+3. ``value``: the line items are extracted, aligned with the prices, and the
+   four valuation methods are run.
+
+The stages overlap, and as the queues are bounded, a slow stage holds back
+the ones before it rather than letting work pile up. Results come out as soon
+as each ticker is done, so that memory stays the same no matter how many
+tickers there are. From Python:
+
+    from financeMacroFactors import pipeline
+
+    for result in pipeline.iterUniverse(['AAPL', 'MSFT']):
+        print(result)
+
+    pipeline.runUniverse('valuations.csv')    # the whole S&P 500
+
+and from the command line:
+
+    python -m financeMacroFactors.pipeline -o valuations.jsonl --tickers AAPL MSFT
+
+Results are written as CSV, JSON lines or (if ``pyarrow`` is installed) Parquet.
+'''
+
+import os
+import sys
+import csv
+import json
+import queue
+import logging
+import argparse
+import threading
+import functools
+import numpy as np
+from datetime import datetime as dt
+from datetime import timedelta as tDel
+
+from financeMacroFactors import valuation
+from financeMacroFactors.companies import responseCache
+from financeMacroFactors.companies import marketWarchData as mw
+from financeMacroFactors.companies import yahooData
+from financeMacroFactors.companies.dateAlignment import alignAsOf, seriesFromYahoo
+from financeMacroFactors.companies.httpFetcher import fetchURL
+from financeMacroFactors.companies.companyLists import getSNP500CompanyList
+from financeMacroFactors.companies.parsePool import ParserPool
+
+logBase = 'financeMacroFactors.pipeline.'
+
+statements = ['IncomeStatement', 'CashFlow']
+
+resultFields = ['ticker', 'fiscalYear', 'years', 'price', 'dfe', 'dcf', 'ps', 'pe', 'error']
+
+STOP = object()
+
+class Stopped(Exception):
+    'Internal class - do not use'
+
+def put(q, item, stop):
+    'Internal function - do not use'
+
+    # Blocks while the queue is full (which is the backpressure), but gives up
+    # as soon as the pipeline is stopped
+    while True:
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            if stop.is_set():
+                raise Stopped()
+
+def get(q, stop):
+    'Internal function - do not use'
+
+    while True:
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                raise Stopped()
+
+def startStage(name, function, workers, inQueue, outQueue, stop):
+    '''start the threads of a stage
+
+    Every worker takes items from ``inQueue`` and puts ``function(item)`` into
+    ``outQueue``, until it gets ``STOP``. The ``STOP`` is put back for the other
+    workers, and the last worker to finish passes it on to the next stage.
+    '''
+
+    logger    = logging.getLogger(logBase + name)
+    remaining = [workers]
+    lock      = threading.Lock()
+
+    def work():
+        try:
+            while True:
+                item = get(inQueue, stop)
+                if item is STOP:
+                    put(inQueue, STOP, stop)
+                    break
+                put(outQueue, function(item), stop)
+
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                put(outQueue, STOP, stop)
+
+        except Stopped:
+            pass
+        except Exception as e:
+            logger.error(f'The {name} stage failed: {e}')
+            stop.set()
+
+    threads = [threading.Thread(target=work, name=f'{name}-{i}', daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    return threads
+
+def fetchTicker(job, stop=None):
+    '''download (or find in the cache) the pages of a ticker
+
+    With a ``stop`` event, the remaining pages are not downloaded once it is set.
+    '''
+
+    ticker, startDate, endDate = job
+    result = {'ticker': ticker, 'pages': {}, 'prices': None, 'error': None}
+
+    def stopped():
+        if (stop is not None) and stop.is_set():
+            raise Stopped()
+
+    try:
+        for statement in statements:
+            stopped()
+            url = mw.mwBaseURL + mw.mwStatementPaths[statement].format(ticker)
+            found, value = responseCache.lookup('marketwatch', url, {'convert': True})
+            if not found:
+                value = fetchURL(url)
+            result['pages'][statement] = (url, found, value)
+
+        stopped()
+        url, params = yahooData.historyCacheKey(ticker, startDate, endDate, '1mo', True)
+        found, value = responseCache.lookup('yahoo', url, params)
+        if not found:
+            value = fetchURL(yahooData.historyURL(ticker, startDate, endDate, '1mo'))
+        result['prices'] = (url, params, found, value)
+
+    except Stopped:
+        raise
+    except Exception as e:
+        result['error'] = f'fetch: {e}'
+
+    return result
+
+def parseTicker(result, pool=None):
+    '''parse the pages of a ticker that were not found in the cache
+
+    With a ``ParserPool``, all the pages of the ticker are handed to the pool at
+    once, and the thread only waits for the results.
+    '''
+
+    if result['error'] is not None:
+        return result
+
+    if pool is None:
+        parseMW    = lambda page: mw.parseMWPage(page)
+        parseYahoo = lambda page: yahooData.parseStockDataYahoo(page, True, mw.miniMonthMaps)
+    else:
+        parseMW    = lambda page: pool.submit('marketwatch', page)
+        parseYahoo = lambda page: pool.submit('yahoo', page)
+
+    try:
+        pages = {}
+        for statement, (url, found, value) in result['pages'].items():
+            pages[statement] = (url, found, value if found else parseMW(value))
+        url, params, found, value = result['prices']
+        prices = (url, params, found, value if found else parseYahoo(value))
+
+        for statement, (url, found, value) in pages.items():
+            if not found:
+                value = value if pool is None else value.result()
+                responseCache.store('marketwatch', url, value, {'convert': True})
+            result['pages'][statement] = value
+
+        url, params, found, value = prices
+        if not found:
+            value = value if pool is None else value.result()
+            responseCache.store('yahoo', url, value, params)
+        result['prices'] = value
+
+    except Exception as e:
+        result['error'] = f'parse: {e}'
+
+    return result
+
+def yearlyValues(info, label):
+    'Internal function - do not use'
+
+    # Line items that are missing, or are not numbers for some of the years,
+    # are left out
+    if not info:
+        return {}
+    return {d: v for d, v in mw.extractYearlyData(info, label) if isinstance(v, float) and np.isfinite(v)}
+
+def yearEndPrices(prices, dates):
+    'Internal function - do not use'
+
+    # The closing price of the month within which each fiscal year ends
+    series = seriesFromYahoo(prices)
+    if series is None or not dates:
+        return {}
+
+    close = alignAsOf(*series, dates, fill='previous', tolerance=30)
+    return {d: float(c) for d, c in zip(dates, close) if not np.isnan(c)}
+
+def valueTicker(result):
+    '''extract the line items of a ticker and value it with all four methods'''
+
+    record = {field: None for field in resultFields}
+    record['ticker'] = result['ticker']
+    record['error']  = result['error']
+    if record['error'] is not None:
+        return record
+
+    try:
+        income, cash = result['pages']['IncomeStatement'], result['pages']['CashFlow']
+        eps     = yearlyValues(income, 'EPS (Diluted)')
+        revenue = yearlyValues(income, 'Sales/Revenue')
+        shares  = yearlyValues(income, 'Diluted Shares Outstanding')
+        fcf     = yearlyValues(cash,   'Free Cash Flow')
+
+        dates   = sorted(set(eps) | set(revenue) | set(shares) | set(fcf))
+        price   = yearEndPrices(result['prices'], dates)
+        if not dates:
+            record['error'] = 'value: no yearly data'
+            return record
+
+        def aligned(*series):
+            years = [d for d in dates if all(d in s for s in series)]
+            return [np.array([s[d] for d in years]) for s in series]
+
+        record['fiscalYear'] = dates[-1].year
+        record['years']      = len(eps)
+        prices = result['prices'][1:]
+        record['price']      = max(prices, key=lambda row: row[0])[4] if prices else None
+
+        e, = aligned(eps)
+        record['dfe'] = valuation.discountedFutureEarnings(e) if len(e) >= 3 else None
+        f, s = aligned(fcf, shares)
+        record['dcf'] = valuation.discountedCashFlow(f, s) if len(f) >= 3 else None
+        r, s, p = aligned(revenue, shares, price)
+        record['ps']  = valuation.priceToSalesRatio(r, s, p) if len(r) else None
+        e, p = aligned(eps, price)
+        record['pe']  = valuation.priceToEarningsRatio(e, p) if len(e) else None
+
+        for field in ['dfe', 'dcf', 'ps', 'pe']:
+            if record[field] is not None:
+                record[field] = float(record[field])
+
+    except Exception as e:
+        record['error'] = f'value: {e}'
+
+    return record
+
+def iterUniverse(tickers=None, startDate=None, endDate=None, fetchWorkers=8, parseWorkers=2, parseProcesses=None, queueSize=16, progress=None):
+    '''value a universe of companies, yielding the results as they are done
+
+    Parameters
+    ----------
+    tickers : iterable of str or ``None``, optional
+        The tickers to value, by default ``None``, in which case all the companies
+        returned by ``getSNP500CompanyList()`` are used. This may be a generator;
+        tickers are only taken from it as the pipeline has room for them.
+    startDate : datetime.datetime or ``None``, optional
+        The first date of the prices that are obtained, by default ``None``, in which
+        case six years before ``endDate`` is used, to cover the years of the statements
+    endDate : datetime.datetime or ``None``, optional
+        The last date of the prices, by default ``None``, in which case ``dt.now()``
+        is used
+    fetchWorkers : int, optional
+        The number of threads that download pages, by default 8
+    parseWorkers : int, optional
+        The number of threads that parse pages, by default 2
+    parseProcesses : int or ``None``, optional
+        If supplied, the pages are parsed by a ``ParserPool`` of this many processes,
+        by default ``None``. The parse threads then only wait for the pool, and there
+        are at least as many of them as there are processes.
+    queueSize : int, optional
+        The number of tickers that may wait between any two stages, by default 16
+    progress : callable or ``None``, optional
+        A function called as ``progress(ticker, done)`` every time a ticker has been
+        valued, by default ``None``
+
+    Yields
+    ------
+    dict
+        One result for every ticker, with the keys in ``resultFields``. The valuations
+        are per share, and are ``None`` when there is not enough data for a method.
+        If a ticker could not be downloaded or parsed, ``error`` says why.
+    '''
+
+    logger = logging.getLogger(logBase + 'iterUniverse')
+
+    if tickers is None:
+        tickers = (company['Symbol'] for company in getSNP500CompanyList())
+    if endDate is None:
+        endDate = dt.now()
+    if startDate is None:
+        startDate = endDate - tDel(6*365)
+
+    stop    = threading.Event()
+    queues  = [queue.Queue(maxsize=queueSize) for _ in range(4)]
+
+    pool  = None
+    parse = parseTicker
+    if parseProcesses:
+        pool  = ParserPool(parseProcesses)
+        parse = functools.partial(parseTicker, pool=pool)
+        parseWorkers = max(parseWorkers, parseProcesses)
+
+    def feed():
+        try:
+            for ticker in tickers:
+                put(queues[0], (ticker, startDate, endDate), stop)
+            put(queues[0], STOP, stop)
+        except Stopped:
+            pass
+        except Exception as e:
+            logger.error(f'Unable to obtain the tickers: {e}')
+            stop.set()
+
+    threading.Thread(target=feed, name='feed', daemon=True).start()
+    fetch = functools.partial(fetchTicker, stop=stop)
+    startStage('fetch', fetch, fetchWorkers, queues[0], queues[1], stop)
+    workers  = startStage('parse', parse,       parseWorkers, queues[1], queues[2], stop)
+    workers += startStage('value', valueTicker, 1,            queues[2], queues[3], stop)
+
+    done = 0
+    try:
+        while True:
+            record = get(queues[3], stop)
+            if record is STOP:
+                break
+            done += 1
+            if progress is not None:
+                progress(record['ticker'], done)
+            yield record
+    except Stopped:
+        logger.error('The pipeline was stopped before all the tickers were valued')
+    finally:
+        # Also reached when the caller stops iterating early. The parse and
+        # value stages only take a moment to notice, and have to be done
+        # with the pool before it is closed. The feed and fetch threads may
+        # be within a download (with its retries), and are left to stop on
+        # their own after it, as they download nothing more once stopped.
+        stop.set()
+        for thread in workers:
+            thread.join()
+        if pool is not None:
+            pool.close()
+
+class CSVWriter:
+    'Internal class - do not use'
+
+    def __init__(self, path):
+        self.file   = open(path, 'w', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=resultFields)
+        self.writer.writeheader()
+
+    def write(self, record):
+        self.writer.writerow(record)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class JSONLWriter:
+    'Internal class - do not use'
+
+    def __init__(self, path):
+        self.file = open(path, 'w')
+
+    def write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class ParquetWriter:
+    'Internal class - do not use'
+
+    def __init__(self, path, batchSize=256):
+
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError('Writing Parquet files requires pyarrow. Install it with "pip install pyarrow".')
+
+        self.pa     = pa
+        self.schema = pa.schema([
+            ('ticker', pa.string()), ('fiscalYear', pa.int64()), ('years', pa.int64()),
+            ('price',  pa.float64()), ('dfe', pa.float64()), ('dcf', pa.float64()),
+            ('ps',     pa.float64()), ('pe',  pa.float64()), ('error', pa.string())])
+        self.writer    = pq.ParquetWriter(path, self.schema)
+        self.batchSize = batchSize
+        self.batch     = []
+
+    def write(self, record):
+        self.batch.append(record)
+        if len(self.batch) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.writer.write_table(self.pa.Table.from_pylist(self.batch, schema=self.schema))
+            self.batch = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+writers = {'csv': CSVWriter, 'jsonl': JSONLWriter, 'parquet': ParquetWriter}
+
+def runUniverse(output, tickers=None, format=None, **kwargs):
+    '''value a universe of companies, writing the results to a file as they are done
+
+    Parameters
+    ----------
+    output : str
+        The file to write
+    tickers : iterable of str or ``None``, optional
+        The tickers to value, by default ``None`` for the S&P 500 companies
+    format : str or ``None``, optional
+        One of ``'csv'``, ``'jsonl'`` or ``'parquet'``, by default ``None``, in which
+        case the extension of ``output`` is used. Parquet files require ``pyarrow``.
+    **kwargs
+        Passed on to ``iterUniverse()``
+
+    Returns
+    -------
+    int
+        The number of tickers written
+    '''
+
+    if format is None:
+        format = os.path.splitext(output)[1].lstrip('.').lower()
+    if format not in writers:
+        raise ValueError(f'Unknown format {format}. Should be one of {list(writers)}')
+
+    writer = writers[format](output)
+    count  = 0
+    try:
+        for record in iterUniverse(tickers, **kwargs):
+            writer.write(record)
+            count += 1
+    finally:
+        writer.close()
+
+    return count
+
+def main(argv=None):
+    '''the command line interface of ``runUniverse()``'''
+
+    parser = argparse.ArgumentParser(
+        prog='python -m financeMacroFactors.pipeline',
+        description='Value a universe of companies, streaming the results into a file')
+    parser.add_argument('-o', '--output', required=True, help='the file to write (.csv, .jsonl or .parquet)')
+    parser.add_argument('--format', choices=list(writers), help='the format of the file, by default from its extension')
+    parser.add_argument('--tickers', nargs='*', help='the tickers to value, by default the S&P 500 companies')
+    parser.add_argument('--tickers-file', help='a file with one ticker per line')
+    parser.add_argument('--fetch-workers', type=int, default=8, help='threads downloading pages (default 8)')
+    parser.add_argument('--parse-workers', type=int, default=2, help='threads parsing pages (default 2)')
+    parser.add_argument('--parse-processes', type=int, help='parse the pages in this many processes')
+    parser.add_argument('--queue-size', type=int, default=16, help='tickers waiting between stages (default 16)')
+    parser.add_argument('--cache', help='the response cache to use, by default none')
+    parser.add_argument('--quiet', action='store_true', help='do not report progress')
+    args = parser.parse_args(argv)
+
+    tickers = args.tickers
+    if args.tickers_file:
+        with open(args.tickers_file) as f:
+            tickers = [line.strip() for line in f if line.strip()]
+
+    if args.cache:
+        responseCache.configureCache(args.cache)
+
+    def progress(ticker, done):
+        sys.stderr.write(f'\r{done:6d} tickers valued ({ticker:8s})')
+        sys.stderr.flush()
+
+    count = runUniverse(args.output, tickers, format=args.format,
+                fetchWorkers=args.fetch_workers, parseWorkers=args.parse_workers,
+                parseProcesses=args.parse_processes,
+                queueSize=args.queue_size, progress=None if args.quiet else progress)
+
+    if not args.quiet:
+        sys.stderr.write(f'\n{count} tickers written to {args.output}\n')
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
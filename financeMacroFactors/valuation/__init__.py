@@ -18,8 +18,47 @@ know its value? <https://medium.com/@sankha.mukherjee_007/sure-you-know-the-stoc
 
 '''
 
-from financeMacroFactors.valuation.valuationMethods import discountedFutureEarnings
-from financeMacroFactors.valuation.valuationMethods import discountedCashFlow
-from financeMacroFactors.valuation.valuationMethods import priceToSalesRatio
-from financeMacroFactors.valuation.valuationMethods import priceToEarningsRatio
+from financeMacroFactors.lazyImports import lazyAttributes
 
+# The modules are only imported when something within them is first used
+__getattr__, __dir__ = lazyAttributes(__name__, {
+    'discountedFutureEarnings'          : 'valuationMethods',
+    'discountedCashFlow'                : 'valuationMethods',
+    'priceToSalesRatio'                 : 'valuationMethods',
+    'priceToEarningsRatio'              : 'valuationMethods',
+
+    'discountedFutureEarningsBatch'     : 'batchValuation',
+    'discountedCashFlowBatch'           : 'batchValuation',
+    'priceToSalesRatioBatch'            : 'batchValuation',
+    'priceToEarningsRatioBatch'         : 'batchValuation',
+
+    'sampleScenarios'                   : 'scenarioValuation',
+    'discountedFutureEarningsScenarios' : 'scenarioValuation',
+    'discountedCashFlowScenarios'       : 'scenarioValuation',
+
+    'extrapolate'                       : 'extrapolation',
+
+    'PriceToEarningsValuator'           : 'incrementalValuation',
+    'PriceToSalesValuator'              : 'incrementalValuation',
+    'DiscountedFutureEarningsValuator'  : 'incrementalValuation',
+    'DiscountedCashFlowValuator'        : 'incrementalValuation',
+
+    'discountedFutureEarningsSeries'    : 'timeSeriesValuation',
+    'discountedCashFlowSeries'          : 'timeSeriesValuation',
+    'priceToSalesRatioSeries'           : 'timeSeriesValuation',
+    'priceToEarningsRatioSeries'        : 'timeSeriesValuation',
+    'valuationSeries'                   : 'timeSeriesValuation',
+}, submodules=[
+    'batchValuation', 'extrapolation', 'incrementalValuation', 'scenarioValuation',
+    'timeSeriesValuation', 'valuationMethods',
+])
+
+__all__ = [
+    'discountedFutureEarnings', 'discountedCashFlow', 'priceToSalesRatio',
+    'priceToEarningsRatio', 'discountedFutureEarningsBatch', 'discountedCashFlowBatch',
+    'priceToSalesRatioBatch', 'priceToEarningsRatioBatch', 'sampleScenarios',
+    'discountedFutureEarningsScenarios', 'discountedCashFlowScenarios', 'extrapolate',
+    'PriceToEarningsValuator', 'PriceToSalesValuator', 'DiscountedFutureEarningsValuator',
+    'DiscountedCashFlowValuator', 'discountedFutureEarningsSeries', 'discountedCashFlowSeries',
+    'priceToSalesRatioSeries', 'priceToEarningsRatioSeries', 'valuationSeries',
+]
@@ -0,0 +1,268 @@
+import numpy as np
+import logging
+
+from financeMacroFactors import instrumentation
+from financeMacroFactors.valuation.extrapolation import extrapolate, lastValidIndices
+
+logBase = 'financeMacroFactors.valuation.batchValuation.'
+
+def prepareBatch(values, mask=None):
+    'Internal function - do not use'
+
+    values = np.array(values, dtype=np.float64, ndmin=2)
+    if mask is None:
+        mask = np.ones(values.shape, dtype=bool)
+    else:
+        mask = np.array(mask, dtype=bool, ndmin=2)
+
+    assert values.ndim == 2, 'the input values should be a 2d-array (tickers x years)'
+    assert mask.shape == values.shape, 'dimensions of the values and the mask are different'
+
+    return values, mask
+
+def discountBatch(extrapolated, discountingFactor, terminalFactor):
+    'Internal function - do not use'
+
+    extrapolated = extrapolated.copy()
+    extrapolated[:, -1] *= terminalFactor
+    discount = (np.ones(5)*discountingFactor)**np.arange(-1,-6, -1)
+
+    # A stacked (1 x 5) @ (5 x 1) product is evaluated as one dot product
+    # per row, and therefore reproduces the scalar ``epsExt @ discount``
+    # bit for bit. A plain (N x 5) @ (5,) product does not.
+    return (extrapolated[:, None, :] @ discount[:, None])[:, 0, 0]
+
+def rowMeans(values, mask):
+    'Internal function - do not use'
+
+    # Valid values are moved to the front of every row (preserving their
+    # order) and rows with the same number of valid values are averaged
+    # together. This keeps the summation order identical to that of
+    # ``np.mean`` on the 1d-array the scalar functions receive.
+    counts    = mask.sum(axis=1)
+    order     = np.argsort(~mask, axis=1, kind='stable')
+    compacted = np.take_along_axis(values, order, axis=1)
+
+    means = np.full(values.shape[0], np.nan)
+    for n in np.unique(counts[counts > 0]):
+        rows = counts == n
+        means[rows] = compacted[rows, :n].mean(axis=1)
+
+    return means
+
+@instrumentation.timed('valuation')
+def discountedFutureEarningsBatch(eps, mask=None, discountingFactor=1.1, terminalFactor=10.0, model='lastSegment'):
+    '''obtain DFE Valuations for a number of companies
+
+    This is the batch version of ``discountedFutureEarnings()``. The EPS values of
+    all companies are supplied as a 2d-array, one row per company and one column per
+    year. Not all companies need to have data for all the years. The ``mask`` marks
+    which values are valid, and for each company only the valid values are used, in
+    the order in which they appear. Each valuation is identical to the value that
+    ``discountedFutureEarnings()`` returns for the valid values of the same row.
+    Companies for which the scalar function returns ``None`` (fewer than 3 valid
+    values) are assigned a ``NaN``.
+
+    Parameters
+    ----------
+    eps : numpy 2d-array
+        The earnings for share for the last N years of data for each company (tickers x years)
+    mask : numpy 2d-array of bool or ``None``, optional
+        Marks the valid values within ``eps``, by default ``None``, in which case all the
+        values are considered valid.
+    discountingFactor : float, optional
+        The discounting factor by which future earnings shoule be discounted, by default 1.1
+        which represents a 10% valuation for the future value of money
+    terminalFactor : float, optional
+        The value by which the final extrapolated EPS value should be multiplied so as to obtain
+        a terminal value of the company, by default 10
+    model : str, optional
+        How the values are extrapolated into the future: ``'lastSegment'``, ``'linearTrend'``
+        or ``'cagr'``, by default ``'lastSegment'``. See the ``extrapolation`` module.
+
+    Returns
+    -------
+    numpy 1d-array or None
+        The calculated valuation of each company, with ``NaN`` for companies that cannot be
+        valued. If the inputs themselves are inconsistent, a ``None`` will be returned.
+    '''
+
+    logger = logging.getLogger(logBase + 'discountedFutureEarningsBatch')
+
+    try:
+        eps, mask = prepareBatch(eps, mask)
+        counts = mask.sum(axis=1)
+
+        with np.errstate(invalid='ignore'):
+            epsExt = extrapolate(eps, 5, model, mask)
+            dfeValues = discountBatch(epsExt, discountingFactor, terminalFactor)
+
+        dfeValues[counts < 3] = np.nan
+        logger.debug('%d of %d companies valued', (counts >= 3).sum(), len(counts))
+
+        return dfeValues
+
+    except Exception as e:
+        logger.error(f'Unable to get the batch valuation using the DFE method: {e}')
+        return None
+
+@instrumentation.timed('valuation')
+def discountedCashFlowBatch(fcf, shares, mask=None, discountingFactor=1.1, terminalFactor=10.0, model='lastSegment'):
+    '''valuation of a number of companies using the DCF method
+
+    This is the batch version of ``discountedCashFlow()``. The free cash flows and
+    the shares outstanding of all companies are supplied as 2d-arrays of the same
+    shape (tickers x years), along with an optional ``mask`` marking the values that
+    are valid for both. Each valuation is identical to the value that
+    ``discountedCashFlow()`` returns for the valid values of the same row, and a ``NaN``
+    is returned wherever the scalar function would return ``None``.
+
+    Parameters
+    ----------
+    fcf : numpy 2d-array
+        The free cash flow of each company for N years (tickers x years)
+    shares : numpy 2d-array
+        Number of free shares outstanding for each company. This should have the same
+        shape as ``fcf``.
+    mask : numpy 2d-array of bool or ``None``, optional
+        Marks the valid values within ``fcf`` and ``shares``, by default ``None``, in
+        which case all the values are considered valid.
+    discountingFactor : float, optional
+        The discounting factor by which future earnings shoule be discounted, by default 1.1
+        which represents a 10% valuation for the future value of money
+    terminalFactor : float, optional
+        The value by which the final extrapolated value should be multiplied so as to obtain
+        a terminal value of the company, by default 10
+    model : str, optional
+        How the values are extrapolated into the future: ``'lastSegment'``, ``'linearTrend'``
+        or ``'cagr'``, by default ``'lastSegment'``. See the ``extrapolation`` module.
+
+    Returns
+    -------
+    numpy 1d-array or None
+        The calculated valuation of each company, with ``NaN`` for companies that cannot be
+        valued. If the inputs themselves are inconsistent, a ``None`` will be returned.
+    '''
+
+    logger = logging.getLogger(logBase + 'discountedCashFlowBatch')
+
+    try:
+        fcf, mask = prepareBatch(fcf, mask)
+        shares, _ = prepareBatch(shares, mask)
+        counts    = mask.sum(axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fcfPerShare = fcf / shares
+            fcfExt = extrapolate(fcfPerShare, 5, model, mask)
+            dcfValues = discountBatch(fcfExt, discountingFactor, terminalFactor)
+
+        dcfValues[counts < 3] = np.nan
+        logger.debug('%d of %d companies valued', (counts >= 3).sum(), len(counts))
+
+        return dcfValues
+
+    except Exception as e:
+        logger.error(f'Unable to get the batch valuation using the DCF method: {e}')
+        return None
+
+@instrumentation.timed('valuation')
+def priceToSalesRatioBatch(revenue, shares, price, mask=None):
+    '''valuation of a number of companies using the P/S ratio method
+
+    This is the batch version of ``priceToSalesRatio()``. The revenues, shares
+    outstanding and prices of all companies are supplied as 2d-arrays of the same
+    shape (tickers x years), along with an optional ``mask`` marking the values that
+    are valid. Each valuation is identical to the value that ``priceToSalesRatio()``
+    returns for the valid values of the same row. Companies without any valid values
+    are assigned a ``NaN``.
+
+    Parameters
+    ----------
+    revenue : numpy 2d-array
+        The yearly revenues of each company for the last N years (tickers x years)
+    shares : numpy 2d-array
+        The number of shares outstanding for each company, for the same years as the revenue
+    price : numpy 2d-array
+        The price of a single share of each company, for the same years as the revenue
+    mask : numpy 2d-array of bool or ``None``, optional
+        Marks the valid values within the other inputs, by default ``None``, in which case
+        all the values are considered valid.
+
+    Returns
+    -------
+    numpy 1d-array or None
+        The valuation of each company according to the P/S method. If the inputs themselves
+        are inconsistent, a ``None`` will be returned.
+    '''
+
+    logger = logging.getLogger(logBase + 'priceToSalesRatioBatch')
+
+    try:
+        revenue, mask = prepareBatch(revenue, mask)
+        shares, _     = prepareBatch(shares, mask)
+        price, _      = prepareBatch(price, mask)
+
+        last, _ = lastValidIndices(mask)
+        rows    = np.arange(revenue.shape[0])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p_s       = price / ( revenue / shares )
+            mean_ps   = rowMeans(p_s, mask)
+            psValues  = mean_ps * (revenue[rows, last] / shares[rows, last])
+
+        psValues[last < 0] = np.nan
+
+        return psValues
+
+    except Exception as e:
+        logger.error(f'Unable to get the batch valuation using the P/S method: {e}')
+        return None
+
+@instrumentation.timed('valuation')
+def priceToEarningsRatioBatch(eps, price, mask=None):
+    '''valuation of a number of companies using the P/E ratio method
+
+    This is the batch version of ``priceToEarningsRatio()``. The EPS values and the
+    prices of all companies are supplied as 2d-arrays of the same shape (tickers x years),
+    along with an optional ``mask`` marking the values that are valid. Each valuation is
+    identical to the value that ``priceToEarningsRatio()`` returns for the valid values
+    of the same row. Companies without any valid values are assigned a ``NaN``.
+
+    Parameters
+    ----------
+    eps : numpy 2d-array
+        The yearly earnings per share of each company for the last N years (tickers x years)
+    price : numpy 2d-array
+        The price of a single share of each company, for the same years as the EPS values
+    mask : numpy 2d-array of bool or ``None``, optional
+        Marks the valid values within the other inputs, by default ``None``, in which case
+        all the values are considered valid.
+
+    Returns
+    -------
+    numpy 1d-array or None
+        The valuation of each company according to the P/E method. If the inputs themselves
+        are inconsistent, a ``None`` will be returned.
+    '''
+
+    logger = logging.getLogger(logBase + 'priceToEarningsRatioBatch')
+
+    try:
+        eps, mask = prepareBatch(eps, mask)
+        price, _  = prepareBatch(price, mask)
+
+        last, _ = lastValidIndices(mask)
+        rows    = np.arange(eps.shape[0])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p_e      = price / ( eps )
+            mean_pe  = rowMeans(p_e, mask)
+            peValues = mean_pe * (eps[rows, last])
+
+        peValues[last < 0] = np.nan
+
+        return peValues
+
+    except Exception as e:
+        logger.error(f'Unable to get the batch valuation using the P/E method: {e}')
+        return None
@@ -0,0 +1,140 @@
+'''Extrapolation of yearly values into the future
+
+The DFE and DCF valuations extend the yearly values of a company a few years
+into the future. The following models are available:
+
+``'lastSegment'`` (the default)
+    The line through the last two values is extended. This is the arithmetic
+    of ``scipy.interpolate.interp1d(..., fill_value='extrapolate')``, and gives
+    the same values bit for bit.
+``'linearTrend'``
+    The least-squares line through all the values is extended.
+``'cagr'``
+    The last value keeps growing at the compound annual growth rate between
+    the first and the last values. This needs both of them to be positive.
+
+Only NumPy is used. A 1d-array is extrapolated on its own, and the rows of a
+2d-array (tickers x years) are extrapolated all at once, using only the
+values that a mask marks as valid.
+'''
+
+import numpy as np
+
+models = ['lastSegment', 'linearTrend', 'cagr']
+
+def lastValidIndices(mask):
+    'Internal function - do not use'
+
+    # Returns the column of the last and the second-last valid value
+    # for every row. Rows without enough valid values get a -1, which
+    # is always masked out by the caller through the valid counts.
+    idx     = np.arange(mask.shape[1])
+    last    = np.where(mask, idx, -1).max(axis=1)
+    second  = np.where(mask & (idx < last[:, None]), idx, -1).max(axis=1)
+
+    return last, second
+
+def lastSegment(values, mask, nPoints):
+    'Internal function - do not use'
+
+    # ``interp1d`` extends the last segment as ``slope*(x - xLo) + yLo``, with
+    # the x values counting only the valid entries of every row.
+    last, second = lastValidIndices(mask)
+    rows = np.arange(values.shape[0])
+
+    yHi = values[rows, last]
+    yLo = values[rows, second]
+
+    slope  = (yHi - yLo) / 1.0
+    xDelta = np.arange(2, nPoints + 2, dtype=np.float64)
+
+    return slope[:, None] * xDelta[None, :] + yLo[:, None]
+
+def linearTrend(values, mask, nPoints):
+    'Internal function - do not use'
+
+    # The x values are the positions among the valid entries of every row,
+    # centred on their mean so that the slope is a plain ratio of sums
+    n   = mask.sum(axis=1).astype(np.float64)
+    x   = np.cumsum(mask, axis=1) - 1 - ((n - 1)/2)[:, None]
+    y   = np.where(mask, values, 0.0)
+    yMean = y.sum(axis=1) / n
+
+    sxy   = np.where(mask, x * (y - yMean[:, None]), 0.0).sum(axis=1)
+    sxx   = n * (n*n - 1) / 12
+    slope = sxy / sxx
+
+    xExt = (n - 1)/2 + 1
+    return yMean[:, None] + slope[:, None] * (xExt[:, None] + np.arange(nPoints))
+
+def cagr(values, mask, nPoints):
+    'Internal function - do not use'
+
+    n     = mask.sum(axis=1)
+    rows  = np.arange(values.shape[0])
+    first = values[rows, np.argmax(mask, axis=1)]
+    last  = values[rows, lastValidIndices(mask)[0]]
+
+    growth = np.where((first > 0) & (last > 0), last / first, np.nan) ** (1 / (n - 1.0))
+    return last[:, None] * growth[:, None] ** np.arange(1, nPoints + 1)
+
+kernels = {
+    'lastSegment' : lastSegment,
+    'linearTrend' : linearTrend,
+    'cagr'        : cagr,
+}
+
+def extrapolate(values, nPoints=5, model='lastSegment', mask=None):
+    '''extend yearly values into the future
+
+    Parameters
+    ----------
+    values : numpy 1d-array or 2d-array
+        The yearly values, oldest first. A 2d-array holds one row per company.
+    nPoints : int, optional
+        The number of future values, by default 5
+    model : str, optional
+        One of ``'lastSegment'``, ``'linearTrend'`` or ``'cagr'``, by default
+        ``'lastSegment'``. See the description of this module.
+    mask : numpy array of bool or ``None``, optional
+        Marks the valid values, by default ``None``, in which case all the values
+        are valid. The x value of each valid value is its position among the valid
+        values of its row.
+
+    Returns
+    -------
+    numpy 1d-array or 2d-array
+        The ``nPoints`` future values (of every row). Rows that do not have enough
+        valid values (two, and for ``'cagr'`` positive ones at both ends) get ``NaN``.
+
+    Raises
+    ------
+    ValueError
+        If ``model`` is not one of the above.
+    '''
+
+    if model not in kernels:
+        raise ValueError(f'Unknown extrapolation model {model}. Should be one of {models}')
+
+    values = np.asarray(values, dtype=np.float64)
+
+    if (values.ndim == 1) and (mask is None) and (model == 'lastSegment'):
+        # The common case of the scalar valuations, without the work of masking
+        if len(values) < 2:
+            return np.full(nPoints, np.nan)
+        yLo   = values[-2]
+        slope = (values[-1] - yLo) / 1.0
+        return slope * np.arange(2, nPoints + 2, dtype=np.float64) + yLo
+
+    single = values.ndim == 1
+    values = np.atleast_2d(values)
+    if mask is None:
+        mask = np.ones(values.shape, dtype=bool)
+    else:
+        mask = np.atleast_2d(np.asarray(mask, dtype=bool))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result = kernels[model](values, mask, nPoints)
+    result[mask.sum(axis=1) < 2] = np.nan
+
+    return result[0] if single else result
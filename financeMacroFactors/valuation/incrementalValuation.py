@@ -0,0 +1,302 @@
+'''Valuations that are updated one period at a time
+
+The valuation functions recompute everything from the full history of a
+company. When a single new year (or quarter) of data arrives for a universe
+of companies, the valuators within this module update the valuations of all
+of them with a fixed amount of work per company, independent of the length
+of the history:
+
+.. code-block:: python
+
+    pe = PriceToEarningsValuator(len(tickers))
+    for year in range(nYears):
+        pe.update(eps[:, year], price[:, year])
+    pe.values()         # same as priceToEarningsRatioBatch(eps, price)
+
+    pe.update(newEPS, newPrice, rows=arrived)   # only some companies reported
+    pe.values()
+
+The P/S and P/E valuators keep a running sum of the ratios. With a
+``window``, only the ratios of the last ``window`` periods are averaged: the
+ratio that leaves the window is subtracted from the sum, and the sum is
+recomputed from the retained ratios every time a window is completed so that
+rounding errors do not build up. The DFE and DCF valuators keep the last two
+values of every company, which is all that the ``'lastSegment'``
+extrapolation uses.
+
+Without a window, the valuations are identical to those of the batch (and
+scalar) functions for histories of fewer than eight periods, and agree to
+rounding error beyond that.
+'''
+
+import numpy as np
+
+from financeMacroFactors.valuation.batchValuation import discountBatch
+
+def selectRows(rows, nTickers):
+    'Internal function - do not use'
+
+    if rows is None:
+        return np.arange(nTickers)
+    rows = np.asarray(rows)
+    if rows.dtype == bool:
+        return np.flatnonzero(rows)
+    return rows.astype(np.intp)
+
+def selectValues(values, rows, nTickers):
+    'Internal function - do not use'
+
+    # Values are given either for the selected rows only, or for all the rows
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 0:
+        return np.full(len(rows), float(values))
+    if (len(values) == nTickers) and (len(rows) != nTickers):
+        return values[rows]
+    return values
+
+class RatioValuator:
+    '''running price ratio valuation of many companies
+
+    This is the common part of ``PriceToEarningsValuator`` and
+    ``PriceToSalesValuator``: the valuation of a company is the mean of its
+    ratios of the price to a per-share quantity (such as the EPS), times the
+    last value of that quantity.
+
+    Parameters
+    ----------
+    nTickers : int
+        The number of companies
+    window : int or ``None``, optional
+        The number of periods over which the ratios are averaged, by default ``None``
+        in which case all the periods are used
+    '''
+
+    def __init__(self, nTickers, window=None):
+
+        if (window is not None) and (window < 1):
+            raise ValueError(f'The window should be at least 1, not {window}')
+
+        self.nTickers = nTickers
+        self.window   = window
+        self.sums     = np.zeros(nTickers)
+        self.counts   = np.zeros(nTickers, dtype=np.int64)
+        self.last     = np.full(nTickers, np.nan)
+        if window is not None:
+            self.ratios   = np.zeros((nTickers, window))
+            self.position = np.zeros(nTickers, dtype=np.int64)
+
+    def addRatios(self, perShare, price, rows):
+        'Internal function - do not use'
+
+        rows     = selectRows(rows, self.nTickers)
+        perShare = selectValues(perShare, rows, self.nTickers)
+        price    = selectValues(price, rows, self.nTickers)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = price / perShare
+
+        self.last[rows] = perShare
+
+        if self.window is None:
+            self.sums[rows]   += ratio
+            self.counts[rows] += 1
+            return
+
+        position = self.position[rows]
+        full     = self.counts[rows] == self.window
+        evicted  = np.where(full, self.ratios[rows, position], 0.0)
+        with np.errstate(invalid='ignore'):
+            self.sums[rows] -= evicted
+            self.sums[rows] += ratio
+        self.ratios[rows, position] = ratio
+        self.counts[rows] = np.minimum(self.counts[rows] + 1, self.window)
+
+        position = (position + 1) % self.window
+        self.position[rows] = position
+
+        # Once a window is complete the ratios are in chronological order, and
+        # their sum replaces the running sum along with its rounding errors.
+        # An infinite ratio (from a value of 0) cannot be subtracted from the
+        # sum once it leaves the window, so those sums are recomputed as well.
+        resum = rows[(position == 0) | ~np.isfinite(evicted)]
+        self.sums[resum] = self.ratios[resum].sum(axis=1)
+
+    def values(self, rows=None):
+        '''the valuations of the companies
+
+        Parameters
+        ----------
+        rows : array of int or bool, or ``None``, optional
+            The companies, by default ``None`` for all of them
+
+        Returns
+        -------
+        numpy 1d-array
+            The valuations, with ``NaN`` for companies without any data
+        '''
+
+        rows = selectRows(rows, self.nTickers)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = self.sums[rows] / self.counts[rows]
+            return np.where(self.counts[rows] > 0, mean * self.last[rows], np.nan)
+
+class PriceToEarningsValuator(RatioValuator):
+    '''incrementally updated P/E valuations of many companies
+
+    The incremental counterpart of ``priceToEarningsRatioBatch()``. See
+    ``RatioValuator`` for the parameters.
+    '''
+
+    def update(self, eps, price, rows=None):
+        '''add a period of data
+
+        Parameters
+        ----------
+        eps : numpy 1d-array
+            The earnings per share of the companies for the new period
+        price : numpy 1d-array
+            The price of a share of the companies for the same period
+        rows : array of int or bool, or ``None``, optional
+            The companies that have new data, by default ``None`` for all of them. The
+            values are given either for these companies only, or for all of them.
+        '''
+        self.addRatios(eps, price, rows)
+
+class PriceToSalesValuator(RatioValuator):
+    '''incrementally updated P/S valuations of many companies
+
+    The incremental counterpart of ``priceToSalesRatioBatch()``. See
+    ``RatioValuator`` for the parameters.
+    '''
+
+    def update(self, revenue, shares, price, rows=None):
+        '''add a period of data
+
+        Parameters
+        ----------
+        revenue : numpy 1d-array
+            The revenue of the companies for the new period
+        shares : numpy 1d-array
+            The number of shares outstanding of the companies for the same period
+        price : numpy 1d-array
+            The price of a share of the companies for the same period
+        rows : array of int or bool, or ``None``, optional
+            The companies that have new data, by default ``None`` for all of them. The
+            values are given either for these companies only, or for all of them.
+        '''
+
+        rows = selectRows(rows, self.nTickers)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            salesPerShare = selectValues(revenue, rows, self.nTickers) / selectValues(shares, rows, self.nTickers)
+        self.addRatios(salesPerShare, price, rows)
+
+class LastSegmentValuator:
+    '''running discounted valuation of many companies
+
+    This is the common part of ``DiscountedFutureEarningsValuator`` and
+    ``DiscountedCashFlowValuator``. Only the last two values of every company are
+    kept, and extrapolated with the ``'lastSegment'`` model.
+
+    Parameters
+    ----------
+    nTickers : int
+        The number of companies
+    discountingFactor : float, optional
+        The discounting factor by which future earnings shoule be discounted, by default 1.1
+    terminalFactor : float, optional
+        The value by which the final extrapolated value is multiplied so as to obtain a
+        terminal value of the company, by default 10
+    '''
+
+    def __init__(self, nTickers, discountingFactor=1.1, terminalFactor=10.0):
+
+        self.nTickers          = nTickers
+        self.discountingFactor = discountingFactor
+        self.terminalFactor    = terminalFactor
+        self.last              = np.full(nTickers, np.nan)
+        self.second            = np.full(nTickers, np.nan)
+        self.counts            = np.zeros(nTickers, dtype=np.int64)
+
+    def addValues(self, values, rows):
+        'Internal function - do not use'
+
+        rows = selectRows(rows, self.nTickers)
+        self.second[rows]  = self.last[rows]
+        self.last[rows]    = selectValues(values, rows, self.nTickers)
+        self.counts[rows] += 1
+
+    def slopes(self, rows=None):
+        '''the slope of the last segment of every company (``NaN`` with fewer than two values)'''
+
+        rows = selectRows(rows, self.nTickers)
+        return (self.last[rows] - self.second[rows]) / 1.0
+
+    def values(self, rows=None):
+        '''the valuations of the companies
+
+        Parameters
+        ----------
+        rows : array of int or bool, or ``None``, optional
+            The companies, by default ``None`` for all of them
+
+        Returns
+        -------
+        numpy 1d-array
+            The valuations, with ``NaN`` for companies with fewer than 3 values
+        '''
+
+        rows = selectRows(rows, self.nTickers)
+
+        # The same arithmetic as the 'lastSegment' extrapolation
+        with np.errstate(invalid='ignore'):
+            extrapolated = self.slopes(rows)[:, None] * np.arange(2, 7, dtype=np.float64) + self.second[rows, None]
+            valuations   = discountBatch(extrapolated, self.discountingFactor, self.terminalFactor)
+
+        valuations[self.counts[rows] < 3] = np.nan
+        return valuations
+
+class DiscountedFutureEarningsValuator(LastSegmentValuator):
+    '''incrementally updated DFE valuations of many companies
+
+    The incremental counterpart of ``discountedFutureEarningsBatch()``. See
+    ``LastSegmentValuator`` for the parameters.
+    '''
+
+    def update(self, eps, rows=None):
+        '''add a period of data
+
+        Parameters
+        ----------
+        eps : numpy 1d-array
+            The earnings per share of the companies for the new period
+        rows : array of int or bool, or ``None``, optional
+            The companies that have new data, by default ``None`` for all of them. The
+            values are given either for these companies only, or for all of them.
+        '''
+        self.addValues(eps, rows)
+
+class DiscountedCashFlowValuator(LastSegmentValuator):
+    '''incrementally updated DCF valuations of many companies
+
+    The incremental counterpart of ``discountedCashFlowBatch()``. See
+    ``LastSegmentValuator`` for the parameters.
+    '''
+
+    def update(self, fcf, shares, rows=None):
+        '''add a period of data
+
+        Parameters
+        ----------
+        fcf : numpy 1d-array
+            The free cash flow of the companies for the new period
+        shares : numpy 1d-array
+            The number of shares outstanding of the companies for the same period
+        rows : array of int or bool, or ``None``, optional
+            The companies that have new data, by default ``None`` for all of them. The
+            values are given either for these companies only, or for all of them.
+        '''
+
+        rows = selectRows(rows, self.nTickers)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fcfPerShare = selectValues(fcf, rows, self.nTickers) / selectValues(shares, rows, self.nTickers)
+        self.addValues(fcfPerShare, rows)
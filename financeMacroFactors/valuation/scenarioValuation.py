@@ -0,0 +1,315 @@
+'''Valuations over many discounting and terminal factor scenarios
+
+The DFE and DCF valuations depend on the discounting factor and on the
+terminal factor, neither of which is known with any certainty. The functions
+within this module compute the distribution of valuations of a company (or of
+many companies) across thousands of scenarios at once.
+
+The extrapolation of the earnings is done only once per company. For the
+extrapolated values :math:`e_0 \\dots e_4`, a discounting factor :math:`d`
+and a terminal factor :math:`t`, the valuation is
+
+.. math::
+
+    V = \\sum_{k=0}^{3} e_k d^{-(k+1)} + t \\, e_4 d^{-5} = A(d) + B(d) \\, t
+
+:math:`A` and :math:`B` are obtained for all the discounting factors with a
+single matrix product, after which the valuations for all the terminal
+factors follow by broadcasting.
+'''
+
+import logging
+import numpy as np
+
+from financeMacroFactors import instrumentation
+from financeMacroFactors.valuation.batchValuation import prepareBatch
+from financeMacroFactors.valuation.extrapolation import extrapolate
+
+logBase = 'financeMacroFactors.valuation.scenarioValuation.'
+
+def sampleScenarios(nSamples, discountingFactor=(1.05, 1.15), terminalFactor=(8.0, 12.0), distribution='uniform', seed=None):
+    '''draw random discounting and terminal factors
+
+    Parameters
+    ----------
+    nSamples : int
+        The number of scenarios
+    discountingFactor : tuple, optional
+        The bounds ``(low, high)`` of the discounting factor for a uniform distribution,
+        or ``(mean, std)`` for a normal distribution, by default ``(1.05, 1.15)``
+    terminalFactor : tuple, optional
+        The same for the terminal factor, by default ``(8.0, 12.0)``
+    distribution : str, optional
+        Either ``'uniform'`` or ``'normal'``, by default ``'uniform'``
+    seed : int or ``None``, optional
+        Seed of the random number generator, by default ``None``
+
+    Returns
+    -------
+    tuple of numpy 1d-arrays
+        ``(discountingFactors, terminalFactors)``, each of length ``nSamples``
+    '''
+
+    rng = np.random.default_rng(seed)
+    if distribution == 'uniform':
+        draw = rng.uniform
+    elif distribution == 'normal':
+        draw = rng.normal
+    else:
+        raise ValueError(f'Unknown distribution {distribution}')
+
+    return draw(*discountingFactor, nSamples), draw(*terminalFactor, nSamples)
+
+def scenarioTerms(extrapolated, discountingFactors):
+    'Internal function - do not use'
+
+    # (scenarios x 5) matrix of discounts, the same as in the scalar functions
+    discountingFactors = np.asarray(discountingFactors, dtype=np.float64)
+    discounts = discountingFactors[:, None] ** np.arange(-1, -6, -1)[None, :]
+
+    A = extrapolated[:, :4] @ discounts[:, :4].T
+    B = extrapolated[:, 4:] * discounts[None, :, 4]
+
+    return A, B
+
+def sortableKeys(values):
+    'Internal function - do not use'
+
+    # Maps float64 values to int64 values with the same ordering
+    bits = np.asarray(values, dtype=np.float64).view(np.int64)
+    return bits ^ ((bits >> 63) & np.int64(0x7fffffffffffffff))
+
+def fromSortableKeys(keys):
+    'Internal function - do not use'
+
+    keys = np.asarray(keys, dtype=np.int64)
+    return (keys ^ ((keys >> 63) & np.int64(0x7fffffffffffffff))).view(np.float64)
+
+def countAtMost(A, B, tAscending, value):
+    'Internal function - do not use'
+
+    # Every row ``A[i] + B[i]*t`` is monotonic in ``t``, so the number of
+    # values within each row that are at most ``value`` is found with a
+    # binary search, run for all the rows at once. Rows with a negative B
+    # are searched through the terminal factors in descending order.
+    n     = len(tAscending)
+    lo    = np.zeros(len(A), dtype=np.int64)
+    hi    = np.full(len(A), n, dtype=np.int64)
+    flip  = B < 0
+    while (lo < hi).any():
+        mid   = (lo + hi) // 2
+        index = np.where(flip, n - 1 - np.minimum(mid, n - 1), np.minimum(mid, n - 1))
+        below = (A + B * tAscending[index] <= value) & (lo < hi)
+        lo    = np.where(below, mid + 1, lo)
+        hi    = np.where(below | (lo >= hi), hi, mid)
+
+    return lo.sum()
+
+def gridOrderStatistic(A, B, tAscending, k):
+    'Internal function - do not use'
+
+    # Bisection over the (ordered) bit patterns of float64 values, for the
+    # smallest value that has more than k grid values at or below it.
+    ends = np.concatenate([A + B * tAscending[0], A + B * tAscending[-1]])
+    lo, hi = sortableKeys(ends.min()) - 1, sortableKeys(ends.max())
+    while hi - lo > 1:
+        mid = lo + (hi - lo) // 2
+        if countAtMost(A, B, tAscending, fromSortableKeys(mid)) > k:
+            hi = mid
+        else:
+            lo = mid
+
+    return float(fromSortableKeys(hi))
+
+def gridPercentiles(A, B, terminalFactors, percentiles):
+    '''percentiles of the valuations ``A[i] + B[i]*terminalFactors[j]`` over all ``i, j``
+
+    The result is the same as that of ``np.percentile()`` (with linear interpolation)
+    on the full grid of valuations, but the grid is never created. Each order
+    statistic is found by a bisection, which needs ``O(len(A) log len(terminalFactors))``
+    operations per step.
+
+    Parameters
+    ----------
+    A : numpy 1d-array
+        The terms that do not depend on the terminal factor, one for each discounting factor
+    B : numpy 1d-array
+        The terms multiplied by the terminal factor, one for each discounting factor
+    terminalFactors : numpy 1d-array
+        The terminal factors
+    percentiles : list of float
+        The percentiles (between 0 and 100) to compute
+
+    Returns
+    -------
+    numpy 1d-array
+        The percentiles
+    '''
+
+    tAscending = np.sort(np.asarray(terminalFactors, dtype=np.float64))
+    percentiles = np.atleast_1d(np.asarray(percentiles, dtype=np.float64))
+    if np.isnan(A).any() or np.isnan(B).any() or np.isnan(tAscending).any():
+        return np.full(len(percentiles), np.nan)
+
+    N = len(A) * len(tAscending)
+    statistics = {}
+    result = []
+    for q in percentiles:
+        position = q / 100 * (N - 1)
+        k    = int(np.floor(position))
+        frac = position - k
+        for i in (k, min(k + 1, N - 1)):
+            if i not in statistics:
+                statistics[i] = gridOrderStatistic(A, B, tAscending, i)
+        low, high = statistics[k], statistics[min(k + 1, N - 1)]
+        result.append(low + (high - low) * frac)
+
+    return np.array(result)
+
+def scenarioValues(extrapolated, valid, discountingFactors, terminalFactors, grid, percentiles, chunkSize):
+    'Internal function - do not use'
+
+    discountingFactors = np.atleast_1d(np.asarray(discountingFactors, dtype=np.float64))
+    terminalFactors    = np.atleast_1d(np.asarray(terminalFactors, dtype=np.float64))
+    nTickers = len(extrapolated)
+
+    if not grid:
+        assert len(discountingFactors) == len(terminalFactors), \
+            'dimensions of the discounting and terminal factors are different'
+
+    A, B = scenarioTerms(extrapolated, discountingFactors)
+    A[~valid] = np.nan
+    B[~valid] = np.nan
+
+    if percentiles is None:
+        if grid:
+            return A[:, :, None] + B[:, :, None] * terminalFactors[None, None, :]
+        return A + B * terminalFactors[None, :]
+
+    percentiles = np.atleast_1d(percentiles)
+    if grid:
+        return np.stack([gridPercentiles(a, b, terminalFactors, percentiles) for a, b in zip(A, B)])
+
+    # The values of only a few tickers at a time are held in memory
+    result = np.empty((nTickers, len(percentiles)))
+    for start in range(0, nTickers, chunkSize):
+        values = A[start:start+chunkSize] + B[start:start+chunkSize] * terminalFactors[None, :]
+        result[start:start+chunkSize] = np.percentile(values, percentiles, axis=1).T
+
+    return result
+
+@instrumentation.timed('valuation')
+def discountedFutureEarningsScenarios(eps, discountingFactors, terminalFactors, grid=False, percentiles=None, mask=None, chunkSize=256, model='lastSegment'):
+    '''DFE valuations for many scenarios of discounting and terminal factors
+
+    For a single company, ``eps`` is a 1d-array like that of ``discountedFutureEarnings()``.
+    For many companies, it is a 2d-array (tickers x years), with an optional ``mask`` as in
+    ``discountedFutureEarningsBatch()``. The scenarios are either pairs of discounting and
+    terminal factors (for example as drawn by ``sampleScenarios()``), or, with ``grid=True``,
+    every combination of the supplied discounting and terminal factors.
+
+    Parameters
+    ----------
+    eps : numpy 1d-array or 2d-array
+        The earnings for share for the last N years of data (for every company)
+    discountingFactors : numpy 1d-array
+        The discounting factors of the scenarios
+    terminalFactors : numpy 1d-array
+        The terminal factors of the scenarios. Unless ``grid`` is ``True`` this should
+        have the same length as ``discountingFactors``.
+    grid : bool, optional
+        Use every combination of discounting and terminal factors, by default ``False``
+    percentiles : list of float or ``None``, optional
+        If supplied, only these percentiles (between 0 and 100) of the valuations are
+        returned for each company, by default ``None``. For a grid, the percentiles are
+        computed without ever creating the grid.
+    mask : numpy 2d-array of bool or ``None``, optional
+        Marks the valid values within a 2d ``eps``, by default ``None``
+    chunkSize : int, optional
+        The number of companies whose scenarios are held in memory at once when
+        computing percentiles, by default 256
+    model : str, optional
+        How the values are extrapolated into the future, by default ``'lastSegment'``.
+        See the ``extrapolation`` module.
+
+    Returns
+    -------
+    numpy array or None
+        The valuations, of shape ``(scenarios,)`` or ``(discountingFactors, terminalFactors)``
+        for a grid, or ``(percentiles,)`` if percentiles are requested. For many companies
+        there is an additional leading dimension. Companies that cannot be valued get
+        ``NaN`` values. If there is an error, a ``None`` is returned.
+    '''
+
+    logger = logging.getLogger(logBase + 'discountedFutureEarningsScenarios')
+
+    try:
+        single = np.ndim(eps) == 1
+        eps, mask = prepareBatch(eps, mask)
+
+        with np.errstate(invalid='ignore'):
+            epsExt = extrapolate(eps, 5, model, mask)
+            values = scenarioValues(epsExt, mask.sum(axis=1) >= 3, discountingFactors,
+                        terminalFactors, grid, percentiles, chunkSize)
+
+        return values[0] if single else values
+
+    except Exception as e:
+        logger.error(f'Unable to get the scenario valuations using the DFE method: {e}')
+        return None
+
+@instrumentation.timed('valuation')
+def discountedCashFlowScenarios(fcf, shares, discountingFactors, terminalFactors, grid=False, percentiles=None, mask=None, chunkSize=256, model='lastSegment'):
+    '''DCF valuations for many scenarios of discounting and terminal factors
+
+    This is the same as ``discountedFutureEarningsScenarios()``, for the valuation of
+    ``discountedCashFlow()``. ``fcf`` and ``shares`` are either 1d-arrays for a single
+    company, or 2d-arrays (tickers x years) for many companies.
+
+    Parameters
+    ----------
+    fcf : numpy 1d-array or 2d-array
+        The free cash flow for N years (of every company)
+    shares : numpy 1d-array or 2d-array
+        Number of free shares outstanding, with the same shape as ``fcf``
+    discountingFactors : numpy 1d-array
+        The discounting factors of the scenarios
+    terminalFactors : numpy 1d-array
+        The terminal factors of the scenarios
+    grid : bool, optional
+        Use every combination of discounting and terminal factors, by default ``False``
+    percentiles : list of float or ``None``, optional
+        If supplied, only these percentiles of the valuations are returned, by default ``None``
+    mask : numpy 2d-array of bool or ``None``, optional
+        Marks the valid values for 2d inputs, by default ``None``
+    chunkSize : int, optional
+        The number of companies whose scenarios are held in memory at once when
+        computing percentiles, by default 256
+    model : str, optional
+        How the values are extrapolated into the future, by default ``'lastSegment'``.
+        See the ``extrapolation`` module.
+
+    Returns
+    -------
+    numpy array or None
+        The valuations, shaped as for ``discountedFutureEarningsScenarios()``. If there
+        is an error, a ``None`` is returned.
+    '''
+
+    logger = logging.getLogger(logBase + 'discountedCashFlowScenarios')
+
+    try:
+        single = np.ndim(fcf) == 1
+        fcf, mask = prepareBatch(fcf, mask)
+        shares, _ = prepareBatch(shares, mask)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fcfExt = extrapolate(fcf / shares, 5, model, mask)
+            values = scenarioValues(fcfExt, mask.sum(axis=1) >= 3, discountingFactors,
+                        terminalFactors, grid, percentiles, chunkSize)
+
+        return values[0] if single else values
+
+    except Exception as e:
+        logger.error(f'Unable to get the scenario valuations using the DCF method: {e}')
+        return None
@@ -0,0 +1,225 @@
+'''Valuations at every date of a history
+
+Charting the value of a company against its price needs the valuation at
+every date, each using the data of the few years before it. The functions
+within this module take the full (aligned) histories of a company, or of
+many companies (tickers x dates), and return the valuation for every window
+of ``window`` consecutive dates, placed at the last date of the window.
+
+The windows are strided views of the histories
+(``numpy.lib.stride_tricks.sliding_window_view``), so that no data is copied
+until they are stacked into a single call of the batch valuation functions.
+There is no loop over the dates. ``NaN`` values are treated as missing, and
+every valuation is identical to that of the scalar function for the valid
+values of its window.
+'''
+
+import logging
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from financeMacroFactors import instrumentation
+from financeMacroFactors.valuation import batchValuation
+
+logBase = 'financeMacroFactors.valuation.timeSeriesValuation.'
+
+def windowed(window, *series):
+    'Internal function - do not use'
+
+    # Every series becomes a 2d-array with one row per window, and the mask
+    # marks the dates for which all of the series have a value
+    series = [np.asarray(s, dtype=np.float64) for s in series]
+    shape  = series[0].shape
+    assert all(s.shape == shape for s in series), 'dimensions of the series are different'
+    assert 1 <= window <= shape[-1], f'the window should be between 1 and the number of dates ({shape[-1]})'
+
+    valid   = ~np.any([np.isnan(s) for s in series], axis=0)
+    views   = [sliding_window_view(s, window, axis=-1) for s in series + [valid]]
+    stacked = [v.reshape(-1, window) for v in views]
+
+    return stacked[:-1], stacked[-1], shape
+
+def unwindowed(values, shape, window):
+    'Internal function - do not use'
+
+    # The valuations are placed at the last date of every window, with NaN for
+    # the dates before the first complete window
+    result = np.full(shape, np.nan)
+    result[..., window-1:] = values.reshape(shape[:-1] + (shape[-1] - window + 1,))
+    return result
+
+@instrumentation.timed('valuation')
+def discountedFutureEarningsSeries(eps, window=5, discountingFactor=1.1, terminalFactor=10.0, model='lastSegment'):
+    '''DFE valuations at every date
+
+    Parameters
+    ----------
+    eps : numpy 1d-array or 2d-array
+        The earnings per share at every date, oldest first (or tickers x dates), with
+        ``NaN`` for missing values
+    window : int, optional
+        The number of dates used by every valuation, by default 5
+    discountingFactor : float, optional
+        The discounting factor by which future earnings shoule be discounted, by default 1.1
+    terminalFactor : float, optional
+        The value by which the final extrapolated EPS value should be multiplied so as to obtain
+        a terminal value of the company, by default 10
+    model : str, optional
+        How the values are extrapolated into the future, by default ``'lastSegment'``
+
+    Returns
+    -------
+    numpy array or None
+        The valuations, of the same shape as ``eps``. The valuation at a date uses the
+        ``window`` dates ending at it, and is ``NaN`` for the first ``window - 1`` dates and
+        wherever fewer than 3 values are valid. If there is an error, a ``None`` is returned.
+    '''
+
+    logger = logging.getLogger(logBase + 'discountedFutureEarningsSeries')
+
+    try:
+        (eps,), mask, shape = windowed(window, eps)
+        values = batchValuation.discountedFutureEarningsBatch(eps, mask, discountingFactor, terminalFactor, model)
+        return unwindowed(values, shape, window)
+
+    except Exception as e:
+        logger.error(f'Unable to get the DFE valuation series: {e}')
+        return None
+
+@instrumentation.timed('valuation')
+def discountedCashFlowSeries(fcf, shares, window=5, discountingFactor=1.1, terminalFactor=10.0, model='lastSegment'):
+    '''DCF valuations at every date
+
+    Parameters
+    ----------
+    fcf : numpy 1d-array or 2d-array
+        The free cash flow at every date, oldest first (or tickers x dates), with ``NaN``
+        for missing values
+    shares : numpy 1d-array or 2d-array
+        The number of shares outstanding, of the same shape as ``fcf``
+    window : int, optional
+        The number of dates used by every valuation, by default 5
+    discountingFactor : float, optional
+        The discounting factor by which future earnings shoule be discounted, by default 1.1
+    terminalFactor : float, optional
+        The value by which the final extrapolated value should be multiplied so as to obtain
+        a terminal value of the company, by default 10
+    model : str, optional
+        How the values are extrapolated into the future, by default ``'lastSegment'``
+
+    Returns
+    -------
+    numpy array or None
+        The valuations, of the same shape as ``fcf``, as for ``discountedFutureEarningsSeries()``
+    '''
+
+    logger = logging.getLogger(logBase + 'discountedCashFlowSeries')
+
+    try:
+        (fcf, shares), mask, shape = windowed(window, fcf, shares)
+        values = batchValuation.discountedCashFlowBatch(fcf, shares, mask, discountingFactor, terminalFactor, model)
+        return unwindowed(values, shape, window)
+
+    except Exception as e:
+        logger.error(f'Unable to get the DCF valuation series: {e}')
+        return None
+
+@instrumentation.timed('valuation')
+def priceToSalesRatioSeries(revenue, shares, price, window=5):
+    '''P/S valuations at every date
+
+    Parameters
+    ----------
+    revenue : numpy 1d-array or 2d-array
+        The revenue at every date, oldest first (or tickers x dates), with ``NaN`` for
+        missing values
+    shares : numpy 1d-array or 2d-array
+        The number of shares outstanding, of the same shape as ``revenue``
+    price : numpy 1d-array or 2d-array
+        The price of a share, of the same shape as ``revenue``
+    window : int, optional
+        The number of dates over which the P/S ratio is averaged, by default 5
+
+    Returns
+    -------
+    numpy array or None
+        The valuations, of the same shape as ``revenue``. The valuation at a date uses the
+        ``window`` dates ending at it, and is ``NaN`` for the first ``window - 1`` dates and
+        wherever no value is valid. If there is an error, a ``None`` is returned.
+    '''
+
+    logger = logging.getLogger(logBase + 'priceToSalesRatioSeries')
+
+    try:
+        (revenue, shares, price), mask, shape = windowed(window, revenue, shares, price)
+        values = batchValuation.priceToSalesRatioBatch(revenue, shares, price, mask)
+        return unwindowed(values, shape, window)
+
+    except Exception as e:
+        logger.error(f'Unable to get the P/S valuation series: {e}')
+        return None
+
+@instrumentation.timed('valuation')
+def priceToEarningsRatioSeries(eps, price, window=5):
+    '''P/E valuations at every date
+
+    Parameters
+    ----------
+    eps : numpy 1d-array or 2d-array
+        The earnings per share at every date, oldest first (or tickers x dates), with
+        ``NaN`` for missing values
+    price : numpy 1d-array or 2d-array
+        The price of a share, of the same shape as ``eps``
+    window : int, optional
+        The number of dates over which the P/E ratio is averaged, by default 5
+
+    Returns
+    -------
+    numpy array or None
+        The valuations, of the same shape as ``eps``, as for ``priceToSalesRatioSeries()``
+    '''
+
+    logger = logging.getLogger(logBase + 'priceToEarningsRatioSeries')
+
+    try:
+        (eps, price), mask, shape = windowed(window, eps, price)
+        values = batchValuation.priceToEarningsRatioBatch(eps, price, mask)
+        return unwindowed(values, shape, window)
+
+    except Exception as e:
+        logger.error(f'Unable to get the P/E valuation series: {e}')
+        return None
+
+def valuationSeries(eps=None, fcf=None, revenue=None, shares=None, price=None, window=5,
+                    discountingFactor=1.1, terminalFactor=10.0, model='lastSegment'):
+    '''all the valuations at every date that the supplied histories allow
+
+    Parameters
+    ----------
+    eps, fcf, revenue, shares, price : numpy 1d-array or 2d-array or ``None``, optional
+        The aligned histories (of the same shape), by default ``None`` for those that are
+        not available
+    window : int, optional
+        The number of dates used by every valuation, by default 5
+    discountingFactor, terminalFactor, model : optional
+        As for ``discountedFutureEarningsSeries()``
+
+    Returns
+    -------
+    dict
+        Maps ``'DFE'`` (which needs ``eps``), ``'DCF'`` (``fcf`` and ``shares``), ``'P/S'``
+        (``revenue``, ``shares`` and ``price``) and ``'P/E'`` (``eps`` and ``price``) to the
+        valuation series, for the methods whose inputs are supplied.
+    '''
+
+    result = {}
+    if eps is not None:
+        result['DFE'] = discountedFutureEarningsSeries(eps, window, discountingFactor, terminalFactor, model)
+    if (fcf is not None) and (shares is not None):
+        result['DCF'] = discountedCashFlowSeries(fcf, shares, window, discountingFactor, terminalFactor, model)
+    if (revenue is not None) and (shares is not None) and (price is not None):
+        result['P/S'] = priceToSalesRatioSeries(revenue, shares, price, window)
+    if (eps is not None) and (price is not None):
+        result['P/E'] = priceToEarningsRatioSeries(eps, price, window)
+
+    return result
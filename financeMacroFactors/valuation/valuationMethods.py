@@ -1,9 +1,12 @@
 import numpy as np
-from scipy import interpolate
 import logging
 
+from financeMacroFactors import instrumentation
+from financeMacroFactors.valuation.extrapolation import extrapolate
 
-def discountedFutureEarnings(eps, discountingFactor=1.1, terminalFactor=10.0):
+
+@instrumentation.timed('valuation')
+def discountedFutureEarnings(eps, discountingFactor=1.1, terminalFactor=10.0, model='lastSegment'):
     '''obtain DFE Valuation
 
     Calculate the valuation using the Discounted Future Earnings valuation method.
@@ -22,6 +25,9 @@ def discountedFutureEarnings(eps, discountingFactor=1.1, terminalFactor=10.0):
     terminalFactor : float, optional
         The value by which the final extrapolated EPS value should be multiplied so as to obtain
         a terminal value of the company, by default 10
+    model : str, optional
+        How the values are extrapolated into the future: ``'lastSegment'``, ``'linearTrend'``
+        or ``'cagr'``, by default ``'lastSegment'``. See the ``extrapolation`` module.
 
     Returns
     -------
@@ -40,18 +46,14 @@ def discountedFutureEarnings(eps, discountingFactor=1.1, terminalFactor=10.0):
             logger.error('The result will not be good. A Null value will be returned.')
             return None
 
-        xVals = np.arange(N)
-        xExt  = np.arange(5) + 1 + xVals[-1]
-
         logger.debug('Extrapolating values to the next 5 points')
-        f = interpolate.interp1d(xVals, eps, fill_value="extrapolate")
-        epsExt = f(xExt)
+        epsExt = extrapolate(eps, 5, model)
         epsExt[-1] *= terminalFactor
-        logger.debug(f'Extrapolated EPS = {epsExt}')
+        logger.debug('Extrapolated EPS = %s', epsExt)
 
         logger.debug('Generating the discounting factor')
         discount = (np.ones(5)*discountingFactor)**np.arange(-1,-6, -1)
-        logger.debug(f'discounting factor = {discount}')
+        logger.debug('discounting factor = %s', discount)
 
         logger.debug('Calculating the DFE')
         dfeValue = epsExt @ discount
@@ -69,7 +71,8 @@ def discountedFutureEarnings(eps, discountingFactor=1.1, terminalFactor=10.0):
 
     return dfeValue
 
-def discountedCashFlow(fcf, shares, discountingFactor=1.1, terminalFactor=10.0):
+@instrumentation.timed('valuation')
+def discountedCashFlow(fcf, shares, discountingFactor=1.1, terminalFactor=10.0, model='lastSegment'):
     '''valuation of a company using the DCF method
 
     This funciton calculates the valuation of a company using the Discounted Cash Flow method.
@@ -90,6 +93,9 @@ def discountedCashFlow(fcf, shares, discountingFactor=1.1, terminalFactor=10.0):
     terminalFactor : float, optional
         The value by which the final extrapolated EPS value should be multiplied so as to obtain
         a terminal value of the company, by default 10
+    model : str, optional
+        How the values are extrapolated into the future: ``'lastSegment'``, ``'linearTrend'``
+        or ``'cagr'``, by default ``'lastSegment'``. See the ``extrapolation`` module.
 
     Returns
     -------
@@ -118,18 +124,15 @@ def discountedCashFlow(fcf, shares, discountingFactor=1.1, terminalFactor=10.0):
 
 
         fcfPerShare = fcf/shares
-        xVals = np.arange(N)
-        xExt  = np.arange(5) + 1 + xVals[-1]
 
         logger.debug('Extrapolating values to the next 5 points')
-        f = interpolate.interp1d(xVals, fcfPerShare, fill_value="extrapolate")
-        fcfExt = f(xExt)
+        fcfExt = extrapolate(fcfPerShare, 5, model)
         fcfExt[-1] *= terminalFactor
-        logger.debug(f'Extrapolated EPS = {fcfExt}')
+        logger.debug('Extrapolated EPS = %s', fcfExt)
 
         logger.debug('Generating the discounting factor')
         discount = (np.ones(5)*discountingFactor)**np.arange(-1,-6, -1)
-        logger.debug(f'discounting factor = {discount}')
+        logger.debug('discounting factor = %s', discount)
 
         logger.debug('Calculating the DFE')
         dcfValue = fcfExt @ discount
@@ -149,6 +152,7 @@ def discountedCashFlow(fcf, shares, discountingFactor=1.1, terminalFactor=10.0):
 
     return dfeValue
 
+@instrumentation.timed('valuation')
 def priceToSalesRatio(revenue, shares, price):
     '''valuation of a company using the P/S ration method
 
@@ -220,6 +224,7 @@ def priceToSalesRatio(revenue, shares, price):
 
     return psValue
 
+@instrumentation.timed('valuation')
 def priceToEarningsRatio(eps, price):
     '''valuation of a company using the P/E ration method
 
@@ -22,18 +22,25 @@ setup(
     package_data={'':['**/*.json']},
     classifiers=[
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
     install_requires=[
-        'beautifulsoup4>=4.9.1',
         'requests>=2.24.0',
         'lxml>=4.5.2',
-        'numpy>=1.19.1',
-        'scipy>=1.5.2'
+        'numpy>=1.20',
     ],
-    python_requires='>=3.6',
+    extras_require={
+        'parquet': ['pyarrow'],
+        'async':   ['aiohttp'],
+        'zstd':    ['zstandard'],
+    },
+    entry_points={
+        'console_scripts': [
+            'financeMacroFactors-universe=financeMacroFactors.pipeline:main',
+        ],
+    },
+    python_requires='>=3.7',
 )
 
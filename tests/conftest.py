@@ -0,0 +1,104 @@
+import os
+import threading
+import pytest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+dataFolder = os.path.join(os.path.dirname(__file__), 'data')
+
+# Paths served by the local stand-in, and the recorded page for each
+routes = [
+    ('/financials/income/quarter',        'mw_IncomeStatementQuarter.html'),
+    ('/financials/balance-sheet/quarter', 'mw_BalanceSheetQuarter.html'),
+    ('/financials/cash-flow/quarter',     'mw_CashFlowQuarter.html'),
+    ('/financials/balance-sheet',         'mw_BalanceSheet.html'),
+    ('/financials/cash-flow',             'mw_CashFlow.html'),
+    ('/financials',                       'mw_IncomeStatement.html'),
+    ('/history',                          'yahoo_history.html'),
+    ('/wiki/List_of_S%26P_500_companies', 'wikipedia_snp500.html'),
+]
+
+def recordedPage(name):
+    with open(os.path.join(dataFolder, name), 'rb') as f:
+        return f.read()
+
+def calendarYear(info):
+    '''a copy of a yearly statement, with fiscal years from January to December'''
+    title = info[0][0].replace('October-September', 'January-December')
+    return [[title] + info[0][1:]] + [row[:] for row in info[1:]]
+
+class RecordedPageHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        path   = self.path.split('?')[0]
+
+        with server.lock:
+            server.requests.append(self.path)
+            server.active += 1
+            server.maxActive = max(server.maxActive, server.active)
+            failures = server.failures.get(path, 0)
+            if failures:
+                server.failures[path] = failures - 1
+            truncations = server.truncations.get(path, 0)
+            if truncations:
+                server.truncations[path] = truncations - 1
+
+        try:
+            if server.delay:
+                threading.Event().wait(server.delay)
+
+            if failures:
+                self.send_response(server.failureStatus)
+                if server.retryAfter is not None:
+                    self.send_header('Retry-After', str(server.retryAfter))
+                self.end_headers()
+                return
+
+            for suffix, name in routes:
+                if path.endswith(suffix):
+                    body = recordedPage(name)
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body[:len(body)//2] if truncations else body)
+                    return
+
+            self.send_response(404)
+            self.end_headers()
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def recordedServer():
+    '''a local HTTP server that serves the recorded pages in ``tests/data``
+
+    ``server.failures`` maps a path to the number of ``server.failureStatus``
+    (``503`` by default) responses to return before the page is served, with
+    a ``Retry-After`` header if ``server.retryAfter`` is set. ``server.truncations``
+    does the same for responses whose body is cut in half. ``server.delay``
+    delays every response and ``server.requests``/``server.maxActive`` record
+    what was asked for.
+    '''
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RecordedPageHandler)
+    server.lock          = threading.Lock()
+    server.requests      = []
+    server.failures      = {}
+    server.truncations   = {}
+    server.failureStatus = 503
+    server.retryAfter    = None
+    server.delay         = 0
+    server.active        = 0
+    server.maxActive     = 0
+    server.baseURL       = f'http://127.0.0.1:{server.server_address[1]}'
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,750 @@
+import pytest
+import numpy as np
+from financeMacroFactors import companies
+from financeMacroFactors.companies import marketWarchData as mw
+
+def test_getDataFromMWURL(recordedServer):
+
+    url  = recordedServer.baseURL + '/investing/stock/aapl/financials'
+    data = mw.getDataFromMWURL(url)
+
+    assert data[0] == ['Fiscal year is October-September. All values USD Millions.', '2015', '2016', '2017', '2018', '2019']
+    rows = {d[0]: d[1:] for d in data[1:]}
+    assert rows['Sales/Revenue'][0] == 233.72e9
+    assert rows['Unusual Expense'][-1] == -1.81e9
+    assert rows['EPS (Diluted)'] == [2.30, 2.08, 2.30, 2.98, 2.97]
+    assert 'Sales Growth' not in rows
+    return
+
+def test_getTickersFundamentalDataMW(recordedServer):
+
+    recordedServer.delay = 0.02
+    recordedServer.failures['/investing/stock/msft/financials/cash-flow'] = 2
+
+    progress = []
+    results  = companies.getTickersFundamentalDataMW(
+        ['aapl', 'msft', 'xom', 'aapl'], perHostLimit=3, backoff=0.01,
+        progress=lambda *p: progress.append(p), baseURL=recordedServer.baseURL)
+
+    assert list(results) == ['aapl', 'msft', 'xom']
+    assert sorted(p[0] for p in progress) == ['aapl', 'msft', 'xom']
+    assert [p[1] for p in progress] == [1, 2, 3]
+    assert recordedServer.maxActive <= 3
+    assert len(recordedServer.requests) == 18 + 2
+
+    url = recordedServer.baseURL + '/investing/stock/msft/financials/cash-flow'
+    for ticker in results:
+        assert list(results[ticker]) == list(mw.mwStatementPaths)
+    assert results['msft']['CashFlow'] == mw.getDataFromMWURL(url)
+
+    # Pages that keep failing are returned as empty lists
+    recordedServer.failures['/investing/stock/ibm/financials'] = 10
+    results = companies.getTickersFundamentalDataMW(['ibm'], retries=1, backoff=0.01, baseURL=recordedServer.baseURL)
+    assert results['ibm']['IncomeStatement'] == []
+    assert results['ibm']['CashFlow'] != []
+
+    # Throttled statements can be told apart from those without data
+    recordedServer.failureStatus = 429
+    recordedServer.failures['/investing/stock/ibm/financials'] = 10
+    results, errors = companies.getTickersFundamentalDataMW(['aapl', 'ibm'], retries=1, backoff=0.01,
+                                                            baseURL=recordedServer.baseURL, returnErrors=True)
+    assert results['ibm']['IncomeStatement'] == []
+    assert list(errors) == ['ibm'] and list(errors['ibm']) == ['IncomeStatement']
+    assert errors['ibm']['IncomeStatement'].transient
+    assert errors['ibm']['IncomeStatement'].result.status == 429
+
+    recordedServer.failures['/investing/stock/ibm/financials'] = 10
+    with pytest.raises(companies.FetchError) as throttled:
+        mw.getDataFromMWURL(recordedServer.baseURL + '/investing/stock/ibm/financials', raiseErrors=True)
+    with pytest.raises(companies.FetchError) as missing:
+        mw.getDataFromMWURL(recordedServer.baseURL + '/missing', raiseErrors=True)
+    assert throttled.value.transient and not missing.value.transient
+    assert mw.getDataFromMWURL(recordedServer.baseURL + '/missing') == []
+
+    # Pages cut short are retried, and are transient errors once the retries run out
+    url = recordedServer.baseURL + '/investing/stock/ibm/financials'
+    recordedServer.failures.clear()
+    recordedServer.truncations['/investing/stock/ibm/financials'] = 1
+    assert mw.getDataFromMWURL(url) == results['aapl']['IncomeStatement']
+    recordedServer.truncations['/investing/stock/ibm/financials'] = 10
+    with pytest.raises(companies.FetchError) as truncated:
+        mw.getDataFromMWURL(url, raiseErrors=True)
+    assert truncated.value.transient
+    return
+
+def test_responseCache(recordedServer, tmp_path):
+
+    from financeMacroFactors.companies import responseCache
+
+    cache = responseCache.configureCache(str(tmp_path / 'cache.sqlite'))
+    try:
+        url   = recordedServer.baseURL + '/investing/stock/aapl/financials'
+        cold  = mw.getDataFromMWURL(url)
+        warm  = mw.getDataFromMWURL(url)
+        assert cold == warm
+        assert len(recordedServer.requests) == 1
+
+        # the parameters are a part of the key
+        mw.getDataFromMWURL(url, convert=False)
+        assert len(recordedServer.requests) == 2
+
+        # the multi-ticker API shares the same entries
+        companies.getTickersFundamentalDataMW(['aapl'], baseURL=recordedServer.baseURL)
+        assert len(recordedServer.requests) == 2 + 5
+
+        # expired entries are not returned
+        cache.ttls['marketwatch'] = -1
+        assert cache.get('marketwatch', url, {'convert': True}) == (False, None)
+    finally:
+        responseCache.disableCache()
+
+    # least recently used entries are evicted beyond the byte budget
+    cache = responseCache.ResponseCache(str(tmp_path / 'small.sqlite'), maxBytes=3100)
+    for i in range(3):
+        cache.put('test', f'url{i}', 'x'*1000)
+    cache.get('test', 'url0')
+    cache.put('test', 'url3', 'x'*1000)
+    assert cache.get('test', 'url0')[0]
+    assert not cache.get('test', 'url1')[0]
+    assert cache.totalBytes() <= 3100
+    return
+
+def test_pageArchive(recordedServer, tmp_path, monkeypatch):
+
+    from datetime import datetime as dt
+    from financeMacroFactors.companies import pageArchive, yahooData, companyLists
+
+    monkeypatch.setattr(yahooData, 'yahooBaseURL', recordedServer.baseURL)
+    monkeypatch.setattr(companyLists, 'snp500URL', recordedServer.baseURL + '/wiki/List_of_S%26P_500_companies')
+
+    url = recordedServer.baseURL + '/investing/stock/aapl/financials'
+    try:
+        archive = pageArchive.configureArchive(str(tmp_path / 'pages'))
+        fundamentals = companies.getTickersFundamentalDataMW(['aapl', 'msft'], baseURL=recordedServer.baseURL)
+        prices       = companies.getStockDataYahoo('aapl', dt(2019, 1, 1), dt(2020, 8, 2))
+        snp500       = companies.getSNP500CompanyList()
+        assert len(archive) == 2*6 + 2
+        assert len(recordedServer.requests) == 14
+
+        # Pages that did not change are indexed again without being stored again
+        assert not archive.put(url, archive.get(url))
+        assert len(archive.versions(url)) == 2
+        assert archive.stats()['packedBytes'] < archive.stats()['bytes'] / 3
+
+        # Replaying gives the same results without any request
+        pageArchive.configureArchive(str(tmp_path / 'pages'), replay=True)
+        assert companies.getTickersFundamentalDataMW(['aapl', 'msft'], baseURL=recordedServer.baseURL,
+                                                     parseProcesses=2) == fundamentals
+        assert companies.getStockDataYahoo('aapl', dt(2019, 1, 1), dt(2020, 8, 2)) == prices
+        assert companies.getSNP500CompanyList() == snp500
+        assert len(recordedServer.requests) == 14
+
+        # Prices are replayed from the page of the same ticker and frequency whose dates cover them
+        assert companies.getStockDataYahoo('aapl', dt(2019, 6, 1), dt(2020, 1, 1)) == prices
+        assert companies.getStockDataYahoo('aapl', dt(2018, 6, 1), dt(2020, 1, 1)) == []
+        assert companies.getStockDataYahoo('aapl', dt(2019, 6, 1), dt(2020, 1, 1), frequency='1wk') == []
+        assert companies.getStockDataYahoo('msft', dt(2019, 6, 1), dt(2020, 1, 1)) == []
+
+        # A page that ends when it was downloaded covers every later end date
+        replay = pageArchive.getArchive()
+        replay.put(yahooData.historyURL('msft', dt(2015, 1, 1), dt(2021, 1, 1), '1mo'),
+                   replay.get(yahooData.historyURL('aapl', dt(2019, 1, 1), dt(2020, 8, 2), '1mo')),
+                   fetched=dt(2021, 1, 1, 12))
+        assert companies.getStockDataYahoo('msft', dt(2016, 1, 1), dt(2022, 1, 1)) == prices
+        assert len(recordedServer.requests) == 14
+
+        # Pages that are not within the archive are errors
+        assert mw.getDataFromMWURL(recordedServer.baseURL + '/investing/stock/ibm/financials') == []
+        assert len(recordedServer.requests) == 14
+    finally:
+        pageArchive.disableArchive()
+
+    # Versions are found by the time at which they were downloaded
+    archive = companies.PageArchive(str(tmp_path / 'versions'))
+    assert archive.put('page', 'first', fetched=dt(2020, 1, 1))
+    assert archive.put('page', 'second', fetched=dt(2021, 1, 1))
+    assert archive.get('page', dt(2020, 6, 1)) == 'first'
+    assert archive.get('page', dt(2020, 6, 1).date()) == 'first'
+    assert archive.get('page') == 'second'
+    assert archive.get('page', dt(2019, 1, 1)) is None
+    assert list(archive.iterPages('pa')) == [('page', 'second')]
+    with pytest.raises(ValueError):
+        companies.PageArchive(str(tmp_path / 'versions'), compression='bz2')
+
+    # Pages keep the compression with which they were written
+    try:
+        import zstandard
+    except ImportError:
+        with pytest.raises(ImportError):
+            companies.PageArchive(str(tmp_path / 'versions'), compression='zstd')
+    else:
+        archive = companies.PageArchive(str(tmp_path / 'versions'), compression='zstd')
+        assert archive.put('page', 'third', fetched=dt(2022, 1, 1))
+        assert archive.get('page', dt(2021, 6, 1)) == 'second'
+        assert archive.get('page') == 'third'
+    return
+
+def test_iterTableRows():
+
+    from financeMacroFactors.companies.tableParser import iterTableRows
+
+    html_data = '''<html><body><table id="a"><tr><th>x</th><th>y</th></tr>
+        <tr><td><a>1</a>,000</td><td>2 &amp; 3</td></tr></table>
+        <table id="b"><tr><td>4</td></tr></table></body></html>'''
+
+    rows = list(iterTableRows(html_data, chunkSize=7))
+    assert rows == [
+        (0, 0, [('th', 'x'), ('th', 'y')]),
+        (0, 1, [('td', '1,000'), ('td', '2 & 3')]),
+        (1, 0, [('td', '4')]) ]
+    assert list(iterTableRows(html_data, tableId='b')) == [(1, 0, [('td', '4')])]
+    assert list(iterTableRows('')) == []
+    return
+
+def test_parseSNP500CompanyList():
+
+    from financeMacroFactors.companies import companyLists
+    from conftest import recordedPage
+
+    results = companyLists.parseSNP500CompanyList(recordedPage('wikipedia_snp500.html'))
+    assert len(results) == 8
+    assert results[0]['Symbol'] == 'MMM'
+    assert results[3]['GICS Sub-Industry'] == 'IT Consulting & Other Services'
+    return
+
+def test_FundamentalFrame():
+
+    from conftest import recordedPage
+
+    yearly    = mw.parseMWPage(recordedPage('mw_IncomeStatement.html'))
+    quarterly = mw.parseMWPage(recordedPage('mw_IncomeStatementQuarter.html'), convert=False)
+    frames    = companies.toFundamentalFrames({'IncomeStatement': yearly, 'IncomeStatementQuarter': quarterly})
+
+    frame = frames['IncomeStatement']
+    assert frame.toList() == yearly
+    assert frame.extract('EPS (Diluted)') == mw.extractYearlyData(yearly)
+    assert str(frame.dates[0]) == '2015-09-30'
+    assert np.isnan(frame.rows(['EPS (Diluted)', 'missing'])[1]).all()
+    assert frame.row('missing') is None
+
+    frame = frames['IncomeStatementQuarter']
+    legacy = mw.extractQuarterlyData(quarterly)
+    assert [d for d, v in frame.extract('EPS (Diluted)')] == [d for d, v in legacy]
+    assert frame.row('EPS (Diluted)').tolist() == [0.55, 0.76, 1.25, 0.64, 0.65]
+
+    # Numbers whose repr uses an exponent are taken as they are
+    frame = companies.FundamentalFrame.fromList([['Fiscal year is January-December.', '2018', '2019'],
+                ['EPS (Diluted)', 0.00005, 2.0], ['Sales/Revenue', 2.5e16, '(1.5M)']])
+    assert frame.values.tolist() == [[5e-05, 2.0], [2.5e16, -1.5e6]]
+    assert frame.text == {}
+    return
+
+def test_convertNumbersMW():
+
+    cells = [['1,234.5', '(12.3B)', '-', '5%'], ['12K', '3T', '(0.2)', 'N/A'], ['.5', '1.2.3', '', '1234567890123456789.25']]
+    values, failed = mw.convertNumbersMW(cells)
+
+    assert values.shape == (3, 4)
+    assert failed.tolist() == [[False]*4, [False, False, False, True], [False, True, True, False]]
+    for cell, value, fail in zip(sum(cells, []), values.ravel(), failed.ravel()):
+        if fail:
+            assert np.isnan(value)
+        else:
+            assert value == mw.convertNumberMW(cell)
+
+    # Random strings of the characters of numbers (and of some that are not)
+    # give the same numbers as the scalar function
+    random   = np.random.default_rng(1)
+    alphabet = list('0123456789'*3 + ',.()-+TBMK% e_E') + ['inf', 'nan', 'x']
+    strings  = [''.join(random.choice(alphabet, random.integers(0, 9))) for _ in range(20000)]
+    values, failed = mw.convertNumbersMW(strings)
+    for cell, value, fail in zip(strings, values, failed):
+        scalar = mw.convertNumberMW(cell)
+        if isinstance(scalar, str):
+            assert fail and np.isnan(value)
+        else:
+            assert (not fail) and ((value == scalar) or (np.isnan(value) and np.isnan(scalar)))
+            assert np.signbit(value) == np.signbit(scalar)
+    return
+
+def test_PriceStore(recordedServer, tmp_path, monkeypatch):
+
+    from datetime import datetime as dt
+    from financeMacroFactors.companies import yahooData, priceStore
+
+    monkeypatch.setattr(yahooData, 'yahooBaseURL', recordedServer.baseURL)
+
+    store = companies.PriceStore(str(tmp_path))
+    assert store.highWaterMark('aapl') is None
+    assert store.sync('aapl', startDate=dt(2019, 1, 1), endDate=dt(2020, 8, 2)) == 12
+    assert store.highWaterMark('aapl') == dt(2020, 8, 1)
+    assert 'interval=1d' in recordedServer.requests[0]
+
+    # Only the dates from the high-water mark onwards are requested, and the
+    # last stored day is refreshed rather than duplicated
+    assert store.sync('aapl', endDate=dt(2020, 8, 3)) == 1
+    assert f'period1={int(dt(2020, 8, 1).timestamp())}' in recordedServer.requests[1]
+    assert len(store.load('aapl')) == 12
+
+    daily = yahooData.getStockDataYahoo('aapl', dt(2019, 1, 1), dt(2020, 8, 2), frequency='1d')
+    assert store.getStockData('aapl', frequency='1d') == daily
+
+    records = store.load('aapl')
+    monthly = priceStore.resample(records[-3:].repeat(2), '1mo')
+    assert len(monthly) == 3
+    assert monthly['volume'].tolist() == (2*records['volume'][-3:]).tolist()
+
+    weekly = store.getStockData('aapl', frequency='1wk', convert=False)
+    assert weekly[1][0] == '27 Jul 2020'
+    return
+
+def test_PriceArchive(tmp_path):
+
+    from datetime import datetime as dt
+    from conftest import recordedPage
+    from financeMacroFactors.companies import yahooData, priceStore
+
+    monthMaps = dict(zip(priceStore.monthNames, range(1, 13)))
+    prices    = yahooData.parseStockDataYahoo(recordedPage('yahoo_history.html'), True, monthMaps)
+    records   = priceStore.toRecords(prices)
+
+    nRows = companies.writePriceArchive(str(tmp_path), [('aapl', prices), ('empty', records[:0]), ('msft', records[::2])])
+    assert nRows == 12 + 6
+
+    archive = companies.PriceArchive(str(tmp_path))
+    assert archive.tickers == ['aapl', 'empty', 'msft']
+
+    aapl = archive.slice('aapl')
+    assert aapl['close'].tolist() == records['close'].tolist()
+    assert aapl['volume'].dtype == np.int64
+    assert np.shares_memory(aapl['close'], archive.fields['close'])
+
+    part = archive.slice('msft', dt(2020, 1, 1), dt(2020, 5, 1), fields=['date', 'open'])
+    assert [str(d) for d in part['date']] == ['2020-01-01', '2020-03-01', '2020-05-01']
+    assert len(archive.slice('empty')['close']) == 0
+    assert len(archive.slice('aapl', dt(2030, 1, 1))['close']) == 0
+    return
+
+def test_ParserPool(recordedServer):
+
+    from conftest import recordedPage
+    from financeMacroFactors.companies import yahooData
+    from financeMacroFactors.companies.parsePool import ParserPool
+
+    mwPages = ['mw_IncomeStatement.html', 'mw_IncomeStatementQuarter.html', 'mw_BalanceSheet.html',
+               'mw_CashFlow.html', 'mw_CashFlowQuarter.html']
+
+    with ParserPool(2) as pool:
+        for name in mwPages:
+            page = recordedPage(name)
+            assert pool.parse('marketwatch', page) == mw.parseMWPage(page)
+            assert pool.parse('marketwatch', page, convert=False) == mw.parseMWPage(page, convert=False)
+
+        page = recordedPage('yahoo_history.html')
+        for convert in [True, False]:
+            assert pool.parse('yahoo', page, convert) == \
+                yahooData.parseStockDataYahoo(page, convert, mw.miniMonthMaps)
+
+        assert pool.map('marketwatch', [b'', b'<html></html>']) == [[], []]
+
+    threads   = companies.getTickersFundamentalDataMW(['aapl', 'msft'], baseURL=recordedServer.baseURL)
+    processes = companies.getTickersFundamentalDataMW(['aapl', 'msft'], baseURL=recordedServer.baseURL,
+                    parseProcesses=2)
+    assert processes == threads
+    return
+
+def test_ScreeningIndex():
+
+    from conftest import recordedPage, calendarYear
+
+    statements = ['IncomeStatement', 'BalanceSheet', 'CashFlow', 'IncomeStatementQuarter']
+    data = {s: mw.parseMWPage(recordedPage(f'mw_{s}.html')) for s in statements}
+
+    # Three companies whose EPS differ by a constant factor, and one that is refreshed
+    def scaled(factor):
+        result = {s: [row[:] for row in info] for s, info in data.items()}
+        for row in result['IncomeStatement']:
+            if row[0] == 'EPS (Diluted)':
+                row[1:] = [v * factor for v in row[1:]]
+        return result
+
+    index = companies.ScreeningIndex.build({'A': scaled(1), 'B': scaled(2), 'C': scaled(3)})
+    assert index.periods == ['2015', '2016', '2017', '2018', '2019']
+    assert np.array_equal(index.matrix('EPS (Diluted)')[1], 2 * np.array([2.30, 2.08, 2.30, 2.98, 2.97]))
+
+    growth = index.cagr('EPS (Diluted)', years=4)
+    assert np.allclose(growth, (2.97 / 2.30)**(1/4) - 1)
+
+    latest = index.latest('EPS (Diluted)')
+    assert index.select(latest > 5) == ['B', 'C']
+    assert index.topK(latest, 2) == [('C', latest[2]), ('B', latest[1])]
+    assert index.topK(latest, 5, largest=False)[0][0] == 'A'
+    assert np.allclose(index.percentiles(latest, [0, 50, 100]), [2.97, 5.94, 8.91])
+    assert np.allclose(index.percentileRanks(latest), [0, 50, 100])
+
+    # refreshing a ticker rewrites its row, and removing it leaves it out of queries
+    index.update('A', scaled(10))
+    assert index.topK(index.latest('EPS (Diluted)'), 1)[0][0] == 'A'
+    index.remove('C')
+    assert 'C' not in index and len(index) == 2
+    assert index.select(index.latest('EPS (Diluted)') > 0) == ['A', 'B']
+
+    # Companies whose fiscal years are calendar years are compared over the same years
+    calendar = dict(scaled(2), IncomeStatement=calendarYear(scaled(2)['IncomeStatement']))
+    mixed    = companies.ScreeningIndex.build({'A': scaled(1), 'D': calendar})
+    assert mixed.periods == ['2015', '2016', '2017', '2018', '2019']
+    assert np.array_equal(mixed.matrix('EPS (Diluted)')[1], 2 * mixed.matrix('EPS (Diluted)')[0])
+    assert np.allclose(mixed.percentileRanks(mixed.latest('EPS (Diluted)')), [0, 100])
+
+    quarterly = companies.ScreeningIndex.build({'A': data}, period='quarter')
+    assert quarterly.periods == ['2019Q2', '2019Q3', '2019Q4', '2020Q1', '2020Q2']
+    assert np.allclose(quarterly.matrix('EPS (Diluted)'), [[0.55, 0.76, 1.25, 0.64, 0.65]])
+    return
+
+def test_asyncData(recordedServer, monkeypatch):
+
+    pytest.importorskip('aiohttp')
+
+    import asyncio
+    from datetime import datetime as dt
+    from financeMacroFactors.companies import yahooData, companyLists, asyncData
+
+    monkeypatch.setattr(yahooData, 'yahooBaseURL', recordedServer.baseURL)
+    monkeypatch.setattr(companyLists, 'snp500URL', recordedServer.baseURL + '/wiki/List_of_S%26P_500_companies')
+
+    recordedServer.delay = 0.02
+    recordedServer.failures['/investing/stock/msft/financials/cash-flow'] = 2
+
+    async def run():
+        try:
+            progress = []
+            results  = await companies.getTickersFundamentalDataMWAsync(
+                ['aapl', 'msft', 'aapl'], perHostLimit=3, backoff=0.01,
+                progress=lambda *p: progress.append(p), baseURL=recordedServer.baseURL)
+            assert [p[1] for p in progress] == [1, 2]
+
+            url    = recordedServer.baseURL + '/investing/stock/aapl/financials'
+            single = await asyncData.getDataFromMWURLAsync(url)
+            prices = await companies.getStockDataYahooAsync('aapl', dt(2020, 1, 1), dt(2020, 8, 1))
+            snp    = await companies.getSNP500CompanyListAsync()
+
+            # Failures are returned as empty results, and cancelling stops the downloads
+            missing = await asyncData.getDataFromMWURLAsync(recordedServer.baseURL + '/missing')
+            with pytest.raises(companies.FetchError):
+                await asyncData.getDataFromMWURLAsync(recordedServer.baseURL + '/missing', raiseErrors=True)
+            recordedServer.truncations['/investing/stock/aapl/financials'] = 10
+            with pytest.raises(companies.FetchError) as truncated:
+                await asyncData.getDataFromMWURLAsync(url, raiseErrors=True)
+            assert truncated.value.transient and truncated.value.result.attempts == 4
+            recordedServer.truncations.clear()
+            recordedServer.delay = 1
+            task = asyncio.ensure_future(asyncData.getDataFromMWURLAsync(url))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            recordedServer.delay = 0
+            return results, single, prices, snp, missing
+        finally:
+            await asyncData.closeAsyncSession()
+
+    results, single, prices, snp, missing = asyncio.run(run())
+
+    assert recordedServer.maxActive <= 3
+    assert results == companies.getTickersFundamentalDataMW(['aapl', 'msft'], baseURL=recordedServer.baseURL)
+    assert single == mw.getDataFromMWURL(recordedServer.baseURL + '/investing/stock/aapl/financials')
+    assert prices == companies.getStockDataYahoo('aapl', dt(2020, 1, 1), dt(2020, 8, 1))
+    assert snp == companies.getSNP500CompanyList()
+    assert len(snp) > 0 and len(prices) > 1
+    assert missing == []
+    return
+
+def test_scheduler(recordedServer, monkeypatch):
+
+    import time
+    from financeMacroFactors.companies import scheduler
+    from financeMacroFactors.companies.httpFetcher import fetchURL, getSession
+
+    schedule = scheduler.RequestScheduler(rate=50, burst=1, concurrency=4, maxBackoff=0.5)
+    monkeypatch.setattr(scheduler, 'activeScheduler', schedule)
+
+    url     = recordedServer.baseURL + '/investing/stock/aapl/financials'
+    session = getSession()
+    host    = recordedServer.baseURL.split('//')[1]
+
+    # The token bucket spaces the requests out
+    start = time.perf_counter()
+    for _ in range(6):
+        assert schedule.fetch(url, session).ok
+    assert time.perf_counter() - start >= 0.09
+    assert schedule.stats()[host]['concurrency'] == 5
+
+    # Throttling halves the concurrency, and Retry-After is waited for
+    recordedServer.failureStatus = 429
+    recordedServer.retryAfter    = 0.2
+    recordedServer.failures['/investing/stock/aapl/financials'] = 2
+    start  = time.perf_counter()
+    result = schedule.fetch(url, session, backoff=0.01)
+    assert result.ok and (result.attempts == 3) and (result.status == 200)
+    assert time.perf_counter() - start >= 0.4
+    assert schedule.stats()[host]['throttled'] == 2
+    assert schedule.stats()[host]['concurrency'] < 5
+
+    # Failures that do not go away are transient, and missing pages are permanent
+    recordedServer.retryAfter = None
+    recordedServer.failures['/investing/stock/aapl/financials'] = 10
+    result = schedule.fetch(url, session, retries=2, backoff=0.01)
+    assert (not result.ok) and result.transient and (result.attempts == 3) and (result.status == 429)
+
+    result = schedule.fetch(recordedServer.baseURL + '/missing', session, backoff=0.01)
+    assert (not result.ok) and (not result.transient) and (result.attempts == 1) and (result.status == 404)
+
+    with pytest.raises(scheduler.FetchError) as error:
+        fetchURL(recordedServer.baseURL + '/missing')
+    assert not error.value.transient
+    assert mw.getDataFromMWURL(recordedServer.baseURL + '/missing') == []
+
+    # The delays between attempts grow exponentially, with jitter
+    delays = [schedule.retryDelay(a, 0.1) for a in range(3) for _ in range(20)]
+    assert all(0.05 <= d <= 0.1 for d in delays[:20]) and all(0.2 <= d <= 0.4 for d in delays[40:])
+    assert len(set(delays)) == 60
+    assert schedule.retryDelay(10, 1) == 0.5
+
+    # Coroutines wait for the slots of a host without blocking the event loop,
+    # and are woken up when a thread frees a slot
+    import asyncio, threading
+    state = scheduler.RequestScheduler(concurrency=1).host(url)
+    state.enter()
+
+    async def waitForSlot():
+        ticks  = []
+        async def tick():
+            while True:
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.005)
+        ticker = asyncio.ensure_future(tick())
+        threading.Timer(0.1, state.leave).start()
+        await asyncio.wait_for(state.enterAsync(), timeout=5)
+        ticker.cancel()
+        return ticks
+
+    assert len(asyncio.run(waitForSlot())) > 5
+    assert state.inFlight == 1 and state.waiters == []
+    return
+
+def test_extractFields():
+
+    from datetime import datetime as dt
+    from conftest import recordedPage, calendarYear
+    from financeMacroFactors import valuation
+
+    pages = {statement: mw.parseMWPage(recordedPage(f'mw_{statement}.html'))
+             for statement in ['IncomeStatement', 'CashFlow', 'BalanceSheet', 'IncomeStatementQuarter']}
+    short = dict(pages, IncomeStatement=[row[:1] + row[3:] for row in pages['IncomeStatement']])
+
+    fields  = ['EPS (Diluted)', 'Free Cash Flow', ('IncomeStatement', 'Diluted Shares Outstanding'), 'missing']
+    result  = companies.extractFields({'aapl': pages, 'short': short}, fields, tickers=['aapl', 'none', 'short'])
+
+    assert result['tickers'] == ['aapl', 'none', 'short']
+    assert result['periods'] == ['2015', '2016', '2017', '2018', '2019']
+    values = result['values']
+    for field, statement in [('EPS (Diluted)', 'IncomeStatement'), ('Free Cash Flow', 'CashFlow')]:
+        assert values[field][0].tolist() == [v for _, v in mw.extractYearlyData(pages[statement], field)]
+    assert values['EPS (Diluted)'][2].tolist()[2:] == values['EPS (Diluted)'][0].tolist()[2:]
+    assert np.isnan(values['EPS (Diluted)'][2, :2]).all() and not np.isnan(values['Free Cash Flow'][2]).any()
+    assert np.isnan(values['missing']).all() and np.isnan(values['Free Cash Flow'][1]).all()
+    assert not result['mask'].any()
+
+    # The arrays go straight into the batch valuations
+    result = companies.extractFields({'aapl': pages, 'short': short}, fields[:3])
+    assert result['mask'].sum(axis=1).tolist() == [5, 3]
+    fcf, shares = values['Free Cash Flow'][[0, 2]], values[fields[2]][[0, 2]]
+    assert valuation.discountedCashFlowBatch(fcf, shares, mask=result['mask'])[0] == \
+           valuation.discountedCashFlow(fcf[0], shares[0])
+
+    # A fiscal year from January to December is in the column of the same year
+    calendar = dict(pages, IncomeStatement=calendarYear(pages['IncomeStatement']))
+    result   = companies.extractFields({'aapl': pages, 'calendar': calendar}, ['EPS (Diluted)'])
+    assert result['periods'] == ['2015', '2016', '2017', '2018', '2019']
+    assert np.array_equal(result['values']['EPS (Diluted)'][0], result['values']['EPS (Diluted)'][1])
+    assert result['dates'][1].tolist() == [dt(y, 12, 31).date() for y in range(2015, 2020)]
+
+    quarterly = companies.extractFields({'aapl': pages}, ['EPS (Diluted)'], period='quarter')
+    assert quarterly['periods'] == ['2019Q2', '2019Q3', '2019Q4', '2020Q1', '2020Q2']
+    assert quarterly['values']['EPS (Diluted)'][0].tolist() == [0.55, 0.76, 1.25, 0.64, 0.65]
+    assert companies.extractFields({}, ['EPS (Diluted)'], period='week') is None
+    return
+
+def test_FundamentalStore(tmp_path):
+
+    from datetime import datetime as dt
+    from conftest import recordedPage
+
+    pages = {statement: mw.parseMWPage(recordedPage(f'mw_{statement}.html'))
+             for statement in ['IncomeStatement', 'CashFlow']}
+    # The first download does not have 2019 yet, and 2018 was later restated
+    first   = {'IncomeStatement': [row[:-1] for row in pages['IncomeStatement']]}
+    revised = dict(pages, IncomeStatement=[row[:4] + [3.0] + row[5:] if row[0] == 'EPS (Diluted)' else row
+                                           for row in pages['IncomeStatement']])
+
+    store = companies.FundamentalStore(str(tmp_path / 'pit' / 'fundamentals.sqlite'))
+    added = store.record('aapl', first, dt(2019, 1, 1))
+    assert added == len(store.observations(first)) > 0
+    # Only the new year, the restated value and the new statement are stored
+    assert store.record('aapl', revised, dt(2020, 1, 1)) == len(store.observations(revised)) - added + 1
+    assert store.record('aapl', revised, dt(2020, 6, 1)) == 0
+    assert store.fetchTimes('aapl') == [dt(2019, 1, 1), dt(2020, 1, 1), dt(2020, 6, 1)]
+
+    eps = 'EPS (Diluted)'
+    assert store.asOf('aapl', eps, dt(2018, 12, 31)) == {}
+    assert store.asOf('aapl', eps, dt(2019, 6, 1)) == {'2015': 2.3, '2016': 2.08, '2017': 2.3, '2018': 2.98}
+    assert store.asOf('aapl', eps, dt(2021, 1, 1)) == {'2015': 2.3, '2016': 2.08, '2017': 2.3, '2018': 3.0, '2019': 2.97}
+    assert store.asOf('aapl', eps, dt(2019, 6, 1), period='2018') == 2.98
+    assert store.asOf('aapl', eps, dt(2019, 6, 1), period='2019') is None
+    assert store.history('aapl', eps, '2018') == [(dt(2019, 1, 1), 2.98), (dt(2020, 1, 1), 3.0)]
+
+    # Reopening the file gives the same data, and the matrices line up with extractFields
+    store  = companies.FundamentalStore(str(tmp_path / 'pit' / 'fundamentals.sqlite'))
+    fields = [eps, 'Free Cash Flow']
+    result = store.asOfFields(['aapl', 'none'], fields, dt(2021, 1, 1))
+    latest = companies.extractFields({'aapl': revised}, fields, tickers=['aapl', 'none'])
+    assert result['periods'] == latest['periods']
+    for field in fields:
+        np.testing.assert_array_equal(result['values'][field], latest['values'][field])
+    np.testing.assert_array_equal(result['mask'], latest['mask'])
+    assert store.asOfFields(['aapl'], fields, dt(2019, 6, 1))['mask'].tolist() == [[False]*4]
+    assert store.tickers() == ['aapl']
+
+    # As-of lookups go through the primary key rather than scanning the table
+    plan = store.connection().execute('''EXPLAIN QUERY PLAN SELECT period, value, MAX(fetched) FROM observations
+                                         WHERE ticker=? AND field=? AND fetched<=? GROUP BY period''',
+                                      ('aapl', eps, 0)).fetchall()
+    assert 'PRIMARY KEY' in ' '.join(row[-1] for row in plan)
+
+    # A download recorded after later ones only changes what was known until the next one
+    statement = lambda value: {'IncomeStatement': [['Fiscal year is January-December.', '2020'], [eps, value]]}
+    store.record('msft', statement(5.0), dt(2021, 1, 1))
+    assert store.record('msft', statement(5.0), dt(2021, 3, 1)) == 0
+    assert store.record('msft', statement(9.0), dt(2021, 2, 1)) == 2
+    assert store.record('msft', statement(7.0), dt(2020, 12, 1)) == 1
+    assert [store.asOf('msft', eps, dt(2021, m, 2), period='2020') for m in [1, 2, 3]] == [5.0, 9.0, 5.0]
+    assert store.asOf('msft', eps, dt(2020, 12, 2), period='2020') == 7.0
+    assert store.history('msft', eps, '2020') == [(dt(2020, 12, 1), 7.0), (dt(2021, 1, 1), 5.0),
+                                                  (dt(2021, 2, 1), 9.0), (dt(2021, 3, 1), 5.0)]
+    return
+
+def test_dateAlignment():
+
+    from datetime import datetime as dt
+    from conftest import recordedPage, calendarYear
+    from financeMacroFactors.companies import yahooData
+
+    source  = ['2020-01-01', '2020-03-01', '2020-06-01']
+    targets = np.array(['2019-12-01', '2020-01-01', '2020-02-15', '2020-05-31', '2020-07-01', 'NaT'], dtype='datetime64[D]')
+    nan     = np.nan
+    expected = {
+        'previous' : [nan, 1, 1, 2, 3, nan],
+        'next'     : [1, 1, 2, 3, nan, nan],
+        'nearest'  : [1, 1, 2, 3, 3, nan],
+        'exact'    : [nan, 1, nan, nan, nan, nan],
+    }
+    for fill, values in expected.items():
+        np.testing.assert_array_equal(companies.alignAsOf(source, [1, 2, 3], targets, fill), values)
+    np.testing.assert_array_equal(companies.alignAsOf(source, [1, 2, 3], targets, tolerance=20), [nan, 1, nan, nan, nan, nan])
+    np.testing.assert_array_equal(companies.alignAsOf(source[::-1], [3, 2, 1], targets, lag=10), [nan, nan, 1, 2, 3, nan])
+    with pytest.raises(ValueError):
+        companies.alignAsOf(source, [1, 2, 3], targets, fill='linear')
+
+    # Many companies at once give what a search of each one on its own gives
+    rng     = np.random.default_rng(1)
+    start   = np.datetime64('2010-01-01')
+    dates   = [start + np.sort(rng.choice(3000, n, replace=False)) for n in [0, 1, 40, 200]]
+    values  = [rng.normal(size=len(d)) for d in dates]
+    targets = start + rng.integers(-100, 3100, (4, 50))
+    for fill in ['previous', 'next', 'nearest']:
+        aligned = companies.alignTickers(dates, values, targets, fill, tolerance=30)
+        for d, v, t, row in zip(dates, values, targets, aligned):
+            for day, value in zip(t, row):
+                distance = (d - day).astype(int)
+                allowed  = {'previous': distance <= 0, 'next': distance >= 0, 'nearest': distance < 10**6}[fill]
+                allowed &= np.abs(distance) <= 30
+                if not allowed.any():
+                    assert np.isnan(value)
+                else:
+                    best = np.flatnonzero(allowed)[np.argmin(np.abs(distance[allowed]))]
+                    assert value == v[best]
+
+    # Prices at the end of the fiscal years and quarters of the statements
+    pages  = {statement: mw.parseMWPage(recordedPage(f'mw_{statement}.html'))
+              for statement in ['IncomeStatement', 'IncomeStatementQuarter']}
+    prices = {'aapl': yahooData.parseStockDataYahoo(recordedPage('yahoo_history.html'), True, mw.miniMonthMaps)}
+    dates, close = companies.seriesFromYahoo(prices['aapl'], 'close')
+    assert dates[0] == np.datetime64('2019-09-01') and close[0] == 136.93
+    assert companies.seriesFromYahoo(prices['aapl'], 'Split') is None
+
+    yearly = companies.alignPrices(companies.extractFields({'aapl': pages}, ['EPS (Diluted)']), prices)
+    assert yearly['dates'][0, -1] == np.datetime64('2019-09-30')
+    assert np.isnan(yearly['price'][0, :-1]).all() and yearly['price'][0, -1] == 136.93
+    assert yearly['mask'].tolist() == [[False]*4 + [True]]
+
+    # A fiscal year from January to December gets the close of its December
+    calendar = {'IncomeStatement': calendarYear(pages['IncomeStatement'])}
+    yearly   = companies.alignPrices(companies.extractFields({'calendar': calendar}, ['EPS (Diluted)']),
+                                     {'calendar': prices['aapl']})
+    assert yearly['dates'][0, -1] == np.datetime64('2019-12-31')
+    assert np.isnan(yearly['price'][0, :-1]).all() and yearly['price'][0, -1] == 110.85
+
+    fields    = companies.extractFields({'aapl': pages, 'none': {}}, ['EPS (Diluted)'], period='quarter')
+    quarterly = companies.alignPrices(fields, prices, column='Adj. close**')
+    eps       = mw.extractQuarterlyData(pages['IncomeStatementQuarter'])
+    assert quarterly['dates'][0].tolist() == [d.date() for d, _ in eps]
+    assert np.isnan(quarterly['price'][1]).all()
+    np.testing.assert_array_equal(quarterly['price'][0], companies.alignAsOf(
+        *companies.seriesFromYahoo(prices['aapl'], 'Adj. close'), [d for d, _ in eps], tolerance=31))
+    assert quarterly['mask'][0].sum() == 4
+    return
+
+def test_dateParsing():
+
+    from datetime import datetime as dt
+    from conftest import recordedPage
+    from financeMacroFactors.companies import dateParsing, yahooData
+
+    strings = ['27-Jun-2020', '1 Aug 2020', ' 31 Dec 1999 ', '29-Feb-2020', '29-Feb-2019', '31 Apr 2020',
+               '', '2020-06-27', '1 Foo 2020', '1-Aug 2020', '123 Aug 2020', 'x1 Aug 2020']
+    parsed  = dateParsing.parseDayMonthYear(strings)
+    assert parsed.dtype == np.dtype('datetime64[D]')
+    assert parsed[:4].tolist() == [dt(2020, 6, 27).date(), dt(2020, 8, 1).date(), dt(1999, 12, 31).date(), dt(2020, 2, 29).date()]
+    assert np.isnat(parsed[4:]).all()
+    # Short lists are parsed one string at a time, and long ones all together
+    assert np.array_equal(dateParsing.parseDayMonthYear(np.array(strings * 20)), np.tile(parsed, 20), equal_nan=True)
+    assert dateParsing.parseDayMonthYear([['1 Jan 2020'], ['2 Jan 2020']]).shape == (2, 1)
+    assert dateParsing.parseDayMonthYear([]).shape == (0,)
+
+    # Every day of many years, in the form of Yahoo! and of Marketwatch
+    days  = np.arange(np.datetime64('1990-01-01'), np.datetime64('2030-01-01'))
+    names = [f'{d.day} {d:%b} {d.year}' for d in dateParsing.toDatetimes(days)]
+    assert np.array_equal(dateParsing.parseDayMonthYear(names), days)
+    assert np.array_equal(dateParsing.parseDayMonthYear([n.replace(' ', '-') for n in names]), days)
+
+    ends = dateParsing.parseFiscalYearEnds('Fiscal year is October-September. All values USD Millions.', ['2018', ' 2019', '', '0'])
+    assert ends.tolist()[:2] == [dt(2018, 9, 30).date(), dt(2019, 9, 30).date()] and np.isnat(ends[2:]).all()
+    ends = dateParsing.parseFiscalYearEnds('Fiscal year is January-December. All values USD Millions.', ['2018', '2019'])
+    assert ends.tolist() == [dt(2018, 12, 31).date(), dt(2019, 12, 31).date()]
+
+    # The conversions of the statements and of the prices
+    page = mw.parseMWPage(recordedPage('mw_IncomeStatement.html'))
+    assert mw.convertToDates(page) == [dt(y, 9, 30) for y in range(2015, 2020)]
+    assert mw.convertToDates([['Fiscal year is Octember.', '2019']]) is None
+    quarters = mw.parseMWPage(recordedPage('mw_IncomeStatementQuarter.html'))
+    assert mw.convertToMonths(quarters)[-1] == dt(2020, 6, 27)
+    assert mw.convertToMonths(quarters, asArray=True).tolist() == [d.date() for d in mw.convertToMonths(quarters)]
+    assert mw.convertToMonths([['', '27-Jun-2020', '', '31 Jun 2020']]) is None
+
+    html   = recordedPage('yahoo_history.html')
+    prices = yahooData.parseStockDataYahoo(html, True)
+    assert prices[1][0] == dt(2020, 8, 1) and type(prices[1][0]) is dt
+    assert [row[0] for row in yahooData.parseStockDataYahoo(html, 'datetime64')[1:]] == \
+           [np.datetime64(row[0], 'D') for row in prices[1:]]
+    assert yahooData.parseStockDataYahoo(html, False)[1][0] == '1 Aug 2020'
+    return
@@ -6,3 +6,132 @@ def test_sayHello():
     assert tP.sayHello('Sankha') == 'Hello Sankha'
     assert tP.sayHello(-1) == 'Hello -1'
     return
+
+def test_instrumentation(recordedServer):
+
+    from financeMacroFactors import instrumentation
+    from financeMacroFactors import valuation
+    from financeMacroFactors.companies import marketWarchData as mw
+
+    # nothing is recorded without a sink
+    assert not instrumentation.enabled()
+    assert instrumentation.stage('parse') is instrumentation.nullStage
+
+    sink = instrumentation.addSink(instrumentation.PrometheusSink())
+    try:
+        info = mw.getDataFromMWURL(recordedServer.baseURL + '/investing/stock/aapl/financials')
+        eps  = mw.extractYearlyData(info)
+        valuation.discountedFutureEarnings([v for _, v in eps])
+    finally:
+        instrumentation.removeSink(sink)
+
+    snapshot = sink.snapshot()
+    host     = recordedServer.baseURL.split('//')[1]
+    for key in [('http', host), ('parse', 'marketwatch'), ('convert', 'marketwatch'),
+                ('extract', 'extractYearlyData'), ('valuation', 'discountedFutureEarnings')]:
+        assert snapshot['stages'][key]['calls'] == 1
+
+    assert snapshot['counters'][('rows', 'marketwatch')] == len(info)
+    assert snapshot['counters'][('bytes', host)] > 0
+    assert ('conversionFailures', 'marketwatch') in snapshot['counters']
+
+    text = sink.render()
+    assert 'financeMacroFactors_stage_calls_total{stage="parse",source="marketwatch"} 1' in text
+    assert f'financeMacroFactors_rows_total{{source="marketwatch"}} {len(info)}' in text
+    assert not instrumentation.enabled()
+    return
+
+def test_pipeline(recordedServer, tmp_path, monkeypatch):
+
+    import csv
+    import json
+    import time
+    import threading
+    import numpy as np
+    from datetime import datetime as dt
+    from financeMacroFactors import pipeline
+    from financeMacroFactors import valuation
+    from financeMacroFactors.companies import marketWarchData as mw
+    from financeMacroFactors.companies import yahooData
+
+    monkeypatch.setattr(mw, 'mwBaseURL', recordedServer.baseURL)
+    monkeypatch.setattr(yahooData, 'yahooBaseURL', recordedServer.baseURL)
+
+    tickers = ['AAPL', 'MSFT', 'IBM']
+    results = list(pipeline.iterUniverse(iter(tickers), endDate=dt(2020, 9, 1), fetchWorkers=2))
+    assert sorted(r['ticker'] for r in results) == sorted(tickers)
+    assert len(recordedServer.requests) == 3 * len(tickers)
+
+    # the recorded annual EPS, and the price at the end of fiscal 2019 (Sep 2019)
+    eps = [2.30, 2.08, 2.30, 2.98, 2.97]
+    for r in results:
+        assert r['error'] is None
+        assert r['fiscalYear'] == 2019
+        assert r['dfe'] == valuation.discountedFutureEarnings(eps)
+        assert r['dcf'] is not None and r['ps'] is not None and r['pe'] is not None
+
+    # a fiscal year from January to December is valued with the close of its December
+    from conftest import recordedPage, calendarYear
+    parsed = {'ticker': 'CAL', 'error': None,
+              'pages': {s: calendarYear(mw.parseMWPage(recordedPage(f'mw_{s}.html'))) for s in pipeline.statements},
+              'prices': yahooData.parseStockDataYahoo(recordedPage('yahoo_history.html'), True, mw.miniMonthMaps)}
+    record = pipeline.valueTicker(parsed)
+    assert record['error'] is None and record['fiscalYear'] == 2019
+    assert record['pe'] == valuation.priceToEarningsRatio(np.array([2.97]), np.array([110.85]))
+
+    # parsing in a pool of processes gives the same results
+    pooled = pipeline.iterUniverse(tickers, endDate=dt(2020, 9, 1), parseProcesses=2)
+    key    = lambda r: r['ticker']
+    assert sorted(pooled, key=key) == sorted(results, key=key)
+
+    count = pipeline.runUniverse(str(tmp_path / 'out.csv'), tickers, endDate=dt(2020, 9, 1))
+    with open(tmp_path / 'out.csv') as f:
+        rows = list(csv.DictReader(f))
+    assert count == len(rows) == len(tickers)
+    assert list(rows[0]) == pipeline.resultFields
+
+    pipeline.main(['-o', str(tmp_path / 'out.jsonl'), '--tickers', 'AAPL', '--quiet'])
+    with open(tmp_path / 'out.jsonl') as f:
+        assert json.loads(f.readline())['ticker'] == 'AAPL'
+
+    # stopping early returns without waiting for the downloads in flight,
+    # which then stop all the stages
+    before  = threading.active_count()
+    results = pipeline.iterUniverse([f'T{i}' for i in range(100)], endDate=dt(2020, 9, 1))
+    next(results)
+    recordedServer.delay = 1
+    start = time.perf_counter()
+    results.close()
+    assert time.perf_counter() - start < 0.5
+    deadline = time.perf_counter() + 10
+    while threading.active_count() > before and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    assert threading.active_count() <= before
+    return
+
+def test_lazyImports():
+
+    import sys
+    import subprocess
+
+    # Every statement runs in a fresh interpreter, with nothing imported yet
+    def loaded(statement):
+        check = f'{statement}; import sys; print(" ".join(m for m in {heavy!r} if m in sys.modules))'
+        run   = subprocess.run([sys.executable, '-c', check], capture_output=True, text=True, check=True)
+        return run.stdout.split()
+
+    heavy = ['aiohttp', 'lxml', 'numpy', 'requests', 'scipy']
+    assert loaded('import financeMacroFactors') == []
+    assert loaded('from financeMacroFactors import instrumentation') == []
+    assert loaded('from financeMacroFactors.valuation import discountedFutureEarnings') == ['numpy']
+    assert loaded('from financeMacroFactors.companies import getSNP500CompanyList') == ['lxml', 'requests']
+
+    import financeMacroFactors
+    from financeMacroFactors import companies, valuation
+    assert financeMacroFactors.valuation is valuation
+    assert companies.getStockDataYahoo is companies.yahooData.getStockDataYahoo
+    assert valuation.discountedCashFlowBatch is valuation.batchValuation.discountedCashFlowBatch
+    assert set(companies.__all__) <= set(dir(companies))
+    with pytest.raises(AttributeError):
+        valuation.missing
+    return
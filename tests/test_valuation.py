@@ -0,0 +1,224 @@
+import pytest
+import numpy as np
+from financeMacroFactors import valuation
+
+def raggedData(nTickers=200, nYears=8, seed=0):
+
+    rng  = np.random.default_rng(seed)
+    data = rng.normal(3, 5, (nTickers, nYears)) * 10**rng.uniform(-2, 2, (nTickers, 1))
+    mask = rng.random((nTickers, nYears)) > 0.2
+    mask[:5] = False   # companies without any data
+    mask[5, :2] = True # a company with too little data
+    mask[5, 2:] = False
+
+    return rng, data, mask
+
+def test_discountedFutureEarningsBatch():
+
+    rng, eps, mask = raggedData()
+    batch = valuation.discountedFutureEarningsBatch(eps, mask, 1.07, 12.0)
+
+    for e, m, b in zip(eps, mask, batch):
+        scalar = valuation.discountedFutureEarnings(e[m], 1.07, 12.0)
+        if scalar is None:
+            assert np.isnan(b)
+        else:
+            assert scalar == b
+
+    # without a mask, all the values are used
+    batch = valuation.discountedFutureEarningsBatch(eps)
+    assert batch[0] == valuation.discountedFutureEarnings(eps[0])
+
+    assert valuation.discountedFutureEarningsBatch(eps, mask[:, :3]) is None
+    return
+
+def test_discountedCashFlowBatch():
+
+    rng, fcf, mask = raggedData(seed=1)
+    shares = rng.uniform(1, 100, fcf.shape)
+    batch  = valuation.discountedCashFlowBatch(fcf, shares, mask)
+
+    for f, s, m, b in zip(fcf, shares, mask, batch):
+        scalar = valuation.discountedCashFlow(f[m], s[m])
+        if scalar is None:
+            assert np.isnan(b)
+        else:
+            assert scalar == b
+    return
+
+def test_ratioBatches():
+
+    rng, eps, mask = raggedData(nYears=13, seed=2)
+    revenue = rng.uniform(10, 1000, eps.shape)
+    shares  = rng.uniform(1, 100, eps.shape)
+    price   = rng.uniform(5, 500, eps.shape)
+
+    psBatch = valuation.priceToSalesRatioBatch(revenue, shares, price, mask)
+    peBatch = valuation.priceToEarningsRatioBatch(eps, price, mask)
+
+    for i, m in enumerate(mask):
+        ps = valuation.priceToSalesRatio(revenue[i][m], shares[i][m], price[i][m])
+        pe = valuation.priceToEarningsRatio(eps[i][m], price[i][m])
+        if ps is None:
+            assert np.isnan(psBatch[i]) and np.isnan(peBatch[i])
+        else:
+            assert ps == psBatch[i]
+            assert pe == peBatch[i]
+    return
+
+def test_scenarioValuation():
+
+    rng, eps, mask = raggedData(seed=3)
+    dFactors, tFactors = valuation.sampleScenarios(200, seed=4)
+
+    # paired scenarios are the scalar valuation for each pair
+    values = valuation.discountedFutureEarningsScenarios(eps, dFactors, tFactors, mask=mask)
+    for e, m, v in zip(eps, mask, values):
+        scalar = valuation.discountedFutureEarnings(e[m], dFactors[7], tFactors[7])
+        if scalar is None:
+            assert np.isnan(v).all()
+        else:
+            assert np.isclose(scalar, v[7], rtol=1e-12)
+
+    # grid percentiles are the same as those of the full grid
+    dGrid, tGrid = np.linspace(1.02, 1.2, 25), np.linspace(5, 15, 17)
+    grid = valuation.discountedFutureEarningsScenarios(eps, dGrid, tGrid, grid=True, mask=mask)
+    assert grid.shape == (len(eps), 25, 17)
+
+    q = [0, 5, 50, 95, 100]
+    percentiles = valuation.discountedFutureEarningsScenarios(
+        eps, dGrid, tGrid, grid=True, percentiles=q, mask=mask)
+    expected = np.percentile(grid.reshape(len(eps), -1), q, axis=1).T
+    assert np.allclose(percentiles, expected, equal_nan=True)
+
+    # a single company
+    fcf, shares = np.array([1.0, 2.0, 3.0, 4.0]), np.ones(4)
+    single = valuation.discountedCashFlowScenarios(fcf, shares, [1.1], [10.0])
+    assert np.isclose(single[0], valuation.discountedCashFlow(fcf, shares))
+    return
+
+def test_extrapolation():
+
+    rng, data, mask = raggedData()
+
+    # The default model is the extrapolation of scipy's interp1d, bit for bit
+    interpolate = pytest.importorskip('scipy.interpolate')
+    for row, valid in zip(data[6:60], mask[6:60]):
+        values   = row[valid]
+        expected = interpolate.interp1d(np.arange(len(values)), values, fill_value='extrapolate')(np.arange(5) + len(values))
+        assert np.array_equal(valuation.extrapolate(values), expected)
+    assert np.array_equal(valuation.extrapolate(data, mask=mask)[6:60],
+                          [valuation.extrapolate(row[valid]) for row, valid in zip(data[6:60], mask[6:60])])
+
+    # A least-squares line and compound growth
+    values = np.arange(1.0, 7.0)**1.5
+    assert np.allclose(valuation.extrapolate(values, 3, 'linearTrend'),
+                       np.polyval(np.polyfit(np.arange(6), values, 1), [6, 7, 8]))
+    assert np.allclose(valuation.extrapolate([2, 3, 4.5], 3, 'cagr'), [6.75, 10.125, 15.1875])
+    for model in ['linearTrend', 'cagr']:
+        batch = valuation.extrapolate(np.abs(data), mask=mask, model=model)
+        assert np.isnan(batch[:5]).all()
+        assert np.allclose(batch[6:], [valuation.extrapolate(np.abs(row[valid]), model=model)
+                                       for row, valid in zip(data[6:], mask[6:])])
+
+    assert np.isnan(valuation.extrapolate([-1, 2, 3], model='cagr')).all()
+    assert np.isnan(valuation.extrapolate([1.0])).all()
+    with pytest.raises(ValueError):
+        valuation.extrapolate([1, 2, 3], model='quadratic')
+
+    # The model is passed through by the valuations
+    eps = [2.30, 2.08, 2.30, 2.98, 2.97]
+    assert valuation.discountedFutureEarnings(eps, model='linearTrend') != valuation.discountedFutureEarnings(eps)
+    assert valuation.discountedFutureEarningsBatch([eps], model='cagr')[0] == \
+           valuation.discountedFutureEarnings(eps, model='cagr')
+    assert valuation.discountedFutureEarnings(eps, model='quadratic') is None
+    return
+
+def test_incrementalValuation():
+
+    rng, eps, mask = raggedData()
+    price  = rng.uniform(5, 500, eps.shape)
+    shares = rng.uniform(1e8, 1e9, eps.shape)
+
+    pe  = valuation.PriceToEarningsValuator(len(eps))
+    ps  = valuation.PriceToSalesValuator(len(eps))
+    dfe = valuation.DiscountedFutureEarningsValuator(len(eps), 1.07, 12.0)
+    dcf = valuation.DiscountedCashFlowValuator(len(eps))
+    for year in range(eps.shape[1]):
+        valid = mask[:, year]
+        pe.update(eps[:, year], price[:, year], rows=valid)
+        ps.update(eps[valid, year], shares[valid, year], price[valid, year], rows=np.flatnonzero(valid))
+        dfe.update(eps[:, year], rows=valid)
+        dcf.update(eps[:, year], shares[:, year], rows=valid)
+
+        # Fewer than eight ratios are summed in the same order as by np.mean
+        history = (slice(None), slice(None, year + 1))
+        check   = np.array_equal if year < 7 else np.allclose
+        assert check(pe.values(), valuation.priceToEarningsRatioBatch(eps[history], price[history], mask[history]), equal_nan=True)
+        assert check(ps.values(), valuation.priceToSalesRatioBatch(eps[history], shares[history], price[history], mask[history]), equal_nan=True)
+        assert np.array_equal(dfe.values(), valuation.discountedFutureEarningsBatch(eps[history], mask[history], 1.07, 12.0), equal_nan=True)
+        assert np.array_equal(dcf.values(), valuation.discountedCashFlowBatch(eps[history], shares[history], mask[history]), equal_nan=True)
+
+    assert np.array_equal(dfe.values(rows=[7, 9]), dfe.values()[[7, 9]], equal_nan=True)
+    assert np.allclose(dfe.slopes()[6:], [row[m][-1] - row[m][-2] for row, m in zip(eps[6:], mask[6:])])
+
+    # A rolling window only averages the ratios of the last few periods
+    rolling = valuation.PriceToEarningsValuator(len(eps), window=3)
+    for _ in range(40):
+        for year in range(eps.shape[1]):
+            rolling.update(eps[:, year], price[:, year], rows=mask[:, year])
+    expected = [valuation.priceToEarningsRatio(e[m][-3:], p[m][-3:]) for e, p, m in zip(eps[6:], price[6:], mask[6:])]
+    assert np.allclose(rolling.values()[6:], expected, rtol=1e-12)
+    assert np.isnan(rolling.values()[:5]).all()
+
+    # An EPS of 0 does not spoil the valuations once it leaves the window
+    rolling = valuation.PriceToEarningsValuator(1, window=3)
+    history = [1, 0, 2, 1, 2, 2, 1]
+    for step, e in enumerate(history):
+        rolling.update([e], [10])
+        if step >= 3:
+            window = np.array(history[step-2:step+1], dtype=float)
+            with np.errstate(divide='ignore'):
+                expected = valuation.priceToEarningsRatio(window, 10*np.ones(3))
+            assert np.allclose(rolling.values(), expected, equal_nan=True)
+
+    with pytest.raises(ValueError):
+        valuation.PriceToSalesValuator(3, window=0)
+    return
+
+def test_valuationSeries():
+
+    rng, eps, mask = raggedData(nTickers=20, nYears=30)
+    eps    = np.where(mask, eps, np.nan)
+    fcf    = np.where(mask, rng.normal(1e9, 3e8, eps.shape), np.nan)
+    shares = rng.uniform(1e8, 1e9, eps.shape)
+    price  = rng.uniform(5, 500, eps.shape)
+
+    series = valuation.valuationSeries(eps, fcf, fcf * 3, shares, price, window=6)
+    assert sorted(series) == ['DCF', 'DFE', 'P/E', 'P/S']
+    assert all(s.shape == eps.shape for s in series.values())
+    assert all(np.isnan(s[:, :5]).all() for s in series.values())
+
+    # Every date is the scalar valuation of the window that ends at it
+    scalar = {
+        'DFE' : lambda w, m: valuation.discountedFutureEarnings(eps[w][m[w]]),
+        'DCF' : lambda w, m: valuation.discountedCashFlow(fcf[w][m[w]], shares[w][m[w]]),
+        'P/S' : lambda w, m: valuation.priceToSalesRatio(3 * fcf[w][m[w]], shares[w][m[w]], price[w][m[w]]),
+        'P/E' : lambda w, m: valuation.priceToEarningsRatio(eps[w][m[w]], price[w][m[w]]),
+    }
+    for name, function in scalar.items():
+        for ticker in [5, 6, 11]:
+            for end in range(5, eps.shape[1]):
+                w = (ticker, slice(end - 5, end + 1))
+                expected = function(w, mask) if mask[w].any() else None
+                if expected is None or (name in ['DFE', 'DCF'] and mask[w].sum() < 3):
+                    assert np.isnan(series[name][ticker, end])
+                else:
+                    assert series[name][ticker, end] == expected
+
+    # A single company gives a 1d-array
+    single = valuation.discountedFutureEarningsSeries(eps[6], window=6)
+    assert np.array_equal(single, series['DFE'][6], equal_nan=True)
+    assert valuation.priceToEarningsRatioSeries(eps[6], price[6, :-1]) is None
+    assert valuation.discountedCashFlowSeries(fcf[6], shares[6], window=100) is None
+    return